@@ -1,9 +1,8 @@
 import os
-from flask import Flask, render_template, redirect, url_for
+from flask import Flask, render_template, redirect, url_for, request
 
-def create_app(test_config=None):
-    # create and configure the app
-    app = Flask(__name__, instance_relative_config=True)
+def configure(app, test_config=None):
+    """Default config + instance/test config. Shared with the ASGI app (asgi.py)."""
     app.config.from_mapping(
         SECRET_KEY='dev',
         DB_NAME='kasir_db',
@@ -11,7 +10,33 @@ def create_app(test_config=None):
         DB_PASS='5432',
         DB_HOST='localhost',
         DB_PORT='5432',
+        DB_POOL_MIN=1,
+        DB_POOL_MAX=10,
+        DB_POOL_TIMEOUT=10.0,      # seconds to wait for a free connection
+        DB_POOL_RECYCLE=3600,      # close connections older than this (seconds)
+        DB_POOL_PRE_PING=True,     # health-check idle connections on checkout
+        DB_POOL_PING_AFTER=5.0,    # ...but only if idle for longer than this
+        CATALOG_CACHE_TTL=300,     # seconds; backstop for product edits a change notification missed
+        PROMOTIONS_CACHE_TTL=60,   # seconds; same, for promotions (pricing.py)
+        CHANGE_NOTIFICATIONS=True, # LISTEN for other processes' writes (changes.py)
+        PRODUCT_SEARCH_LIMIT=20,   # default results per /api/products/search
+        PRODUCT_SEARCH_MAX=100,    # upper bound for ?limit=
+        STREAM_BUFFER_SIZE=100,    # max queued SSE events per terminal before forcing a resync
+        STREAM_HEARTBEAT=15,       # seconds between SSE keep-alive comments
+        STREAM_MAX_CLIENTS=None,   # open /api/stream per process, None = no cap (serve.py derives it from --threads)
+        USER_CACHE_SIZE=256,       # logged-in identities kept in memory
+        USER_CACHE_TTL=60,         # seconds before a cached identity is re-read
+        DASHBOARD_PAGE_SIZE=50,
+        ORDER_BATCH_MAX=5000,      # orders accepted by one /api/orders/batch request
+        ORDER_BATCH_CHUNK=100,     # orders per commit in a batch
+        VOID_BATCH_MAX=2000,       # orders one bulk void may cancel
+        ORDER_ARCHIVE_DIR='archive', # where `flask partitions archive` writes old months
+        SLOW_QUERY_MS=100,         # log queries slower than this
+        N_PLUS_ONE_THRESHOLD=10,   # same statement this many times in one request -> logged as N+1
+        METRICS_TOKEN=None,        # bearer token for Prometheus to scrape /admin/metrics without a session
+        LOG_FILE=None,             # e.g. 'flask_server.log'; slow queries, N+1 warnings and API errors
         UPLOAD_FOLDER='static/uploads',
+        THUMBNAIL_SIZE=(320, 256), # POS tiles are 8rem high; 2x for high-DPI screens
         MAX_CONTENT_LENGTH=16 * 1024 * 1024, # 16MB limit
     )
 
@@ -28,18 +53,49 @@ def create_app(test_config=None):
     except OSError:
         pass
 
+def create_app(test_config=None):
+    # create and configure the app
+    app = Flask(__name__, instance_relative_config=True)
+    configure(app, test_config)
+
     # Initialize DB
     import db
     db.init_app(app)
 
+    import reports
+    reports.init_app(app)
+
+    import partitions
+    partitions.init_app(app)
+
+    import metrics
+    metrics.init_app(app)
+
+    import changes
+    changes.init_app(app)
+
+    import images
+
     # Register Blueprints
     import auth
     app.register_blueprint(auth.bp)
 
-    from routes import api, admin, pos
+    from routes import api, admin, pos, reports as reports_routes
     app.register_blueprint(api.bp)
     app.register_blueprint(admin.bp)
     app.register_blueprint(pos.bp)
+    app.register_blueprint(reports_routes.bp)
+
+    @app.after_request
+    def cache_content_addressed_uploads(response):
+        # Uploaded images are named after their hash, so a given URL never changes
+        if request.endpoint == 'static' and response.status_code in (200, 304) \
+                and images.is_content_addressed(request.view_args.get('filename', '')):
+            response.cache_control.public = True
+            response.cache_control.max_age = 31536000
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        return response
 
     # Temporary Index
     @app.route('/')
@@ -49,5 +105,6 @@ def create_app(test_config=None):
     return app
 
 if __name__ == '__main__':
+    # Development server; for the tills use `python serve.py` (see serve.py)
     app = create_app()
     app.run(debug=True)
@@ -0,0 +1,45 @@
+"""
+ASGI app: the till-facing /api on asyncio (routes/api_async.py).
+
+    hypercorn 'asgi:create_app()' --bind 0.0.0.0:5001
+
+Only /api lives here; login, the POS page and the admin dashboard stay on
+the WSGI app (serve.py). Put both behind one proxy (/api -> this app,
+everything else -> serve.py); they share config and the session cookie.
+Bulk ingest (/api/orders/batch) and promotion admin (/api/promotions)
+are WSGI-only for now.
+
+Admin edits, voids and promotion writes made on the WSGI app (and sales
+made there) reach this process through Postgres LISTEN/NOTIFY: its
+listener thread (changes.py) invalidates `catalog.cache` and
+`pricing.cache` and pushes the stock to the tills streaming from here.
+With CHANGE_NOTIFICATIONS off, only the cache TTLs pick them up and the
+tills here hear nothing.
+"""
+from quart import Quart
+
+from app import configure
+
+
+def create_app(test_config=None):
+    app = Quart(__name__, instance_relative_config=True)
+    configure(app, test_config)
+
+    import db_async
+    db_async.init_app(app)
+
+    from routes import api_async
+    app.register_blueprint(api_async.bp)
+
+    if app.config['CHANGE_NOTIFICATIONS']:
+        import changes
+
+        @app.before_serving
+        async def listen_for_changes():
+            changes.start(app.config)
+
+        @app.after_serving
+        async def stop_listening():
+            changes.stop()
+
+    return app
@@ -1,11 +1,77 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, g
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, g, current_app
 from werkzeug.security import check_password_hash
+from collections import OrderedDict
 import db
 import functools
+import threading
+import time
 
 # Inisialisasi Blueprint
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+# Identity only, never the password hash
+IDENTITY_SQL = """
+    SELECT u.id, u.role_id, u.username, u.full_name, r.name AS role_name
+    FROM users u
+    JOIN roles r ON r.id = u.role_id
+    WHERE u.id = %s
+"""
+
+class IdentityCache:
+    """
+    Small LRU of logged-in users keyed by user id, with a TTL.
+
+    Lets `load_logged_in_user` (which runs before *every* request) and the
+    role decorators work without a users query per request. Entries expire
+    after `ttl` seconds, so role changes or deleted accounts take effect
+    quickly even when made outside this process; call `invalidate_user()`
+    after changing a user from inside the app.
+    """
+
+    def __init__(self, maxsize=256, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (expires_at, user)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+def get_identity_cache():
+    cache = current_app.extensions.get('identity_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault('identity_cache', IdentityCache(
+            maxsize=current_app.config['USER_CACHE_SIZE'],
+            ttl=current_app.config['USER_CACHE_TTL'],
+        ))
+    return cache
+
+def invalidate_user(user_id=None):
+    """Drop a cached identity (or all of them) after the user was changed."""
+    get_identity_cache().invalidate(user_id)
+
 @bp.route('/login', methods=('GET', 'POST'))
 def login():
     if request.method == 'POST':
@@ -27,6 +93,7 @@ def login():
             if error is None:
                 # Login Berhasil -> Simpan Sesi
                 session.clear()
+                invalidate_user(user['id']) # Load fresh identity on the next request
                 session['user_id'] = user['id']
                 session['role_id'] = user['role_id']
 
@@ -60,14 +127,23 @@ def logout():
 
 @bp.before_app_request
 def load_logged_in_user():
-    """Cek apakah user sedang login di setiap request."""
+    """Cek apakah user sedang login di setiap request (dari cache kalau ada)."""
     user_id = session.get('user_id')
 
     if user_id is None:
         g.user = None
-    else:
+        return
+
+    cache = get_identity_cache()
+    user = cache.get(user_id)
+    if user is None:
         database = db.get_db()
         # Gunakan cursor context manager agar tidak error di Postgres
         with database.cursor() as cur:
-            cur.execute('SELECT * FROM users WHERE id = %s', (user_id,))
-            g.user = cur.fetchone()
\ No newline at end of file
+            cur.execute(IDENTITY_SQL, (user_id,))
+            user = cur.fetchone()
+        if user is not None:
+            user = dict(user)
+            cache.put(user_id, user)
+
+    g.user = user
@@ -0,0 +1,218 @@
+"""
+HTTP load benchmark: Werkzeug dev server vs. serve.py (waitress).
+
+Starts each server in a subprocess, then drives it with `--clients`
+concurrent keep-alive clients (each logged in as the cashier):
+
+* products: GET /api/products (the POS catalog)
+* orders:   POST /api/orders (checkout of one unmanaged product)
+
+and prints p50/p95/p99 latency and throughput per server and scenario.
+
+    python -m benchmarks.bench_http --servers dev,waitress --workers 2 --threads 16 --clients 32
+"""
+import argparse
+import http.client
+import json
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+from benchmarks.common import Timer, make_app, make_parser, summarize
+
+SCENARIOS = ('products', 'orders')
+
+
+def serve_main(args):
+    """Server side (runs in the subprocess)."""
+    app = make_app(args, pool_max=args.threads + 2)
+    if args.serve == 'dev':
+        # What app.py / the old run_gui.py used
+        app.run(host='127.0.0.1', port=args.port, threaded=True, use_reloader=False)
+    else:
+        import serve
+        serve.serve(app, '127.0.0.1', args.port, workers=args.workers, threads=args.threads)
+
+
+def start_server(args, kind):
+    cmd = [sys.executable, '-m', 'benchmarks.bench_http', '--serve', kind, '--port', str(args.port),
+           '--workers', str(args.workers), '--threads', str(args.threads),
+           '--db-name', args.db_name, '--db-user', args.db_user, '--db-pass', args.db_pass,
+           '--db-host', args.db_host, '--db-port', args.db_port]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', args.port), timeout=0.5).close()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                raise SystemExit(f"{kind} server exited with status {proc.returncode}")
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit(f"{kind} server did not start listening on port {args.port}")
+
+
+def stop_server(proc):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=40)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+class Client:
+    """One till: a keep-alive connection plus a session cookie."""
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = None
+        self.cookie = ''
+        self.reconnects = 0
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {}, Cookie=self.cookie)
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.close()
+                return response, data
+            except (http.client.HTTPException, ConnectionError, BrokenPipeError):
+                # Server closed the idle connection; reconnect once
+                self.close()
+                self.reconnects += 1
+                if attempt == 2:
+                    raise
+
+    def login(self, username='cashier', password='cashier123'):
+        body = urllib.parse.urlencode({'username': username, 'password': password})
+        response, _ = self.request('POST', '/auth/login', body,
+                                   {'Content-Type': 'application/x-www-form-urlencoded'})
+        cookie = response.getheader('Set-Cookie')
+        if response.status != 302 or not cookie:
+            raise SystemExit(f"Login failed (HTTP {response.status}). Did you run init_db.py?")
+        self.cookie = cookie.split(';', 1)[0]
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def run_scenario(args, scenario, product_id):
+    order_body = json.dumps({
+        'cart': [{'product_id': product_id, 'quantity': 1}],
+        'payment_method': 'cash',
+        'amount_received': 10 ** 9,
+    })
+    latencies, errors = [], []
+    lock = threading.Lock()
+    remaining = [args.requests]
+    start = threading.Barrier(args.clients + 1)
+
+    def worker():
+        client = Client(args.port)
+        client.login()
+        times, failed = [], []
+        start.wait()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            try:
+                with Timer() as t:
+                    if scenario == 'products':
+                        response, _ = client.request('GET', '/api/products')
+                        ok = response.status == 200
+                    else:
+                        response, _ = client.request('POST', '/api/orders', order_body,
+                                                     {'Content-Type': 'application/json'})
+                        ok = response.status == 201
+                times.append(t.elapsed)
+                if not ok:
+                    failed.append(response.status)
+            except Exception as e:
+                failed.append(repr(e))
+        client.close()
+        with lock:
+            latencies.extend(times)
+            errors.extend(failed)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.clients)]
+    for t in threads:
+        t.start()
+    with Timer() as total:
+        start.wait()
+        for t in threads:
+            t.join()
+
+    result = summarize(latencies, total.elapsed)
+    result['errors'] = len(errors)
+    if errors:
+        result['first_errors'] = [str(e) for e in errors[:5]]
+    return result
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--servers', default='dev,waitress', help='comma-separated: dev, waitress')
+    parser.add_argument('--workers', type=int, default=2, help='serve.py worker processes')
+    parser.add_argument('--threads', type=int, default=16, help='serve.py threads per worker')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per scenario')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--serve', choices=('dev', 'waitress'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve_main(args)
+        return
+
+    app = make_app(args)
+    import db
+    with app.app_context():
+        conn = db.get_db()
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM categories ORDER BY id LIMIT 1")
+            category_id = cur.fetchone()['id']
+            cur.execute(
+                """INSERT INTO products (category_id, name, price, is_inventory_managed, stock_quantity)
+                   VALUES (%s, 'HTTP Bench Item', 1000, FALSE, 0) RETURNING id""",
+                (category_id,)
+            )
+            product_id = cur.fetchone()['id']
+        conn.commit()
+
+    report = {
+        'clients': args.clients,
+        'requests': args.requests,
+        'waitress': {'workers': args.workers, 'threads': args.threads},
+        'results': {},
+    }
+    for kind in args.servers.split(','):
+        proc = start_server(args, kind)
+        try:
+            report['results'][kind] = {
+                scenario: run_scenario(args, scenario, product_id)
+                for scenario in args.scenarios.split(',')
+            }
+        finally:
+            stop_server(proc)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Transaction code generator benchmark: uniqueness and contention.
+
+N threads, each with its own pooled connection, draw codes from
+`services.next_transaction_codes` as fast as they can (one code per call,
+like /api/orders, or `--per-call` codes at once, like /api/orders/batch).
+Reports latency percentiles and codes/minute, and exits with status 1 if
+any code was handed out twice.
+
+For comparison it also counts how many collisions the old
+`TRX-YYYYMMDD-<4 random hex>` scheme would have produced for the same
+number of codes in one day.
+
+    python -m benchmarks.bench_transaction_codes --threads 16 --codes 20000
+"""
+import json
+import threading
+import uuid
+
+from benchmarks.common import Timer, make_app, make_parser, summarize
+
+
+def legacy_collisions(count):
+    seen = set()
+    collisions = 0
+    for _ in range(count):
+        code = uuid.uuid4().hex[:4].upper()
+        if code in seen:
+            collisions += 1
+        seen.add(code)
+    return collisions
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--codes', type=int, default=20000, help='total codes across all threads')
+    parser.add_argument('--per-call', type=int, default=1, help='codes requested per round trip')
+    args = parser.parse_args()
+
+    app = make_app(args, pool_max=args.threads + 2)
+
+    import db
+    import services
+
+    codes = []
+    latencies = []
+    lock = threading.Lock()
+    remaining = [args.codes]
+    start = threading.Barrier(args.threads + 1)
+
+    def worker():
+        mine, times = [], []
+        with app.app_context():
+            pool = db.get_pool()
+            conn = pool.getconn()
+            try:
+                start.wait()
+                while True:
+                    with lock:
+                        if remaining[0] <= 0:
+                            break
+                        n = min(args.per_call, remaining[0])
+                        remaining[0] -= n
+                    with Timer() as t:
+                        mine.extend(services.next_transaction_codes(conn, n))
+                        conn.commit()
+                    times.append(t.elapsed)
+            finally:
+                pool.putconn(conn)
+        with lock:
+            codes.extend(mine)
+            latencies.extend(times)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    with Timer() as total:
+        start.wait()
+        for t in threads:
+            t.join()
+
+    duplicates = len(codes) - len(set(codes))
+    report = {
+        'threads': args.threads,
+        'per_call': args.per_call,
+        'codes': len(codes),
+        'duplicates': duplicates,
+        'codes_per_minute': round(len(codes) / total.elapsed * 60) if total.elapsed else 0,
+        'latency': summarize(latencies, total.elapsed),
+        'first': min(codes) if codes else None,
+        'last': max(codes) if codes else None,
+        'legacy_4hex_collisions': legacy_collisions(len(codes)),
+    }
+    print(json.dumps(report, indent=2))
+    if duplicates:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
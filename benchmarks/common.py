@@ -0,0 +1,81 @@
+"""
+Shared helpers for the scripts in `benchmarks/`.
+
+Run the scripts from the repository root as modules, e.g.
+`python -m benchmarks.stress_checkout --db-name kasir_bench`.
+They talk to a real PostgreSQL database, so point them at a scratch one.
+"""
+import argparse
+import math
+import time
+
+
+def add_db_arguments(parser):
+    group = parser.add_argument_group('database')
+    group.add_argument('--db-name', default='kasir_db')
+    group.add_argument('--db-user', default='postgres')
+    group.add_argument('--db-pass', default='5432')
+    group.add_argument('--db-host', default='localhost')
+    group.add_argument('--db-port', default='5432')
+    return parser
+
+
+def make_parser(description):
+    return add_db_arguments(argparse.ArgumentParser(description=description))
+
+
+def db_config(args, pool_max=10):
+    return {
+        'DB_NAME': args.db_name,
+        'DB_USER': args.db_user,
+        'DB_PASS': args.db_pass,
+        'DB_HOST': args.db_host,
+        'DB_PORT': args.db_port,
+        'DB_POOL_MAX': pool_max,
+    }
+
+
+def make_app(args, pool_max=10, **overrides):
+    from app import create_app
+
+    config = db_config(args, pool_max)
+    config.update(overrides)
+    return create_app(config)
+
+
+def login(client, username='cashier', password='cashier123'):
+    response = client.post('/auth/login', data={'username': username, 'password': password})
+    if response.status_code != 302:
+        raise SystemExit(f"Login as {username!r} failed (HTTP {response.status_code}). Did you run init_db.py?")
+    return client
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, elapsed):
+    """p50/p95/p99 (milliseconds) and throughput for a list of latencies in seconds."""
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_s': round(len(values) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p95_ms': round(percentile(values, 95) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,211 @@
+"""
+Seed a scratch database with a realistic amount of data for the benchmarks.
+
+Adds `--products` products (a third of them stock-managed), `--cashiers`
+cashier accounts (password `cashier123`) and `--orders` orders spread over
+the last `--days` days, with 1..(2*`--items`-1) lines each. The sales
+rollups are filled in as well. Everything is generated inside Postgres
+(generate_series), `--chunk` orders per transaction, so millions of
+order_items take minutes, not hours.
+
+    python -m benchmarks.seed --db-name kasir_bench --reset --products 5000 --orders 500000
+
+`--reset` recreates the schema first (like init_db.py); without it the
+rows are added to what is already there.
+"""
+import json
+import os
+
+from benchmarks.common import Timer, make_parser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Names are a word pair + number ("Iced Mango 123") so prefix and infix
+# searches have realistic hit rates; SKUs continue after the highest product id.
+PRODUCTS_SQL = """
+    INSERT INTO products (category_id, name, sku, price, is_inventory_managed, stock_quantity)
+    SELECT c.ids[1 + mod(g, array_length(c.ids, 1))],
+           w.first[1 + mod(g, array_length(w.first, 1))] || ' '
+               || w.second[1 + mod(g / array_length(w.first, 1), array_length(w.second, 1))] || ' ' || g,
+           'BENCH-' || (b.base + g),
+           (5 + floor(random() * 60)) * 1000,
+           mod(g, 3) = 0,
+           CASE WHEN mod(g, 3) = 0 THEN 1000000 ELSE 0 END
+    FROM generate_series(1, %(count)s) AS g,
+         (SELECT array_agg(id ORDER BY id) AS ids FROM categories) AS c,
+         (SELECT COALESCE(MAX(id), 0) AS base FROM products) AS b,
+         (SELECT %(first_words)s::text[] AS first, %(second_words)s::text[] AS second) AS w
+"""
+
+FIRST_WORDS = ['Iced', 'Hot', 'Bottled', 'Fresh', 'Sparkling', 'Classic', 'Premium', 'Mini', 'Large', 'Organic']
+SECOND_WORDS = ['Latte', 'Mango', 'Water', 'Croissant', 'Tea', 'Mocha', 'Juice', 'Muffin', 'Soda', 'Cookie',
+                'Espresso', 'Lemonade', 'Bagel', 'Matcha', 'Brownie', 'Chai']
+
+# Monthly partitions (schema.sql) for the whole seeded history
+PARTITIONS_SQL = """SELECT create_order_partitions((date_trunc('day', LOCALTIMESTAMP) - %(days)s * interval '1 day')::timestamp,
+                                                  LOCALTIMESTAMP::timestamp)"""
+
+# Orders land at random moments in the last `days` days (business hours-ish)
+ORDERS_SQL = """
+    INSERT INTO orders (user_id, transaction_code, total_amount, tax_amount, payment_method,
+                        amount_received, change_amount, status, created_at, voided_by, voided_at)
+    SELECT s.user_id,
+           'TRX-' || to_char(s.created_at, 'YYYYMMDD') || '-' || lpad(nextval('transaction_code_seq')::text, 6, '0'),
+           0, 0, s.payment_method, 0, 0,
+           CASE WHEN s.cancelled THEN 'cancelled' ELSE 'paid' END,
+           s.created_at,
+           CASE WHEN s.cancelled THEN %(admin_id)s END,
+           CASE WHEN s.cancelled THEN s.created_at + interval '5 minutes' END
+    FROM (
+        SELECT (%(cashier_ids)s::int[])[1 + floor(random() * %(cashier_count)s)::int] AS user_id,
+               CASE WHEN random() < 0.6 THEN 'cash' ELSE 'qris' END AS payment_method,
+               random() < %(cancel_rate)s AS cancelled,
+               date_trunc('day', now()) - (floor(random() * %(days)s) || ' days')::interval
+                   + interval '7 hours' + (random() * interval '14 hours') AS created_at
+        FROM generate_series(1, %(count)s)
+    ) AS s
+    ORDER BY s.created_at
+    RETURNING id
+"""
+
+ORDER_ITEMS_SQL = """
+    INSERT INTO order_items (order_id, order_created_at, product_id, product_name_snapshot, price_snapshot,
+                             quantity, subtotal)
+    SELECT l.order_id, l.order_created_at, p.id, p.name, p.price, l.quantity, p.price * l.quantity
+    FROM (
+        SELECT o.id AS order_id, o.created_at AS order_created_at,
+               (%(product_ids)s::int[])[1 + floor(random() * %(product_count)s)::int] AS product_id,
+               1 + floor(random() * 3)::int AS quantity
+        FROM orders o,
+             -- `+ o.id * 0` makes the series depend on the row, so random() is drawn per order
+             LATERAL generate_series(1, 1 + floor(random() * (2 * %(items)s - 1))::int + (o.id * 0)) AS n
+        WHERE o.id BETWEEN %(lo)s AND %(hi)s
+    ) AS l
+    JOIN products p ON p.id = l.product_id
+"""
+
+ORDER_TOTALS_SQL = """
+    UPDATE orders o
+    SET total_amount = t.subtotal * 1.1, tax_amount = t.subtotal * 0.1,
+        amount_received = t.subtotal * 1.1, change_amount = 0
+    FROM (SELECT order_id, SUM(subtotal) AS subtotal FROM order_items
+          WHERE order_id BETWEEN %(lo)s AND %(hi)s GROUP BY order_id) AS t
+    WHERE o.id = t.order_id
+"""
+
+
+def connect(args):
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    return psycopg2.connect(dbname=args.db_name, user=args.db_user, password=args.db_pass,
+                            host=args.db_host, port=args.db_port, cursor_factory=RealDictCursor)
+
+
+def reset(conn):
+    import init_db
+    with open(os.path.join(ROOT, 'schema.sql')) as f:
+        schema = f.read()
+    conn.autocommit = True
+    init_db.seed(conn, schema)
+    conn.autocommit = False
+
+
+def seed_cashiers(cur, count):
+    from werkzeug.security import generate_password_hash
+
+    cur.execute("SELECT id FROM roles WHERE name = 'cashier'")
+    role_id = cur.fetchone()['id']
+    password_hash = generate_password_hash('cashier123') # hashed once, shared by every bench cashier
+    cur.execute(
+        """INSERT INTO users (role_id, username, password_hash, full_name)
+           SELECT %s, 'bench_cashier_' || g, %s, 'Bench Cashier ' || g FROM generate_series(1, %s) AS g
+           ON CONFLICT (username) DO NOTHING""",
+        (role_id, password_hash, count)
+    )
+    cur.execute("SELECT id FROM users WHERE role_id = %s ORDER BY id", (role_id,))
+    return [row['id'] for row in cur.fetchall()]
+
+
+def seed(conn, args):
+    import reports
+
+    timings = {}
+    with conn.cursor() as cur:
+        with Timer() as t:
+            cur.execute(PRODUCTS_SQL, {'count': args.products, 'first_words': FIRST_WORDS,
+                                       'second_words': SECOND_WORDS})
+            cashier_ids = seed_cashiers(cur, args.cashiers)
+            cur.execute("SELECT id FROM users WHERE username = 'admin'")
+            admin_id = cur.fetchone()['id']
+            cur.execute("SELECT id FROM products WHERE is_active = TRUE ORDER BY id")
+            product_ids = [row['id'] for row in cur.fetchall()]
+        conn.commit()
+        timings['products_s'] = round(t.elapsed, 2)
+
+        with Timer() as t:
+            cur.execute(PARTITIONS_SQL, {'days': args.days})
+            done = 0
+            while done < args.orders:
+                count = min(args.chunk, args.orders - done)
+                cur.execute(ORDERS_SQL, {
+                    'count': count, 'days': args.days, 'cancel_rate': args.cancel_rate,
+                    'cashier_ids': cashier_ids, 'cashier_count': len(cashier_ids), 'admin_id': admin_id,
+                })
+                ids = [row['id'] for row in cur.fetchall()]
+                bounds = {'lo': min(ids), 'hi': max(ids)}
+                cur.execute(ORDER_ITEMS_SQL, dict(bounds, product_ids=product_ids,
+                                                  product_count=len(product_ids), items=args.items))
+                cur.execute(ORDER_TOTALS_SQL, bounds)
+                where = "o.id BETWEEN %(lo)s AND %(hi)s AND o.status = 'paid'"
+                cur.execute(reports.RECORD_DAILY_SALES_SQL.format(where=where), dict(bounds, sign=1))
+                cur.execute(reports.RECORD_PRODUCT_SALES_SQL.format(where=where), dict(bounds, sign=1))
+                conn.commit()
+                done += count
+                print(f"  {done}/{args.orders} orders", flush=True)
+        timings['orders_s'] = round(t.elapsed, 2)
+
+    with Timer() as t:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE")
+        conn.autocommit = False
+    timings['analyze_s'] = round(t.elapsed, 2)
+    return timings
+
+
+def dataset_counts(conn):
+    """Row counts of the tables the hot paths touch (estimates would be faster, but drift)."""
+    counts = {}
+    with conn.cursor() as cur:
+        for table in ('products', 'users', 'orders', 'order_items', 'daily_sales', 'daily_product_sales'):
+            cur.execute(f"SELECT COUNT(*) AS count FROM {table}")
+            counts[table] = cur.fetchone()['count']
+    conn.rollback()
+    return counts
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--reset', action='store_true', help='recreate the schema and base seed first')
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--cashiers', type=int, default=20)
+    parser.add_argument('--orders', type=int, default=500000)
+    parser.add_argument('--items', type=int, default=4, help='average lines per order')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--cancel-rate', type=float, default=0.02)
+    parser.add_argument('--chunk', type=int, default=50000, help='orders per transaction')
+    args = parser.parse_args()
+
+    conn = connect(args)
+    try:
+        if args.reset:
+            reset(conn)
+        timings = seed(conn, args)
+        report = {'timings': timings, 'counts': dataset_counts(conn)}
+    finally:
+        conn.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
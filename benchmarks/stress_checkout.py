@@ -0,0 +1,121 @@
+"""
+Concurrent checkout stress test: proves `/api/orders` never oversells.
+
+N threads (one logged-in client each) race to buy a managed product whose
+stock is smaller than the number of attempts. Afterwards the number of
+successful orders, the sold quantity in `order_items` and the remaining
+`stock_quantity` must all agree. Exits with status 1 on any oversell.
+
+    python -m benchmarks.stress_checkout --threads 16 --stock 50 --attempts 200
+"""
+import json
+import threading
+
+from benchmarks.common import Timer, login, make_app, make_parser, summarize
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--stock', type=int, default=50)
+    parser.add_argument('--attempts', type=int, default=200, help='total checkout attempts across all threads')
+    parser.add_argument('--quantity', type=int, default=1, help='units bought per attempt')
+    args = parser.parse_args()
+
+    app = make_app(args, pool_max=args.threads + 2)
+
+    import db
+    with app.app_context():
+        conn = db.get_db()
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM categories ORDER BY id LIMIT 1")
+            category_id = cur.fetchone()['id']
+            cur.execute(
+                """INSERT INTO products (category_id, name, price, is_inventory_managed, stock_quantity)
+                   VALUES (%s, 'Stress Test Item', 1000, TRUE, %s) RETURNING id""",
+                (category_id, args.stock)
+            )
+            product_id = cur.fetchone()['id']
+        conn.commit()
+
+    payload = {
+        'cart': [{'product_id': product_id, 'quantity': args.quantity}],
+        'payment_method': 'cash',
+        'amount_received': 10 ** 9,
+    }
+    results = {'ok': 0, 'rejected': 0, 'errors': []}
+    latencies = []
+    lock = threading.Lock()
+    remaining = [args.attempts]
+    start = threading.Barrier(args.threads)
+
+    def worker():
+        client = login(app.test_client())
+        start.wait()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            with Timer() as t:
+                response = client.post('/api/orders', json=payload)
+            with lock:
+                latencies.append(t.elapsed)
+                if response.status_code == 201:
+                    results['ok'] += 1
+                elif 'Insufficient stock' in response.get_json().get('error', ''):
+                    results['rejected'] += 1
+                else:
+                    results['errors'].append(response.get_json())
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    with Timer() as total:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    with app.app_context():
+        conn = db.get_db()
+        with conn.cursor() as cur:
+            cur.execute("SELECT stock_quantity FROM products WHERE id = %s", (product_id,))
+            final_stock = cur.fetchone()['stock_quantity']
+            cur.execute(
+                """SELECT COALESCE(SUM(oi.quantity), 0) AS sold FROM order_items oi
+                   JOIN orders o ON o.id = oi.order_id
+                   WHERE oi.product_id = %s AND o.status = 'paid'""",
+                (product_id,)
+            )
+            sold = cur.fetchone()['sold']
+            # Hide the test item from the POS again
+            cur.execute("UPDATE products SET is_active = FALSE WHERE id = %s", (product_id,))
+        conn.commit()
+
+    expected_sales = min(args.attempts, args.stock // args.quantity)
+    consistent = (
+        results['ok'] == expected_sales
+        and sold == results['ok'] * args.quantity
+        and final_stock == args.stock - sold
+        and final_stock >= 0
+    )
+
+    report = {
+        'product_id': product_id,
+        'threads': args.threads,
+        'initial_stock': args.stock,
+        'attempts': args.attempts,
+        'successful_orders': results['ok'],
+        'rejected_insufficient_stock': results['rejected'],
+        'unexpected_errors': results['errors'][:5],
+        'units_sold': int(sold),
+        'final_stock': final_stock,
+        'oversold': final_stock < 0 or sold > args.stock,
+        'consistent': consistent,
+        'latency': summarize(latencies, total.elapsed),
+    }
+    print(json.dumps(report, indent=2, default=str))
+    raise SystemExit(0 if consistent and not results['errors'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+"""
+Hot-path benchmark suite: checkout, void, catalog, search and dashboard.
+
+Runs every scenario at every `--concurrency` level against a database
+seeded by `benchmarks.seed`, and prints p50/p95/p99 latency and
+throughput as JSON (or writes it to `--output`):
+
+* checkout:  services.process_order, random 1-5 line carts
+* void:      services.void_order on existing paid orders
+* catalog:   GET /api/products (full catalog, cache warm)
+* search:    GET /api/products/search, as-you-type prefixes (1-8 chars) and
+             words from inside names, plus /api/products/barcode lookups
+* dashboard: GET /admin/dashboard, a mix of first page, cashier, status
+             and date-range filters
+
+Requests go through the real app and pool in-process (no HTTP server), so
+the numbers isolate our code and Postgres. To check an optimization:
+
+    python -m benchmarks.seed --db-name kasir_bench --reset
+    python -m benchmarks.suite --db-name kasir_bench --output before.json
+    # ... change the code ...
+    python -m benchmarks.suite --db-name kasir_bench --compare before.json
+
+`--compare` prints the change per scenario and exits with status 1 when a
+p95 got more than `--tolerance` percent worse. Checkout and void change
+the data, so reseed before runs you want to compare exactly.
+"""
+import datetime
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+from urllib.parse import urlencode
+
+from benchmarks.common import Timer, login, make_app, make_parser, summarize
+
+SCENARIOS = ('checkout', 'void', 'catalog', 'search', 'dashboard')
+
+
+class Fixture:
+    """What the scenarios draw from: products, cashiers, voidable orders."""
+
+    def __init__(self, conn, voids_needed):
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, name, sku FROM products WHERE is_active = TRUE ORDER BY id")
+            rows = cur.fetchall()
+            self.product_ids = [row['id'] for row in rows]
+            self.names = [row['name'] for row in rows]
+            self.skus = [row['sku'] for row in rows if row['sku']]
+            cur.execute("SELECT u.id FROM users u JOIN roles r ON r.id = u.role_id WHERE r.name = 'cashier' ORDER BY u.id")
+            self.cashier_ids = [row['id'] for row in cur.fetchall()]
+            cur.execute("SELECT u.id FROM users u JOIN roles r ON r.id = u.role_id WHERE r.name = 'admin' ORDER BY u.id LIMIT 1")
+            admin = cur.fetchone()
+            self.admin_id = admin['id'] if admin else None
+            cur.execute("SELECT id FROM orders WHERE status = 'paid' ORDER BY id DESC LIMIT %s", (voids_needed,))
+            self.voidable = [row['id'] for row in cur.fetchall()]
+            cur.execute("SELECT MIN(created_at)::date AS first, MAX(created_at)::date AS last FROM orders")
+            span = cur.fetchone()
+            self.first_day = span['first'] or datetime.date.today()
+            self.last_day = span['last'] or datetime.date.today()
+        conn.rollback()
+        self._lock = threading.Lock()
+
+    def next_voidable(self):
+        with self._lock:
+            return self.voidable.pop() if self.voidable else None
+
+    def cart(self, rng):
+        lines = rng.randint(1, 5)
+        return [{'product_id': pid, 'quantity': rng.randint(1, 3)}
+                for pid in rng.sample(self.product_ids, min(lines, len(self.product_ids)))]
+
+    def search_path(self, rng):
+        kind = rng.choice(('prefix', 'prefix', 'infix', 'barcode'))
+        if kind == 'barcode' and self.skus:
+            return f"/api/products/barcode/{rng.choice(self.skus)}"
+        words = rng.choice(self.names).split()
+        if kind == 'infix' and len(words) > 1:
+            term = rng.choice(words[1:])[:rng.randint(3, 6)]
+        else:
+            term = ' '.join(words)[:rng.randint(1, 8)]
+        return f"/api/products/search?{urlencode({'q': term})}"
+
+    def dashboard_query(self, rng):
+        kind = rng.choice(('first', 'cashier', 'status', 'range'))
+        if kind == 'cashier' and self.cashier_ids:
+            return f"?cashier={rng.choice(self.cashier_ids)}"
+        if kind == 'status':
+            return "?status=cancelled"
+        if kind == 'range':
+            days = max((self.last_day - self.first_day).days - 7, 0)
+            start = self.first_day + datetime.timedelta(days=rng.randint(0, days))
+            return f"?date_from={start.isoformat()}&date_to={(start + datetime.timedelta(days=7)).isoformat()}"
+        return ""
+
+
+def make_worker(app, scenario, fixture, rng):
+    """A `(step, close)` pair for one thread; `step()` does one timed operation."""
+    import db
+    import services
+
+    if scenario in ('checkout', 'void'):
+        ctx = app.app_context()
+        ctx.push()
+        pool = db.get_pool()
+        conn = pool.getconn()
+
+        def close():
+            pool.putconn(conn)
+            ctx.pop()
+
+        if scenario == 'checkout':
+            def step():
+                code = services.next_transaction_codes(conn)[0]
+                services.process_order(conn, rng.choice(fixture.cashier_ids), code, 'cash', 10 ** 9,
+                                       fixture.cart(rng))
+        else:
+            def step():
+                order_id = fixture.next_voidable()
+                if order_id is None:
+                    raise RuntimeError("Ran out of paid orders to void; seed more orders")
+                services.void_order(conn, order_id, fixture.admin_id)
+        return step, close
+
+    if scenario == 'catalog':
+        client = login(app.test_client())
+
+        def step():
+            response = client.get('/api/products')
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+        return step, lambda: None
+
+    if scenario == 'search':
+        client = login(app.test_client())
+
+        def step():
+            response = client.get(fixture.search_path(rng))
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+        return step, lambda: None
+
+    client = login(app.test_client(), 'admin', 'admin123')
+
+    def step():
+        response = client.get('/admin/dashboard' + fixture.dashboard_query(rng))
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+    return step, lambda: None
+
+
+def run(app, scenario, concurrency, requests, warmup, fixture, seed):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    remaining = [requests]
+    start = threading.Barrier(concurrency + 1)
+
+    def thread_main(index):
+        rng = random.Random(seed * 1000 + index)
+        step, close = make_worker(app, scenario, fixture, rng)
+        times, failed = [], []
+        try:
+            for _ in range(warmup):
+                try:
+                    step()
+                except Exception:
+                    pass
+            start.wait()
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+                try:
+                    with Timer() as t:
+                        step()
+                    times.append(t.elapsed)
+                except Exception as e:
+                    failed.append(str(e))
+        finally:
+            close()
+        with lock:
+            latencies.extend(times)
+            errors.extend(failed)
+
+    threads = [threading.Thread(target=thread_main, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    with Timer() as total:
+        start.wait()
+        for t in threads:
+            t.join()
+
+    result = summarize(latencies, total.elapsed)
+    result['errors'] = len(errors)
+    if errors:
+        result['first_errors'] = errors[:5]
+    return result
+
+
+def metadata(app, args):
+    import db
+    from benchmarks.seed import dataset_counts
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    with app.app_context():
+        conn = db.get_db()
+        with conn.cursor() as cur:
+            cur.execute("SHOW server_version")
+            postgres = cur.fetchone()['server_version']
+        counts = dataset_counts(conn)
+
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'postgres': postgres,
+        'dataset': counts,
+        'requests': args.requests,
+        'warmup': args.warmup,
+        'seed': args.seed,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Per scenario/concurrency change vs. `baseline`; returns the list of p95 regressions."""
+    regressions = []
+    lines = [f"{'scenario':<12}{'conc':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'thrpt':>10}"]
+    for scenario, levels in report['results'].items():
+        for level, result in levels.items():
+            old = baseline.get('results', {}).get(scenario, {}).get(level)
+            if not old:
+                continue
+
+            def change(key):
+                return (result[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+
+            lines.append(f"{scenario:<12}{level:>6}{change('p50_ms'):>+9.1f}%{change('p95_ms'):>+9.1f}%"
+                         f"{change('p99_ms'):>+9.1f}%{change('throughput_per_s'):>+9.1f}%")
+            if change('p95_ms') > tolerance:
+                regressions.append({'scenario': scenario, 'concurrency': int(level),
+                                    'p95_ms': result['p95_ms'], 'baseline_p95_ms': old['p95_ms']})
+    print('\n'.join(lines), file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = make_parser(__doc__)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated thread counts')
+    parser.add_argument('--requests', type=int, default=500, help='timed operations per scenario and level')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed operations per thread first')
+    parser.add_argument('--seed', type=int, default=42, help='random seed (carts, filters)')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='baseline JSON report from an earlier run')
+    parser.add_argument('--tolerance', type=float, default=10.0, help='allowed p95 regression, percent')
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(',')]
+
+    app = make_app(args, pool_max=max(levels) + 2)
+
+    import db
+    voids_needed = (args.requests + max(levels) * args.warmup) * len(levels) if 'void' in scenarios else 0
+    with app.app_context():
+        fixture = Fixture(db.get_db(), voids_needed)
+    if not fixture.product_ids or not fixture.cashier_ids:
+        raise SystemExit("No products or cashiers found. Run `python -m benchmarks.seed --reset` first.")
+
+    report = {'meta': metadata(app, args), 'results': {}}
+    for scenario in scenarios:
+        report['results'][scenario] = {}
+        for level in levels:
+            print(f"{scenario} x {level}...", file=sys.stderr, flush=True)
+            report['results'][scenario][str(level)] = run(
+                app, scenario, level, args.requests, args.warmup, fixture, args.seed
+            )
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        report['comparison'] = {'baseline': args.compare, 'tolerance_pct': args.tolerance,
+                                'regressions': regressions}
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
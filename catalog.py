@@ -0,0 +1,344 @@
+import json
+import os
+import re
+import secrets
+import threading
+import time
+
+# Same query the POS always used, with an optional id filter for partial refreshes
+PRODUCTS_SQL = """
+    SELECT p.id, p.category_id, p.name, p.sku, p.price, p.is_inventory_managed, p.stock_quantity, p.image_url,
+           p.thumbnail_url, p.is_active, c.name as category_name
+    FROM products p
+    JOIN categories c ON p.category_id = c.id
+"""
+
+CATEGORIES_SQL = "SELECT id, name FROM categories ORDER BY id"
+
+# Barcode scanners (GET /api/products/barcode/<sku>), unique index on products.sku
+SKU_SQL = PRODUCTS_SQL + " WHERE p.sku = %s AND p.is_active = TRUE"
+
+# Search-as-you-type (GET /api/products/search). Names starting with the term
+# come first, read in order off idx_products_name_prefix so LIMIT stops early;
+# only if they don't fill the page do we add names with a word starting with
+# each typed word (idx_products_name_words). The latter has no ORDER BY on
+# purpose: sorting makes Postgres walk the whole name index when nothing
+# matches, so the few rows are sorted in Python instead.
+SEARCH_PREFIX_SQL = PRODUCTS_SQL + """
+    WHERE p.is_active = TRUE AND lower(p.name) COLLATE "C" LIKE %(prefix)s
+    ORDER BY lower(p.name) COLLATE "C", p.id
+    LIMIT %(limit)s
+"""
+
+SEARCH_WORDS_SQL = PRODUCTS_SQL + """
+    WHERE p.is_active = TRUE AND to_tsvector('simple', p.name) @@ to_tsquery('simple', %(words)s)
+      AND lower(p.name) COLLATE "C" NOT LIKE %(prefix)s
+    LIMIT %(limit)s
+"""
+
+# A single letter is the start of a word in most of the menu
+MIN_WORD_SEARCH_LENGTH = 2
+
+# Versions are `epoch * VERSION_SPAN + n`. Every cache draws a random epoch,
+# and a forked worker gets a new one (see the bottom of this module), so no
+# two processes ever hand out the same version: a version (ETag, ?since=)
+# from another process is never mistaken for ours and gets the full catalog.
+# Epochs stay below 2**31, so versions are exact JavaScript numbers.
+VERSION_SPAN = 2**22
+
+class CatalogCache:
+    """
+    In-process cache of the POS catalog (GET /api/products).
+
+    Every write path that touches products calls `invalidate()`, which bumps the
+    catalog version. The next reader refreshes only the products that changed
+    (or everything, when we don't know what changed) and re-serializes the JSON
+    body once; every other request is answered straight from memory.
+
+    The cache also remembers at which version each product last changed, so
+    tills can ask for just the changes since the version they already have
+    (`delta()`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()          # guards the bookkeeping below
+        self._refresh_lock = threading.Lock()  # only one thread talks to the DB at a time
+        self._async_refresh_lock = None        # same, for the asyncio app (asgi.py)
+        self._products = {}     # id -> product dict, active products only
+        self._categories = []
+        self._loaded_at = 0.0
+        self._snapshot = None   # (version, body bytes)
+        self._new_epoch()
+
+    def _new_epoch(self):
+        # Also called (under self._lock) when an epoch runs out of versions
+        self._base_version = (secrets.randbelow(2**31 - 1) + 1) * VERSION_SPAN
+        self._version = self._base_version
+        self._dirty_ids = set()
+        self._full_reload = True
+        self._changed_at = {}   # product id -> version of its last change (incl. removals)
+        self._categories_changed_at = self._base_version
+
+    @property
+    def version(self):
+        return self._version
+
+    def invalidate(self, product_ids=None):
+        """Mark products as changed; `None` means reload the whole catalog."""
+        with self._lock:
+            if self._version + 1 >= self._base_version + VERSION_SPAN:
+                self._new_epoch()
+            self._version += 1
+            if product_ids is None:
+                self._full_reload = True
+            else:
+                self._dirty_ids.update(int(pid) for pid in product_ids)
+
+    def _expired(self, max_age):
+        # max_age catches changes made outside this process (psql, another worker)
+        return bool(max_age) and time.monotonic() - self._loaded_at >= max_age
+
+    def _is_fresh(self, max_age):
+        snapshot = self._snapshot
+        return snapshot is not None and snapshot[0] == self._version and not self._expired(max_age)
+
+    def get(self, db_conn, max_age=None):
+        """Return `(version, body)` where body is the ready-to-send JSON bytes."""
+        if self._is_fresh(max_age):
+            return self._snapshot
+
+        with self._refresh_lock:
+            if self._is_fresh(max_age):
+                return self._snapshot
+
+            version, full, dirty = self._begin_refresh(max_age)
+            try:
+                fetched = self._fetch(db_conn, full, dirty)
+            except Exception:
+                self._refresh_failed()
+                raise
+            return self._finish_refresh(version, full, dirty, fetched)
+
+    async def get_async(self, db_conn, max_age=None):
+        """`get()` for an async (psycopg 3) connection, used by the ASGI app."""
+        if self._is_fresh(max_age):
+            return self._snapshot
+
+        if self._async_refresh_lock is None:
+            import asyncio # only the ASGI app gets here; the WSGI app and the desktop till never load asyncio
+            self._async_refresh_lock = asyncio.Lock()
+        async with self._async_refresh_lock:
+            if self._is_fresh(max_age):
+                return self._snapshot
+
+            version, full, dirty = self._begin_refresh(max_age)
+            try:
+                fetched = await self._fetch_async(db_conn, full, dirty)
+            except Exception:
+                self._refresh_failed()
+                raise
+            return self._finish_refresh(version, full, dirty, fetched)
+
+    def delta(self, db_conn, since, max_age=None):
+        """
+        Changes after version `since` as `(version, body)`, or `None` when `since`
+        isn't from this cache's history and the client needs the full catalog.
+        """
+        self.get(db_conn, max_age)
+
+        with self._refresh_lock:
+            return self._delta(since)
+
+    async def delta_async(self, db_conn, since, max_age=None):
+        await self.get_async(db_conn, max_age)
+        # No await between here and the return, so no refresh can interleave
+        return self._delta(since)
+
+    def _delta(self, since):
+        version = self._snapshot[0]
+        # Another process's version, or one of ours from before a new epoch
+        if since < self._base_version or since > version:
+            return None
+        changed = sorted(pid for pid, at in self._changed_at.items() if at > since)
+        payload = {
+            'version': version,
+            'since': since,
+            'products': [self._products[pid] for pid in changed if pid in self._products],
+            'removed': [pid for pid in changed if pid not in self._products],
+        }
+        if self._categories_changed_at > since:
+            payload['categories'] = self._categories
+        return version, _dumps(payload)
+
+    def _begin_refresh(self, max_age):
+        with self._lock:
+            version = self._version
+            full = self._full_reload or self._snapshot is None or self._expired(max_age)
+            dirty = self._dirty_ids
+            self._dirty_ids = set()
+            self._full_reload = False
+        return version, full, dirty
+
+    def _refresh_failed(self):
+        with self._lock:
+            self._full_reload = True
+
+    def _fetch(self, db_conn, full, dirty):
+        """Rows needed for a refresh: `(categories or None, products)`."""
+        with db_conn.cursor() as cur:
+            categories = None
+            if full:
+                cur.execute(CATEGORIES_SQL)
+                categories = cur.fetchall()
+                cur.execute(PRODUCTS_SQL + " WHERE p.is_active = TRUE")
+            elif dirty:
+                cur.execute(PRODUCTS_SQL + " WHERE p.id = ANY(%s)", (sorted(dirty),))
+            else:
+                return None, []
+            return categories, cur.fetchall()
+
+    async def _fetch_async(self, db_conn, full, dirty):
+        async with db_conn.cursor() as cur:
+            categories = None
+            if full:
+                await cur.execute(CATEGORIES_SQL)
+                categories = await cur.fetchall()
+                await cur.execute(PRODUCTS_SQL + " WHERE p.is_active = TRUE")
+            elif dirty:
+                await cur.execute(PRODUCTS_SQL + " WHERE p.id = ANY(%s)", (sorted(dirty),))
+            else:
+                return None, []
+            return categories, await cur.fetchall()
+
+    def _finish_refresh(self, version, full, dirty, fetched):
+        categories, rows = fetched
+        if categories is not None:
+            categories = [{'id': c['id'], 'name': c['name']} for c in categories]
+            if categories != self._categories:
+                self._categories = categories
+                self._categories_changed_at = version
+
+        if full or dirty:
+            candidates = set(self._products) if full else set(dirty)
+            fresh = {p['id']: _serialize(p) for p in rows if p['is_active']}
+            for pid in candidates | set(fresh):
+                old, new = self._products.get(pid), fresh.get(pid)
+                if old == new:
+                    continue
+                # Deleted or deactivated products simply don't come back
+                if new is None:
+                    self._products.pop(pid, None)
+                else:
+                    self._products[pid] = new
+                self._changed_at[pid] = version
+
+        body = _dumps({
+            'version': version,
+            'products': [self._products[pid] for pid in sorted(self._products)],
+            'categories': self._categories,
+        })
+
+        with self._lock:
+            if full:
+                self._loaded_at = time.monotonic()
+            self._snapshot = (version, body)
+        return self._snapshot
+
+def _serialize(p):
+    # Format data untuk JSON
+    return {
+        'id': p['id'],
+        'category_id': p['category_id'],
+        'category_name': p['category_name'],
+        'name': p['name'],
+        'sku': p['sku'],
+        'price': float(p['price']),
+        'is_inventory_managed': bool(p['is_inventory_managed']),
+        'stock_quantity': p['stock_quantity'],
+        'image_url': p['image_url'],
+        'thumbnail_url': p['thumbnail_url']
+    }
+
+def _search_params(term, limit):
+    # LIKE wildcards typed by the user are matched literally
+    needle = term.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    # Only letters/digits reach to_tsquery, so its operators can't be injected
+    words = ' & '.join(f"{word}:*" for word in re.findall(r'[^\W_]+', term.lower()))
+    return {'prefix': needle + '%', 'words': words, 'limit': limit}
+
+def _search_results(rows, limit):
+    seen = set()
+    results = []
+    for row in rows:
+        if row['id'] not in seen:
+            seen.add(row['id'])
+            results.append(_serialize(row))
+    return results[:limit]
+
+def _by_name(rows):
+    return sorted(rows, key=lambda r: (r['name'].lower(), r['id']))
+
+def search(db_conn, term, limit):
+    """
+    Active products for the POS search box, best matches first: an exact SKU,
+    then names starting with `term`, then names with words starting with it.
+    """
+    term = term.strip()
+    if not term:
+        return []
+    params = _search_params(term, limit)
+    with db_conn.cursor() as cur:
+        cur.execute(SKU_SQL, (term,))
+        rows = cur.fetchall()
+        cur.execute(SEARCH_PREFIX_SQL, params)
+        rows += cur.fetchall()
+        if len(rows) < limit and len(term) >= MIN_WORD_SEARCH_LENGTH and params['words']:
+            cur.execute(SEARCH_WORDS_SQL, params)
+            rows += _by_name(cur.fetchall())
+    return _search_results(rows, limit)
+
+async def search_async(db_conn, term, limit):
+    term = term.strip()
+    if not term:
+        return []
+    params = _search_params(term, limit)
+    async with db_conn.cursor() as cur:
+        await cur.execute(SKU_SQL, (term,))
+        rows = await cur.fetchall()
+        await cur.execute(SEARCH_PREFIX_SQL, params)
+        rows += await cur.fetchall()
+        if len(rows) < limit and len(term) >= MIN_WORD_SEARCH_LENGTH and params['words']:
+            await cur.execute(SEARCH_WORDS_SQL, params)
+            rows += _by_name(await cur.fetchall())
+    return _search_results(rows, limit)
+
+def find_by_sku(db_conn, sku):
+    """The active product with barcode/SKU `sku`, or None."""
+    with db_conn.cursor() as cur:
+        cur.execute(SKU_SQL, (sku,))
+        row = cur.fetchone()
+    return _serialize(row) if row else None
+
+async def find_by_sku_async(db_conn, sku):
+    async with db_conn.cursor() as cur:
+        await cur.execute(SKU_SQL, (sku,))
+        row = await cur.fetchone()
+    return _serialize(row) if row else None
+
+def _dumps(payload):
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+# One cache per process; services and routes invalidate it after they commit
+cache = CatalogCache()
+
+def _reset_after_fork():
+    # serve.py forks workers after create_app(): each one starts its own
+    # cache and epoch instead of sharing (and diverging from) the parent's
+    global cache
+    cache = CatalogCache()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def invalidate(product_ids=None):
+    cache.invalidate(product_ids)
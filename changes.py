@@ -0,0 +1,149 @@
+"""
+Cross-process change notifications (Postgres LISTEN/NOTIFY).
+
+Each app process (every serve.py worker, the ASGI app) keeps the catalog and
+the promotions in memory and pushes stock to the tills connected to it. The
+triggers in schema.sql announce every committed write to products,
+categories and promotions on the `coffeepos_changes` channel. One listener
+thread per process hears them, invalidates its caches and pushes the change
+to its own SSE terminals, so a sale on one worker reaches the tills on all
+of them. CATALOG_CACHE_TTL / PROMOTIONS_CACHE_TTL remain as a backstop.
+
+Payloads: `{"origin", "table"}` means anything in that table may have
+changed; products also send `"stock": [[id, qty], ...]` and `"products":
+[id, ...]` (added, removed or edited) when the statement was small enough.
+"""
+import json
+import logging
+import os
+import select
+import threading
+
+import psycopg2
+
+import catalog
+import db
+import events
+import pricing
+
+log = logging.getLogger('coffeepos')
+
+CHANNEL = 'coffeepos_changes'
+PING_INTERVAL = 30.0    # seconds without a notification before checking the connection
+RECONNECT_DELAY = 5.0   # seconds between attempts while the database is down
+
+class Listener(threading.Thread):
+    """Daemon thread holding one dedicated connection that LISTENs on CHANNEL."""
+
+    def __init__(self, connect_kwargs):
+        super().__init__(name='coffeepos-changes', daemon=True)
+        self.connect_kwargs = dict(connect_kwargs)
+        self.connect_kwargs.pop('cursor_factory', None) # no queries worth timing here
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """Ask the thread to exit (noticed within PING_INTERVAL)."""
+        self._stop_event.set()
+
+    def run(self):
+        connected_before = False
+        while not self._stop_event.is_set():
+            try:
+                conn = psycopg2.connect(**{'application_name': db.application_name(), **self.connect_kwargs})
+            except psycopg2.Error as e:
+                log.warning("Change notifications: cannot connect (%s), retrying in %ss", e, RECONNECT_DELAY)
+                self._stop_event.wait(RECONNECT_DELAY)
+                continue
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                if connected_before:
+                    # Whatever was sent while we weren't listening is lost
+                    resync()
+                connected_before = True
+                self._listen(conn)
+            except (psycopg2.Error, OSError) as e:
+                log.warning("Change notifications: connection lost (%s), reconnecting", e)
+            finally:
+                conn.close()
+
+    def _listen(self, conn):
+        while not self._stop_event.is_set():
+            if not select.select([conn], [], [], PING_INTERVAL)[0]:
+                # Quiet for a while: make sure the server is still there
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            conn.poll()
+            while conn.notifies:
+                handle(conn.notifies.pop(0).payload)
+
+def handle(payload):
+    """Apply one notification; a write by this very process is skipped."""
+    try:
+        change = json.loads(payload)
+    except ValueError:
+        log.warning("Change notifications: unreadable payload %r", payload[:200])
+        resync()
+        return
+
+    if change.get('origin') == db.application_name():
+        return # The code that wrote it already invalidated and published
+    table = change.get('table')
+    if table == 'promotions':
+        pricing.invalidate()
+    elif table == 'products' and 'products' in change:
+        stock = change.get('stock', [])
+        catalog.invalidate([pid for pid, _ in stock] + change['products'])
+        if stock:
+            events.broker.publish('stock', {'products': stock})
+        if change['products']:
+            events.broker.publish('catalog', {'products': change['products']})
+    else:
+        # Categories, or a statement too big to list its products
+        catalog.invalidate()
+        events.broker.publish('catalog', {})
+
+def resync():
+    catalog.invalidate()
+    pricing.invalidate()
+    events.broker.publish('resync', {})
+
+_listener = None
+_lock = threading.Lock()
+
+def start(config):
+    """Start this process's listener, once."""
+    global _listener
+    with _lock:
+        if _listener is None:
+            _listener = Listener(db.connect_kwargs_from_config(config))
+            _listener.start()
+    return _listener
+
+def stop():
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def _forget_parent_listener():
+    # serve.py forks workers; the parent's thread doesn't exist in the child
+    global _listener, _lock
+    _listener = None
+    _lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_parent_listener)
+
+def init_app(app):
+    if not app.config['CHANGE_NOTIFICATIONS']:
+        return
+
+    # Started by the first request rather than here: serve.py forks its
+    # workers after create_app(), and a thread doesn't survive the fork.
+    @app.before_request
+    def listen_for_changes():
+        if _listener is None:
+            start(app.config)
@@ -1,24 +1,284 @@
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+import psycopg2.pool
 import click
-from psycopg2.extras import RealDictCursor
+from psycopg2 import extensions
 from flask import current_app, g
+import catalog
+import metrics
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free before the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe PostgreSQL connection pool.
+
+    Connections are reused across requests instead of paying a TCP + auth
+    handshake per click. A connection is health-checked on checkout and
+    recycled when it is broken, left in a failed transaction, or older than
+    `max_lifetime` seconds.
+
+    Fork-safe: a pre-forked worker (see serve.py) never reuses a connection
+    inherited from its parent, it starts with an empty pool of its own.
+    """
+
+    def __init__(self, connect_kwargs, minconn=1, maxconn=10, timeout=10.0,
+                 max_lifetime=3600, pre_ping=True, ping_after=5.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size: need 0 <= minconn <= maxconn and maxconn >= 1")
+
+        self.connect_kwargs = dict(connect_kwargs)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        self.ping_after = ping_after
+
+        self._lock = threading.Condition()  # RLock-backed, so helpers may re-enter it
+        self._idle = []          # stack of idle connections (LIFO keeps hot ones warm)
+        self._born = {}          # id(conn) -> creation timestamp
+        self._returned = {}      # id(conn) -> last time it went back to the pool
+        self._in_use = 0
+        self._closed = False
+        self._pid = os.getpid()
+        self._inherited = []     # parent's connections, never used or closed in a forked child
+        self._stats = {
+            'checkouts': 0,
+            'connects': 0,
+            'recycled': 0,       # retired: broken, dirty, expired or failed a ping
+            'closed': 0,         # closed by closeall() on shutdown
+            'failed_pings': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_seconds': 0.0,
+        }
+
+        for _ in range(minconn):
+            self._idle.append(self._connect())
+
+    def _connect(self):
+        # Named at connect time, so a forked worker's connections carry its own pid
+        conn = psycopg2.connect(**{'application_name': application_name(), **self.connect_kwargs})
+        with self._lock:
+            self._born[id(conn)] = time.monotonic()
+            self._stats['connects'] += 1
+        return conn
+
+    def _discard(self, conn, reason='recycled'):
+        with self._lock:
+            self._born.pop(id(conn), None)
+            self._returned.pop(id(conn), None)
+            self._stats[reason] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, conn):
+        if not self.max_lifetime:
+            return False
+        return time.monotonic() - self._born.get(id(conn), 0) > self.max_lifetime
+
+    def _healthy(self, conn):
+        if conn.closed or self._expired(conn):
+            return False
+        if not self.pre_ping:
+            return True
+        # A connection that was in use a moment ago is almost certainly fine;
+        # only pay the extra round trip when it has been sitting idle.
+        idle_for = time.monotonic() - self._returned.get(id(conn), 0)
+        if idle_for < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            with self._lock:
+                self._stats['failed_pings'] += 1
+            return False
+
+    def _after_fork(self):
+        """
+        Forget every connection inherited from the parent process. They are
+        kept referenced rather than closed: closing (or garbage-collecting) one
+        here would send a Terminate on the socket the parent is still using.
+        """
+        self._inherited.extend(self._idle)
+        self._lock = threading.Condition()  # may have been held by a thread that no longer exists
+        self._idle = []
+        self._born = {}
+        self._returned = {}
+        self._in_use = 0
+        self._pid = os.getpid()
+
+    def getconn(self):
+        """Check out a healthy connection, blocking up to `timeout` seconds."""
+        if self._pid != os.getpid():
+            self._after_fork()
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise psycopg2.pool.PoolError("connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._in_use < self.maxconn:
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                self._stats['waits'] += 1
+                waited = time.monotonic()
+                self._lock.wait(remaining)
+                self._stats['wait_seconds'] += time.monotonic() - waited
+            # Reserve the slot before doing any network I/O outside the lock
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+
+        try:
+            if conn is not None and not self._healthy(conn):
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+            return conn
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+    def putconn(self, conn):
+        """
+        Return a connection; broken or dirty ones are closed instead of reused.
+        Session settings a borrower changed (autocommit) are put back first.
+        """
+        reusable = not conn.closed and not self._closed
+        if reusable:
+            try:
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    reusable = False
+                else:
+                    if status != extensions.TRANSACTION_STATUS_IDLE:
+                        # Never hand the next request somebody else's open transaction
+                        conn.rollback()
+                    if conn.autocommit:
+                        conn.autocommit = False
+            except psycopg2.Error:
+                # Whatever went wrong, the session's state is unknown: don't reuse it
+                reusable = False
+
+        with self._lock:
+            self._in_use -= 1
+            if reusable and not self._expired(conn):
+                self._returned[id(conn)] = time.monotonic()
+                self._idle.append(conn)
+            else:
+                self._discard(conn, 'closed' if self._closed else 'recycled')
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        """`with pool.connection() as conn:` checkout that always gives the connection back."""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop(), 'closed')
+            self._lock.notify_all()
+
+    def stats(self):
+        """Snapshot of pool usage counters."""
+        with self._lock:
+            return dict(
+                self._stats,
+                size=len(self._idle) + self._in_use,
+                idle=len(self._idle),
+                in_use=self._in_use,
+                minconn=self.minconn,
+                maxconn=self.maxconn,
+            )
+
+
+# Tells this run apart from another host's process with the same pid
+_RUN_TAG = secrets.token_hex(3)
+
+def application_name():
+    """
+    This process's name in pg_stat_activity, and the `origin` of the change
+    notifications its writes send (schema.sql, changes.py).
+    """
+    return f'coffeepos-{os.getpid()}-{_RUN_TAG}'
+
+
+def connect_kwargs_from_config(config):
+    return {
+        'dbname': config['DB_NAME'],
+        'user': config['DB_USER'],
+        'password': config['DB_PASS'],
+        'host': config['DB_HOST'],
+        'port': config['DB_PORT'],
+        'cursor_factory': metrics.TimedCursor, # RealDictCursor that feeds /admin/metrics
+    }
+
+
+def create_pool(config):
+    return ConnectionPool(
+        connect_kwargs_from_config(config),
+        minconn=config.get('DB_POOL_MIN', 1),
+        maxconn=config.get('DB_POOL_MAX', 10),
+        timeout=config.get('DB_POOL_TIMEOUT', 10.0),
+        max_lifetime=config.get('DB_POOL_RECYCLE', 3600),
+        pre_ping=config.get('DB_POOL_PRE_PING', True),
+        ping_after=config.get('DB_POOL_PING_AFTER', 5.0),
+    )
+
+
+_pool_init_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the app-wide pool, creating it lazily on first use."""
+    pool = current_app.extensions.get('db_pool')
+    if pool is None:
+        with _pool_init_lock:
+            pool = current_app.extensions.get('db_pool')
+            if pool is None:
+                pool = create_pool(current_app.config)
+                current_app.extensions['db_pool'] = pool
+    return pool
+
 
 def get_db():
     if 'db' not in g:
-        g.db = psycopg2.connect(
-            dbname=current_app.config['DB_NAME'],
-            user=current_app.config['DB_USER'],
-            password=current_app.config['DB_PASS'],
-            host=current_app.config['DB_HOST'],
-            port=current_app.config['DB_PORT'],
-            cursor_factory=RealDictCursor
-        )
+        g.db = get_pool().getconn()
     return g.db
 
 def close_db(e=None):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        get_pool().putconn(db)
 
 def init_db():
     db = get_db()
@@ -27,6 +287,8 @@ def init_db():
             cursor.execute(f.read().decode('utf8'))
         db.commit()
 
+    catalog.invalidate()
+
 @click.command('init-db')
 def init_db_command():
     """Clear the existing data and create new tables."""
@@ -0,0 +1,65 @@
+"""
+Async counterpart of db.py for the ASGI app (asgi.py).
+
+Uses psycopg 3 with its asyncio pool. psycopg 3 speaks the same `%s`
+parameter style as psycopg2, so services_async.py runs the very same SQL
+as services.py, and `dict_row` gives the same dict rows as RealDictCursor.
+"""
+from quart import current_app, g
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+import db
+
+
+def create_pool(config):
+    kwargs = db.connect_kwargs_from_config(config)
+    kwargs.pop('cursor_factory')
+    kwargs['row_factory'] = dict_row
+    # psycopg 3 returns bytes for text on SQL_ASCII databases; psycopg2 decodes them
+    kwargs['client_encoding'] = 'utf8'
+    # changes.py recognizes this process's own writes by it; fixed here since
+    # hypercorn runs create_app() in every worker
+    kwargs['application_name'] = db.application_name()
+    return AsyncConnectionPool(
+        kwargs=kwargs,
+        min_size=config['DB_POOL_MIN'],
+        max_size=config['DB_POOL_MAX'],
+        timeout=config['DB_POOL_TIMEOUT'],
+        max_lifetime=config['DB_POOL_RECYCLE'],
+        check=AsyncConnectionPool.check_connection if config['DB_POOL_PRE_PING'] else None,
+        open=False,
+    )
+
+
+def get_pool():
+    return current_app.extensions['db_async_pool']
+
+
+async def get_db():
+    if 'db' not in g:
+        g.db = await get_pool().getconn()
+    return g.db
+
+
+async def close_db(e=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        # End read-only transactions here; the pool would do it too, but log a warning
+        await conn.rollback()
+        await get_pool().putconn(conn)
+
+
+def init_app(app):
+    pool = create_pool(app.config)
+    app.extensions['db_async_pool'] = pool
+
+    @app.before_serving
+    async def open_pool():
+        await pool.open()
+
+    @app.after_serving
+    async def close_pool():
+        await pool.close()
+
+    app.teardown_appcontext(close_db)
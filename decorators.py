@@ -16,8 +16,9 @@ def admin_required(view):
             return redirect(url_for('auth.login'))
 
         # Check if role is admin (role_id 1 based on seed, but better check name)
-        # We stored role_name in session during login
-        if session.get('role_name') != 'admin':
+        # g.user comes from the identity cache, so this costs no query and a
+        # demoted admin loses access once their cached identity expires
+        if g.user['role_name'] != 'admin':
             abort(403) # Forbidden
 
         return view(**kwargs)
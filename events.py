@@ -0,0 +1,161 @@
+import collections
+import json
+import threading
+
+class Subscription:
+    """
+    One connected terminal. Events wait in a bounded buffer; a client that
+    falls too far behind has its buffer dropped and gets a single `resync`
+    event instead, so one slow tablet can't make the server hoard memory.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._events = collections.deque()
+        self._cond = threading.Condition()
+        self._overflowed = False
+        self.closed = False
+
+    def put(self, event, data):
+        with self._cond:
+            if len(self._events) >= self.maxsize:
+                self._events.clear()
+                self._overflowed = True
+            elif not self._overflowed:
+                self._events.append((event, data))
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Block until events arrive (or `timeout`); returns a possibly empty list."""
+        with self._cond:
+            if not self._events and not self._overflowed and not self.closed:
+                self._cond.wait(timeout)
+            if self._overflowed:
+                self._overflowed = False
+                self._events.clear()
+                return [('resync', {})]
+            batch = list(self._events)
+            self._events.clear()
+            return batch
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+class AsyncSubscription:
+    """
+    `Subscription` for the asyncio app: waiting for events costs no thread.
+    `put` may be called from any thread (publishers are often WSGI threads
+    or run in executors); the event is handed to the subscriber's loop.
+    """
+
+    def __init__(self, maxsize, loop):
+        import asyncio
+        self.maxsize = maxsize
+        self._loop = loop
+        self._events = collections.deque()
+        self._ready = asyncio.Event()
+        self._overflowed = False
+        self.closed = False
+
+    def put(self, event, data):
+        try:
+            self._loop.call_soon_threadsafe(self._put, event, data)
+        except RuntimeError:
+            pass # Loop already closed: the client is gone
+
+    def _put(self, event, data):
+        if len(self._events) >= self.maxsize:
+            self._events.clear()
+            self._overflowed = True
+        elif not self._overflowed:
+            self._events.append((event, data))
+        self._ready.set()
+
+    async def get(self, timeout=None):
+        """Wait until events arrive (or `timeout`); returns a possibly empty list."""
+        if not self._events and not self._overflowed and not self.closed:
+            import asyncio
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._ready.clear()
+        if self._overflowed:
+            self._overflowed = False
+            self._events.clear()
+            return [('resync', {})]
+        batch = list(self._events)
+        self._events.clear()
+        return batch
+
+    def close(self):
+        self.closed = True
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass
+
+class Broker:
+    """
+    In-process pub/sub used to push stock changes to POS terminals over SSE.
+
+    Only terminals connected to this process are reached. Changes made by
+    other processes (serve.py workers, the ASGI app, psql) arrive through
+    Postgres LISTEN/NOTIFY and are republished here by changes.py.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self, maxsize=100, limit=None):
+        """A new `Subscription`, or None when `limit` terminals are connected already."""
+        sub = Subscription(maxsize)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers.add(sub)
+        return sub
+
+    def subscribe_async(self, maxsize=100):
+        """Like `subscribe`, for a coroutine running in the current event loop."""
+        import asyncio
+        sub = AsyncSubscription(maxsize, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+        sub.close()
+
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.put(event, data)
+
+    def close(self):
+        """Disconnect every terminal (server shutdown); EventSource reconnects on its own."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for sub in subscribers:
+            sub.close()
+
+    def client_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+broker = Broker()
+
+def publish_stock(rows):
+    """Push `[{'id', 'stock_quantity'}, ...]` to every connected terminal."""
+    if rows:
+        broker.publish('stock', {'products': [[r['id'], r['stock_quantity']] for r in rows]})
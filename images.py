@@ -0,0 +1,93 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+
+# Pillow, imported by `_pillow()` on the first upload: it's the slowest
+# import of the app and only uploads need it.
+Image = ImageOps = None
+_pillow_checked = False
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
+
+# `<32 hex chars>.<ext>` or `<32 hex chars>.thumb.webp`: the name *is* the content,
+# so these files can be cached forever by the tills.
+CONTENT_ADDRESSED = re.compile(r'^uploads/[0-9a-f]{32}(\.thumb)?\.(png|jpe?g|webp)$')
+
+class InvalidImage(Exception):
+    pass
+
+def allowed_file(filename):
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def is_content_addressed(static_path):
+    return bool(CONTENT_ADDRESSED.match(static_path))
+
+def save_product_image(file_storage, upload_dir, thumbnail_size=(320, 256)):
+    """
+    Store an uploaded product photo under a name derived from its SHA-256
+    and generate a small WebP thumbnail for the POS tiles.
+
+    Returns `(image_url, thumbnail_url)` relative to `static/`; thumbnail_url
+    is None when Pillow isn't installed. Uploading the same photo twice
+    reuses the existing files.
+    """
+    data = file_storage.read()
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    ext = file_storage.filename.rsplit('.', 1)[1].lower()
+    if ext == 'jpeg':
+        ext = 'jpg'
+
+    os.makedirs(upload_dir, exist_ok=True)
+
+    original_name = f"{digest}.{ext}"
+    original_path = os.path.join(upload_dir, original_name)
+    thumb_name = f"{digest}.thumb.webp"
+    thumb_path = os.path.join(upload_dir, thumb_name)
+
+    if _pillow() is not None and not os.path.exists(thumb_path):
+        _write_thumbnail(data, thumb_path, thumbnail_size)
+
+    if not os.path.exists(original_path):
+        _atomic_write(original_path, data)
+
+    thumbnail_url = f"uploads/{thumb_name}" if Image is not None else None
+    return f"uploads/{original_name}", thumbnail_url
+
+def _pillow():
+    global Image, ImageOps, _pillow_checked
+    if not _pillow_checked:
+        try:
+            from PIL import Image, ImageOps
+        except ImportError: # Pillow is optional: without it we store originals only
+            pass
+        _pillow_checked = True
+    return Image
+
+def _write_thumbnail(data, path, size):
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img) # Phone photos are often stored sideways
+            img.thumbnail(size)
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+            out = io.BytesIO()
+            img.save(out, 'WEBP', quality=80, method=4)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidImage(f"Not a valid image: {e}")
+    _atomic_write(path, out.getvalue())
+
+def _atomic_write(path, data):
+    # Write-then-rename so a till never fetches a half-written file. The temp
+    # name is unique per call: two threads may be saving the same image.
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.',
+                                     suffix='.tmp', delete=False) as f:
+        f.write(data)
+    try:
+        os.chmod(f.name, 0o644) # mkstemp makes it owner-only; uploads are served to everyone
+        os.replace(f.name, path)
+    except OSError:
+        os.unlink(f.name)
+        raise
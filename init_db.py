@@ -1,5 +1,5 @@
-import psycopg2
 from werkzeug.security import generate_password_hash
+from db import ConnectionPool
 
 # Kredensial Hardcoded sesuai instruksi
 DB_Config = {
@@ -11,13 +11,21 @@ DB_Config = {
 }
 
 def init_db():
-    conn = psycopg2.connect(**DB_Config)
-    conn.autocommit = True # Penting buat create table
-    
+    # Satu koneksi saja, lewat pool yang sama dengan aplikasi web
+    pool = ConnectionPool(DB_Config, minconn=0, maxconn=1)
+
     # Baca schema.sql
     with open('schema.sql', 'r') as f:
         sql_commands = f.read()
 
+    with pool.connection() as conn:
+        conn.autocommit = True # Penting buat create table
+        seed(conn, sql_commands)
+
+    pool.closeall()
+    print("Database initialization complete (PostgreSQL).")
+
+def seed(conn, sql_commands):
     with conn.cursor() as cursor:
         print("Executing Schema...")
         cursor.execute(sql_commands)
@@ -63,16 +71,13 @@ def init_db():
 
         # Beverage (Managed)
         cursor.execute("""
-            INSERT INTO products (category_id, name, price, is_inventory_managed, stock_quantity) 
-            VALUES (4, 'Bottled Water', 5000, TRUE, 50)
+            INSERT INTO products (category_id, name, sku, price, is_inventory_managed, stock_quantity) 
+            VALUES (4, 'Bottled Water', '8991234500017', 5000, TRUE, 50)
         """)
         cursor.execute("""
-            INSERT INTO products (category_id, name, price, is_inventory_managed, stock_quantity) 
-            VALUES (4, 'Orange Juice', 15000, TRUE, 20)
+            INSERT INTO products (category_id, name, sku, price, is_inventory_managed, stock_quantity) 
+            VALUES (4, 'Orange Juice', '8991234500024', 15000, TRUE, 20)
         """)
 
-    conn.close()
-    print("Database initialization complete (PostgreSQL).")
-
 if __name__ == '__main__':
     init_db()
\ No newline at end of file
@@ -0,0 +1,265 @@
+"""
+Request and database instrumentation, scraped at /admin/metrics.
+
+* Every request: latency histogram per endpoint, plus how many queries it
+  ran and how long it spent in Postgres (also sent back as a
+  `Server-Timing` header, visible in the browser's network tab).
+* Every query goes through `TimedCursor` (db.py's cursor_factory). Queries
+  slower than SLOW_QUERY_MS are logged; the same statement repeated
+  N_PLUS_ONE_THRESHOLD times within one request is logged as a probable
+  N+1 (a query in a loop that should be one set-based statement).
+* Pool usage, connected SSE terminals and order throughput.
+
+Numbers are per process: with `serve.py --workers N` each worker keeps its own.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, has_app_context, request
+from psycopg2.extras import RealDictCursor
+
+log = logging.getLogger('coffeepos')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+class Histogram:
+    """Prometheus-style histogram (cumulative `le` buckets are computed when rendering)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class RequestStats:
+    """Query bookkeeping for the current request (kept on `g`)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = defaultdict(int)  # normalized SQL -> executions
+        self.flagged = set()
+        self.repeats_expected = False
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.slow_query_ms = 100
+        self.n_plus_one_threshold = 10
+        self._requests = defaultdict(int)                               # (method, endpoint, status) -> n
+        self._latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))  # (method, endpoint)
+        self._request_queries = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))  # endpoint
+        self._request_db_time = defaultdict(lambda: Histogram(LATENCY_BUCKETS))      # endpoint
+        self._queries = defaultdict(int)         # endpoint -> queries
+        self._query_seconds = defaultdict(float) # endpoint -> seconds
+        self._slow_queries = defaultdict(int)    # endpoint -> n
+        self._n_plus_one = defaultdict(int)      # endpoint -> n
+        self._orders = defaultdict(int)          # outcome -> n
+        self._startup = {}                       # phase -> seconds (desktop start, see startup.py)
+
+    def observe_query(self, endpoint, elapsed, slow):
+        with self._lock:
+            self._queries[endpoint] += 1
+            self._query_seconds[endpoint] += elapsed
+            if slow:
+                self._slow_queries[endpoint] += 1
+
+    def observe_n_plus_one(self, endpoint):
+        with self._lock:
+            self._n_plus_one[endpoint] += 1
+
+    def observe_request(self, method, endpoint, status, elapsed, stats):
+        with self._lock:
+            self._requests[(method, endpoint, status)] += 1
+            self._latency[(method, endpoint)].observe(elapsed)
+            self._request_queries[endpoint].observe(stats.queries)
+            self._request_db_time[endpoint].observe(stats.db_time)
+
+    def count_orders(self, outcome, n=1):
+        if n:
+            with self._lock:
+                self._orders[outcome] += n
+
+    def observe_startup(self, phases):
+        with self._lock:
+            self._startup.update(phases)
+
+    def render(self, pool_stats=None, sse_clients=None):
+        """Everything in Prometheus text exposition format (version 0.0.4)."""
+        out = []
+        with self._lock:
+            _counter(out, 'coffeepos_http_requests_total', 'HTTP requests by endpoint and status.',
+                     {_labels(method=m, endpoint=e, status=s): n for (m, e, s), n in self._requests.items()})
+            _histogram(out, 'coffeepos_http_request_duration_seconds', 'Request latency.',
+                       {_labels(method=m, endpoint=e): h for (m, e), h in self._latency.items()})
+            _histogram(out, 'coffeepos_http_request_queries', 'Database queries per request.',
+                       {_labels(endpoint=e): h for e, h in self._request_queries.items()})
+            _histogram(out, 'coffeepos_http_request_db_seconds', 'Time spent in the database per request.',
+                       {_labels(endpoint=e): h for e, h in self._request_db_time.items()})
+            _counter(out, 'coffeepos_db_queries_total', 'Queries executed.',
+                     {_labels(endpoint=e): n for e, n in self._queries.items()})
+            _counter(out, 'coffeepos_db_query_seconds_total', 'Time spent executing queries.',
+                     {_labels(endpoint=e): n for e, n in self._query_seconds.items()})
+            _counter(out, 'coffeepos_db_slow_queries_total', f'Queries slower than {self.slow_query_ms} ms.',
+                     {_labels(endpoint=e): n for e, n in self._slow_queries.items()})
+            _counter(out, 'coffeepos_db_n_plus_one_total', 'Requests that repeated one statement '
+                     f'{self.n_plus_one_threshold}+ times.',
+                     {_labels(endpoint=e): n for e, n in self._n_plus_one.items()})
+            _counter(out, 'coffeepos_orders_total', 'Orders by outcome.',
+                     {_labels(outcome=o): n for o, n in self._orders.items()})
+            if self._startup:
+                _gauges(out, 'coffeepos_startup_phase_seconds', 'Desktop start-up time by phase (run_gui.py).',
+                        {_labels(phase=p): s for p, s in self._startup.items()})
+
+        if pool_stats is not None:
+            for key in ('size', 'idle', 'in_use', 'maxconn'):
+                _gauge(out, f'coffeepos_db_pool_{key}', f'Connection pool {key}.', pool_stats[key])
+            for key in ('checkouts', 'connects', 'recycled', 'closed', 'failed_pings', 'waits', 'timeouts'):
+                _counter(out, f'coffeepos_db_pool_{key}_total', f'Connection pool {key}.', {'': pool_stats[key]})
+            _counter(out, 'coffeepos_db_pool_wait_seconds_total', 'Time spent waiting for a free connection.',
+                     {'': pool_stats['wait_seconds']})
+        if sse_clients is not None:
+            _gauge(out, 'coffeepos_sse_clients', 'Terminals connected to /api/stream.', sse_clients)
+        return ''.join(out)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+def _header(out, name, help_text, kind):
+    out.append(f'# HELP {name} {help_text}\n# TYPE {name} {kind}\n')
+
+def _counter(out, name, help_text, samples):
+    _header(out, name, help_text, 'counter')
+    for labels, value in sorted(samples.items()):
+        out.append(f'{name}{{{labels}}} {value}\n' if labels else f'{name} {value}\n')
+
+def _gauge(out, name, help_text, value):
+    _header(out, name, help_text, 'gauge')
+    out.append(f'{name} {value}\n')
+
+def _gauges(out, name, help_text, samples):
+    _header(out, name, help_text, 'gauge')
+    for labels, value in sorted(samples.items()):
+        out.append(f'{name}{{{labels}}} {value}\n')
+
+def _histogram(out, name, help_text, histograms):
+    _header(out, name, help_text, 'histogram')
+    for labels, h in sorted(histograms.items()):
+        cumulative = 0
+        for le, n in zip(list(h.buckets) + ['+Inf'], h.counts):
+            cumulative += n
+            out.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}\n')
+        out.append(f'{name}_sum{{{labels}}} {h.sum}\n')
+        out.append(f'{name}_count{{{labels}}} {h.count}\n')
+
+registry = Metrics()
+
+_NUMBERS = re.compile(r'\b\d+\b')
+
+def _normalize(query):
+    if isinstance(query, bytes):
+        query = query.decode('utf8', 'replace')
+    elif not isinstance(query, str):
+        query = repr(query)
+    return _NUMBERS.sub('?', ' '.join(query.split()))
+
+def _current():
+    """(RequestStats, endpoint) for the request in progress, or (None, '<none>')."""
+    if has_app_context():
+        stats = g.get('request_stats')
+        if stats is not None:
+            return stats, request.endpoint or '<unmatched>'
+    return None, '<none>'
+
+def record_query(query, elapsed):
+    stats, endpoint = _current()
+    slow = elapsed * 1000 >= registry.slow_query_ms
+    registry.observe_query(endpoint, elapsed, slow)
+
+    sql = None
+    if slow:
+        sql = _normalize(query)
+        log.warning("Slow query (%.1f ms) in %s: %s", elapsed * 1000, endpoint, sql[:500])
+
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+        sql = sql or _normalize(query)
+        stats.statements[sql] += 1
+        if stats.statements[sql] == registry.n_plus_one_threshold and not stats.repeats_expected \
+                and sql not in stats.flagged:
+            stats.flagged.add(sql)
+            registry.observe_n_plus_one(endpoint)
+            log.warning("Possible N+1 in %s: same statement run %d times in one request: %s",
+                        endpoint, stats.statements[sql], sql[:500])
+
+class TimedCursor(RealDictCursor):
+    """RealDictCursor that reports every statement to `record_query`."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(query, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(query, time.perf_counter() - start)
+
+def count_orders(outcome, n=1):
+    registry.count_orders(outcome, n)
+
+def record_startup(phases):
+    registry.observe_startup(phases)
+
+def expect_repeated_queries():
+    """Called by views that loop over statements on purpose (e.g. a batch), to skip N+1 warnings."""
+    stats, _ = _current()
+    if stats is not None:
+        stats.repeats_expected = True
+
+def init_app(app):
+    registry.slow_query_ms = app.config['SLOW_QUERY_MS']
+    registry.n_plus_one_threshold = app.config['N_PLUS_ONE_THRESHOLD']
+
+    log.setLevel(logging.INFO)
+    if app.config.get('LOG_FILE'):
+        handler = logging.FileHandler(app.config['LOG_FILE'])
+        handler.setFormatter(logging.Formatter('[%(asctime)s] %(levelname)s in %(name)s: %(message)s'))
+        for logger in (log, app.logger):
+            logger.addHandler(handler)
+        app.logger.setLevel(logging.INFO)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+
+    @app.after_request
+    def record_request(response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        registry.observe_request(request.method, request.endpoint or '<unmatched>',
+                                 response.status_code, elapsed, stats)
+        response.headers.add('Server-Timing', f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"')
+        response.headers.add('Server-Timing', f'app;dur={elapsed * 1000:.1f}')
+        return response
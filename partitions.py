@@ -0,0 +1,239 @@
+"""
+Monthly partitions of orders / order_items, and archival of cold months.
+
+Both tables are range-partitioned on the order timestamp (schema.sql), one
+pair of partitions per month: orders_p2025_01 + order_items_p2025_01.
+Partitions are created `MONTHS_AHEAD` months in advance by `ensure()`, and
+a checkout that still lands in a missing month creates it on the spot (see
+`missing_partition`), so nothing has to run on the 1st of the month.
+
+Old months can be moved out of the database into gzip'd CSV files and back:
+
+    flask partitions list
+    flask partitions ensure --months-ahead 3
+    flask partitions archive --before 2025-01      # every month before January 2025
+    flask partitions restore 2024-06
+
+The daily_sales / daily_product_sales rollups keep the archived months, so
+reports don't change when a month is archived; the dashboard, exports and
+voids only see orders that are still in the database.
+"""
+import datetime
+import gzip
+import os
+import click
+from flask import current_app
+from flask.cli import AppGroup
+import db
+
+MONTHS_AHEAD = 3
+
+ENSURE_SQL = """SELECT create_order_partitions(LOCALTIMESTAMP::timestamp,
+           (LOCALTIMESTAMP + %s * interval '1 month')::timestamp) AS created"""
+
+LIST_SQL = """SELECT c.relname AS name, GREATEST(c.reltuples, 0)::bigint AS estimated_rows, -- -1: never analyzed
+           pg_total_relation_size(c.oid) + COALESCE(pg_total_relation_size(i.oid), 0) AS total_bytes
+           FROM pg_inherits h
+           JOIN pg_class c ON c.oid = h.inhrelid
+           LEFT JOIN pg_class i ON i.relname = 'order_items_p' || substr(c.relname, 9)
+           WHERE h.inhparent = 'orders'::regclass
+           ORDER BY c.relname"""
+
+INSERT_ARCHIVE_SQL = """INSERT INTO order_archives (month, order_count, item_count, orders_file, items_file)
+           VALUES (%s, %s, %s, %s, %s)"""
+
+def missing_partition(error):
+    """True for the error an INSERT gets when no partition covers its month yet."""
+    # psycopg2.errors.CheckViolation or psycopg.errors.CheckViolation (async stack)
+    return type(error).__name__ == 'CheckViolation' and 'no partition of relation' in str(error)
+
+def create(cursor, months_ahead=MONTHS_AHEAD):
+    """Create the partitions from this month to `months_ahead` months out. Does not commit."""
+    cursor.execute(ENSURE_SQL, (months_ahead,))
+    return cursor.fetchone()['created']
+
+def ensure(db_conn, months_ahead=MONTHS_AHEAD):
+    """`create()` in its own transaction; returns the number of months created."""
+    cursor = db_conn.cursor()
+    try:
+        created = create(cursor, months_ahead)
+        db_conn.commit()
+        return created
+    except Exception as e:
+        db_conn.rollback()
+        raise e
+
+async def ensure_async(db_conn, months_ahead=MONTHS_AHEAD):
+    """`ensure()` for a psycopg 3 AsyncConnection."""
+    try:
+        async with db_conn.cursor() as cursor:
+            await cursor.execute(ENSURE_SQL, (months_ahead,))
+            created = (await cursor.fetchone())['created']
+        await db_conn.commit()
+        return created
+    except Exception as e:
+        await db_conn.rollback()
+        raise e
+
+def list_partitions(db_conn):
+    """[{'month', 'estimated_rows', 'total_bytes'}] for the months still in the database, oldest first."""
+    with db_conn.cursor() as cur:
+        cur.execute(LIST_SQL)
+        rows = cur.fetchall()
+    db_conn.rollback()
+    return [{'month': _parse_suffix(row['name'][len('orders_p'):]), 'estimated_rows': row['estimated_rows'],
+             'total_bytes': row['total_bytes']} for row in rows]
+
+def archive(db_conn, before, directory):
+    """
+    Archive every month that starts before `before` (a date; only whole
+    months before the current one qualify). One transaction per month.
+    Returns the `archive_month` summaries.
+    """
+    this_month = datetime.date.today().replace(day=1)
+    if before > this_month:
+        raise Exception("Only months before the current one can be archived")
+    months = [p['month'] for p in list_partitions(db_conn) if p['month'] < before]
+    return [archive_month(db_conn, month, directory) for month in months]
+
+def archive_month(db_conn, month, directory):
+    """
+    Dump one month of orders and order items to gzip'd CSV files in
+    `directory`, then detach and drop its partitions.
+
+    The files are fsync'ed before the partitions are dropped, in the same
+    transaction: if anything fails the month stays in the database and the
+    half-written files are removed. Writes to the month (a late void) wait
+    for the dump; the rest of the orders table only for the final DETACH.
+    """
+    suffix = month.strftime('%Y_%m')
+    orders_table, items_table = f'orders_p{suffix}', f'order_items_p{suffix}'
+    os.makedirs(directory, exist_ok=True)
+    orders_file = os.path.abspath(os.path.join(directory, f'orders_{suffix}.csv.gz'))
+    items_file = os.path.abspath(os.path.join(directory, f'order_items_{suffix}.csv.gz'))
+
+    cursor = db_conn.cursor()
+    try:
+        cursor.execute(f"LOCK TABLE {orders_table}, {items_table} IN SHARE MODE")
+        order_count = _dump(cursor, orders_table, orders_file)
+        item_count = _dump(cursor, items_table, items_file)
+
+        cursor.execute(f"ALTER TABLE order_items DETACH PARTITION {items_table}")
+        cursor.execute(f"ALTER TABLE orders DETACH PARTITION {orders_table}")
+        cursor.execute(f"DROP TABLE {items_table}, {orders_table}")
+        cursor.execute("DELETE FROM order_idempotency WHERE order_created_at >= %s AND order_created_at < %s",
+                       (month, _next_month(month)))
+        cursor.execute(INSERT_ARCHIVE_SQL, (month, order_count, item_count, orders_file, items_file))
+        db_conn.commit()
+    except Exception as e:
+        db_conn.rollback()
+        for path in (orders_file, items_file):
+            if os.path.exists(path):
+                os.remove(path)
+        raise e
+
+    return {'month': month.isoformat(), 'orders': order_count, 'items': item_count,
+            'orders_file': orders_file, 'items_file': items_file}
+
+def restore_month(db_conn, month):
+    """Load an archived month back into fresh partitions, from the files recorded at archive time."""
+    suffix = month.strftime('%Y_%m')
+    cursor = db_conn.cursor()
+    try:
+        cursor.execute("DELETE FROM order_archives WHERE month = %s RETURNING *", (month,))
+        archived = cursor.fetchone()
+        if not archived:
+            raise Exception(f"{month:%Y-%m} is not archived")
+
+        cursor.execute("SELECT create_order_partitions(%s, %s)", (month, month))
+        order_count = _load(cursor, f'orders_p{suffix}', archived['orders_file'])
+        item_count = _load(cursor, f'order_items_p{suffix}', archived['items_file'])
+        if (order_count, item_count) != (archived['order_count'], archived['item_count']):
+            raise Exception(f"Archive of {month:%Y-%m} is incomplete: {order_count} orders / {item_count} items, "
+                            f"expected {archived['order_count']} / {archived['item_count']}")
+
+        # Retried checkouts of these orders are recognized again
+        cursor.execute(f"""INSERT INTO order_idempotency (idempotency_key, order_id, order_created_at)
+                           SELECT idempotency_key, id, created_at FROM orders_p{suffix}
+                           WHERE idempotency_key IS NOT NULL ON CONFLICT DO NOTHING""")
+        db_conn.commit()
+    except Exception as e:
+        db_conn.rollback()
+        raise e
+
+    return {'month': month.isoformat(), 'orders': order_count, 'items': item_count}
+
+def _dump(cursor, table, path):
+    """COPY `table` into a gzip'd CSV at `path` (written to a temp file, fsync'ed, renamed). Returns the row count."""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+            cursor.copy_expert(f"COPY {table} TO STDOUT WITH (FORMAT csv, HEADER)", gz)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return cursor.rowcount
+
+def _load(cursor, table, path):
+    # Columns by header name, so an archive still loads after columns are added
+    with gzip.open(path, 'rt', encoding='utf-8') as gz:
+        columns = gz.readline().strip()
+    with gzip.open(path, 'rb') as gz:
+        cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER)", gz)
+    return cursor.rowcount
+
+def _next_month(month):
+    return (month.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+def _parse_suffix(suffix):
+    return datetime.datetime.strptime(suffix, '%Y_%m').date()
+
+def _parse_month(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise click.BadParameter(f"{value!r} is not a month (YYYY-MM)")
+
+partitions_cli = AppGroup('partitions', help='Monthly order partitions and archives.')
+
+@partitions_cli.command('list')
+def list_command():
+    """Months still in the database, with their size."""
+    for p in list_partitions(db.get_db()):
+        click.echo(f"{p['month']:%Y-%m}  ~{p['estimated_rows']} orders  {p['total_bytes'] // 1024} kB")
+
+@partitions_cli.command('ensure')
+@click.option('--months-ahead', default=MONTHS_AHEAD, show_default=True)
+def ensure_command(months_ahead):
+    """Create the partitions up to --months-ahead months from now."""
+    created = ensure(db.get_db(), months_ahead)
+    click.echo(f'Created partitions for {created} months.')
+
+@partitions_cli.command('archive')
+@click.option('--before', required=True, help='archive every month before this one (YYYY-MM)')
+@click.option('--dir', 'directory', default=None, help='defaults to ORDER_ARCHIVE_DIR')
+def archive_command(before, directory):
+    """Move old months out of the database into gzip'd CSV files."""
+    directory = directory or current_app.config['ORDER_ARCHIVE_DIR']
+    try:
+        archived = archive(db.get_db(), _parse_month(before), directory)
+    except Exception as e:
+        raise click.ClickException(str(e))
+    for summary in archived:
+        click.echo(f"Archived {summary['month'][:7]}: {summary['orders']} orders, {summary['items']} items "
+                   f"-> {summary['orders_file']}")
+    if not archived:
+        click.echo('Nothing to archive.')
+
+@partitions_cli.command('restore')
+@click.argument('month')
+def restore_command(month):
+    """Load an archived month (YYYY-MM) back into the database."""
+    try:
+        summary = restore_month(db.get_db(), _parse_month(month))
+    except Exception as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Restored {summary['month'][:7]}: {summary['orders']} orders, {summary['items']} items.")
+
+def init_app(app):
+    app.cli.add_command(partitions_cli)
@@ -0,0 +1,410 @@
+"""
+Promotions and cart pricing, shared by checkout (services.price_order) and
+the till's live total (POST /api/cart/quote), so both always agree.
+
+Promotions live in the `promotions` table (schema.sql) and are managed
+through /api/promotions. They are compiled into a `RuleIndex` kept in
+memory (`cache`); pricing a cart then costs a few dict lookups per line and
+no queries. Kinds:
+
+    percent_off   {"percent": 20}                      category / product discounts; with
+                                                       daily_start/daily_end it's a happy hour
+    buy_x_get_y   {"buy": 2, "get": 1}                 the cheapest unit of every 3 is free
+    bundle        {"items": [[3, 1], [7, 1]], "price": 25000}   these products together for `price`
+
+Every unit gets at most one promotion: rules run highest `priority` first
+and the units a rule used are not offered to later rules.
+"""
+import datetime
+import json
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+import metrics
+import product_import
+
+TAX_RATE = Decimal('0.10')
+
+KINDS = ('percent_off', 'buy_x_get_y', 'bundle')
+
+CENT = Decimal('0.01')
+
+# Expired promotions never come back, so they aren't worth compiling
+PROMOTIONS_SQL = """SELECT id, name, kind, params, product_ids, category_id, starts_at, ends_at,
+           daily_start, daily_end, priority
+           FROM promotions WHERE is_active AND (ends_at IS NULL OR ends_at > LOCALTIMESTAMP)"""
+
+LIST_SQL = "SELECT * FROM promotions ORDER BY priority DESC, id"
+
+COLUMNS = ('name', 'kind', 'params', 'product_ids', 'category_id', 'starts_at', 'ends_at',
+           'daily_start', 'daily_end', 'priority', 'is_active')
+
+class Rule:
+    """One compiled promotion (see `compile_rule`)."""
+
+    def __init__(self, id, name, kind, priority=0, product_ids=None, category_id=None, starts_at=None,
+                 ends_at=None, daily_start=None, daily_end=None, percent=None, buy=None, get=None,
+                 items=None, price=None):
+        self.id = id
+        self.name = name
+        self.kind = kind
+        self.priority = priority
+        self.product_ids = product_ids # frozenset, or None
+        self.category_id = category_id
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+        self.daily_start = daily_start
+        self.daily_end = daily_end
+        self.percent = percent # percent_off
+        self.buy = buy         # buy_x_get_y
+        self.get = get
+        self.items = items     # bundle: {product_id: quantity}
+        self.price = price
+
+    def active_at(self, now):
+        if self.starts_at is not None and now < self.starts_at:
+            return False
+        if self.ends_at is not None and now >= self.ends_at:
+            return False
+        if self.daily_start is not None:
+            t = now.time()
+            if self.daily_start <= self.daily_end:
+                return self.daily_start <= t < self.daily_end
+            return t >= self.daily_start or t < self.daily_end # e.g. 22:00-02:00
+        return True
+
+    def apply(self, lines, matched, left):
+        """
+        [(line index, units used, discount)] for the `matched` lines, given
+        how many units of each line are still `left` for promotions.
+        """
+        if self.kind == 'percent_off':
+            return [(i, left[i], to_cents(lines[i]['price_snapshot'] * left[i] * self.percent / 100)) for i in matched]
+        if self.kind == 'buy_x_get_y':
+            return self._buy_x_get_y(lines, matched, left)
+        return self._bundle(lines, matched, left)
+
+    def _buy_x_get_y(self, lines, matched, left):
+        # Units sorted most expensive first and cut into groups of buy + get;
+        # the last `get` of every complete group (its cheapest) are free.
+        group = self.buy + self.get
+        ordered = sorted(matched, key=lambda i: (-lines[i]['price_snapshot'], i))
+        used = sum(left[i] for i in ordered) // group * group
+        result, start = [], 0
+        for i in ordered:
+            end = min(start + left[i], used)
+            if end <= start:
+                break
+            free = _free_units(end, self.buy, group) - _free_units(start, self.buy, group)
+            result.append((i, end - start, to_cents(lines[i]['price_snapshot'] * free)))
+            start = end
+        return result
+
+    def _bundle(self, lines, matched, left):
+        available, prices = {}, {}
+        for i in matched:
+            product_id = lines[i]['product_id']
+            available[product_id] = available.get(product_id, 0) + left[i]
+            prices[product_id] = lines[i]['price_snapshot']
+        count = min(available.get(product_id, 0) // qty for product_id, qty in self.items.items())
+        if not count:
+            return []
+        regular = sum(prices[product_id] * qty for product_id, qty in self.items.items())
+        saving = (regular - self.price) * count
+        if saving <= 0:
+            return []
+
+        # The saving is spread over the bundle's lines by their regular value
+        needed = {product_id: qty * count for product_id, qty in self.items.items()}
+        result = []
+        for i in matched:
+            product_id = lines[i]['product_id']
+            units = min(left[i], needed[product_id])
+            if units:
+                needed[product_id] -= units
+                result.append([i, units, to_cents(saving * prices[product_id] * units / (regular * count))])
+        result[-1][2] += saving - sum(r[2] for r in result) # rounding
+        return [tuple(r) for r in result]
+
+class RuleIndex:
+    """
+    The active promotions at one `version`, indexed by the product and the
+    category they apply to. Never changed after it's built.
+    """
+
+    def __init__(self, version, rules):
+        self.version = version
+        self.rules = sorted(rules, key=lambda r: (-r.priority, r.id))
+        self._rank = {rule.id: n for n, rule in enumerate(self.rules)}
+        self._by_id = {rule.id: rule for rule in self.rules}
+        self._by_product = {}
+        self._by_category = {}
+        self._everything = [] # no target: every product
+        for rule in self.rules:
+            for product_id in rule.product_ids or ():
+                self._by_product.setdefault(product_id, []).append(rule)
+            if rule.category_id is not None:
+                self._by_category.setdefault(rule.category_id, []).append(rule)
+            if rule.product_ids is None and rule.category_id is None:
+                self._everything.append(rule)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def matches(self, lines, now):
+        """[(rule, [line indices])] for the rules active at `now` that touch `lines`, highest priority first."""
+        hits = {}
+        for i, line in enumerate(lines):
+            for rules in (self._by_product.get(line['product_id'], ()),
+                          self._by_category.get(line['category_id'], ()), self._everything):
+                for rule in rules:
+                    matched = hits.setdefault(rule.id, [])
+                    if not matched or matched[-1] != i:
+                        matched.append(i)
+        return [(self._by_id[rule_id], hits[rule_id]) for rule_id in sorted(hits, key=self._rank.get)
+                if self._by_id[rule_id].active_at(now)]
+
+def apply(index, lines, now):
+    """
+    Apply the promotions of `index` (may be None) to priced cart `lines`
+    ({'product_id', 'category_id', 'price_snapshot', 'quantity', 'subtotal'}),
+    in place: each line gets 'discount_amount' and 'promotions' and its
+    'subtotal' becomes net of the discount. Returns the total discount.
+    """
+    left = [line['quantity'] for line in lines]
+    discounts = [Decimal('0.00')] * len(lines)
+    applied = [[] for _ in lines]
+
+    for rule, matched in (index.matches(lines, now) if index else ()):
+        matched = [i for i in matched if left[i] > 0]
+        if not matched:
+            continue
+        for i, units, discount in rule.apply(lines, matched, left):
+            left[i] -= units
+            if discount:
+                discounts[i] += discount
+                applied[i].append({'id': rule.id, 'name': rule.name})
+
+    for line, discount, promotions in zip(lines, discounts, applied):
+        line['discount_amount'] = discount
+        line['subtotal'] -= discount
+        line['promotions'] = promotions
+    return sum(discounts, Decimal('0.00'))
+
+def compile_rule(row):
+    """
+    A promotions row (or the same fields from the admin API) -> `Rule`.
+    Raises ValueError when the promotion doesn't make sense.
+    """
+    kind = row['kind']
+    params = row['params'] or {}
+    if isinstance(params, str):
+        params = json.loads(params)
+    product_ids = frozenset(int(pid) for pid in row['product_ids']) if row.get('product_ids') else None
+    rule = Rule(row['id'], row['name'], kind, priority=row.get('priority') or 0, product_ids=product_ids,
+                category_id=row.get('category_id'), starts_at=row.get('starts_at'), ends_at=row.get('ends_at'),
+                daily_start=row.get('daily_start'), daily_end=row.get('daily_end'))
+
+    if (rule.daily_start is None) != (rule.daily_end is None):
+        raise ValueError("daily_start and daily_end go together")
+    if rule.starts_at and rule.ends_at and rule.starts_at >= rule.ends_at:
+        raise ValueError("ends_at must be after starts_at")
+
+    try:
+        if kind == 'percent_off':
+            rule.percent = Decimal(str(params['percent']))
+            if not 0 < rule.percent <= 100:
+                raise ValueError("percent must be between 0 and 100")
+        elif kind == 'buy_x_get_y':
+            rule.buy, rule.get = int(params['buy']), int(params['get'])
+            if rule.buy < 1 or rule.get < 1:
+                raise ValueError("buy and get must be at least 1")
+        elif kind == 'bundle':
+            rule.items = {}
+            for product_id, qty in params['items']:
+                rule.items[int(product_id)] = rule.items.get(int(product_id), 0) + int(qty)
+            rule.price = Decimal(str(params['price']))
+            if sum(rule.items.values()) < 2 or min(rule.items.values()) < 1 or rule.price < 0:
+                raise ValueError("A bundle needs at least two units and a price")
+            # The bundle's own products are its targets
+            rule.product_ids, rule.category_id = frozenset(rule.items), None
+        else:
+            raise ValueError(f"Unknown promotion kind {kind!r}")
+    except (KeyError, TypeError, ArithmeticError) as e:
+        raise ValueError(f"Invalid params for {kind}: {e}")
+    return rule
+
+def _free_units(n, buy, group):
+    # Free units among the first n (the last group - buy places of every group)
+    return n // group * (group - buy) + max(0, n % group - buy)
+
+def to_cents(amount):
+    """Round a Decimal amount half-up to the cent, as every total is (services.py too)."""
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP)
+
+class PromotionCache:
+    """
+    The compiled `RuleIndex`, rebuilt only after `invalidate()` (every write
+    through /api/promotions) or when older than `max_age`, which catches
+    edits made by another worker or straight in the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()          # guards the version
+        self._refresh_lock = threading.Lock()  # only one thread talks to the DB at a time
+        self._async_refresh_lock = None        # same, for the asyncio app (asgi.py)
+        # A millisecond timestamp, like catalog versions, so versions keep growing across restarts
+        self._version = int(time.time() * 1000)
+        self._index = None
+        self._loaded_at = 0.0
+
+    @property
+    def version(self):
+        return self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+
+    def _is_fresh(self, max_age):
+        index = self._index
+        return (index is not None and index.version == self._version
+                and not (max_age and time.monotonic() - self._loaded_at >= max_age))
+
+    def get(self, db_conn, max_age=None):
+        """The current `RuleIndex`; queries the database only when it's stale."""
+        if self._is_fresh(max_age):
+            return self._index
+
+        with self._refresh_lock:
+            if self._is_fresh(max_age):
+                return self._index
+            version = self._version
+            with db_conn.cursor() as cur:
+                cur.execute(PROMOTIONS_SQL)
+                rows = cur.fetchall()
+            return self._compiled(version, rows)
+
+    async def get_async(self, db_conn, max_age=None):
+        """`get()` for an async (psycopg 3) connection, used by the ASGI app."""
+        if self._is_fresh(max_age):
+            return self._index
+
+        if self._async_refresh_lock is None:
+            import asyncio
+            self._async_refresh_lock = asyncio.Lock()
+        async with self._async_refresh_lock:
+            if self._is_fresh(max_age):
+                return self._index
+            version = self._version
+            async with db_conn.cursor() as cur:
+                await cur.execute(PROMOTIONS_SQL)
+                rows = await cur.fetchall()
+            return self._compiled(version, rows)
+
+    def _compiled(self, version, rows):
+        rules = []
+        for row in rows:
+            try:
+                rules.append(compile_rule(row))
+            except ValueError as e:
+                # A bad row edited in by hand must not stop the tills from selling
+                metrics.log.warning("Skipping promotion %s (%s): %s", row['id'], row['name'], e)
+        index = RuleIndex(version, rules)
+        self._index, self._loaded_at = index, time.monotonic()
+        return index
+
+# One cache per process; /api/promotions invalidates it after every write
+cache = PromotionCache()
+
+def invalidate():
+    cache.invalidate()
+
+def list_promotions(db_conn):
+    with db_conn.cursor() as cur:
+        cur.execute(LIST_SQL)
+        rows = cur.fetchall()
+    db_conn.rollback()
+    return rows
+
+def promotion_fields(data):
+    """
+    Validated column values for a promotion from JSON `data` (ISO timestamps,
+    'HH:MM' times). Raises ValueError with a message for the admin.
+    """
+    if not isinstance(data, dict) or not data.get('name') or data.get('kind') not in KINDS:
+        raise ValueError(f"name and kind ({', '.join(KINDS)}) are required")
+    try:
+        fields = {
+            'name': str(data['name'])[:100],
+            'kind': data['kind'],
+            'params': data.get('params') or {},
+            'product_ids': [int(pid) for pid in data['product_ids']] if data.get('product_ids') else None,
+            'category_id': int(data['category_id']) if data.get('category_id') else None,
+            'starts_at': _parse(datetime.datetime.fromisoformat, data.get('starts_at')),
+            'ends_at': _parse(datetime.datetime.fromisoformat, data.get('ends_at')),
+            'daily_start': _parse(datetime.time.fromisoformat, data.get('daily_start')),
+            'daily_end': _parse(datetime.time.fromisoformat, data.get('daily_end')),
+            'priority': int(data.get('priority') or 0),
+            # Strict, like the product import: the string "false" must not switch a promotion on
+            'is_active': product_import.parse_bool(data.get('is_active'), True),
+        }
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid promotion: {e}")
+    compile_rule(dict(fields, id=None)) # raises if it can't be priced
+    return fields
+
+def save_promotion(db_conn, data, promotion_id=None):
+    """
+    Insert (or update `promotion_id`) from JSON `data`; returns the row, or
+    None if there's no such promotion. Raises ValueError for invalid data,
+    including products or a category that don't exist.
+    """
+    fields = promotion_fields(data)
+    values = [json.dumps(fields[c]) if c == 'params' else fields[c] for c in COLUMNS]
+    cursor = db_conn.cursor()
+    try:
+        _check_references(cursor, compile_rule(dict(fields, id=None)))
+        if promotion_id is None:
+            cursor.execute(f"""INSERT INTO promotions ({', '.join(COLUMNS)})
+                               VALUES ({', '.join(['%s'] * len(COLUMNS))}) RETURNING *""", values)
+        else:
+            cursor.execute(f"""UPDATE promotions SET {', '.join(c + ' = %s' for c in COLUMNS)},
+                               updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING *""", values + [promotion_id])
+        row = cursor.fetchone()
+        db_conn.commit()
+    except Exception as e:
+        db_conn.rollback()
+        raise e
+    invalidate()
+    return row
+
+def _check_references(cursor, rule):
+    # product_ids has no foreign key (it's an array) and a bad category_id
+    # would only surface as an IntegrityError: both are the admin's mistake
+    product_ids = sorted(set(rule.product_ids or ()) | set(rule.items or ()))
+    if product_ids:
+        cursor.execute("SELECT id FROM products WHERE id = ANY(%s)", (product_ids,))
+        missing = set(product_ids) - {row['id'] for row in cursor.fetchall()}
+        if missing:
+            raise ValueError(f"Unknown product ID(s): {', '.join(map(str, sorted(missing)))}")
+    if rule.category_id is not None:
+        cursor.execute("SELECT id FROM categories WHERE id = %s", (rule.category_id,))
+        if cursor.fetchone() is None:
+            raise ValueError(f"Unknown category ID: {rule.category_id}")
+
+def delete_promotion(db_conn, promotion_id):
+    """True if it existed. Orders keep their discounts; only future carts change."""
+    cursor = db_conn.cursor()
+    try:
+        cursor.execute("DELETE FROM promotions WHERE id = %s", (promotion_id,))
+        deleted = cursor.rowcount > 0
+        db_conn.commit()
+    except Exception as e:
+        db_conn.rollback()
+        raise e
+    invalidate()
+    return deleted
+
+def _parse(parse, value):
+    return parse(value) if value else None
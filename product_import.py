@@ -0,0 +1,258 @@
+import csv
+import io
+import zipfile
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+REQUIRED = ('name', 'category', 'price')
+
+# Column limits (schema.sql): DECIMAL(15, 2) and INTEGER. A value past them
+# would fail the COPY, and with it the whole import, instead of one row.
+MAX_PRICE = Decimal('1e13')
+MAX_STOCK = 2**31 - 1
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'ya'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'tidak', ''}
+
+class InvalidImportFile(Exception):
+    """The uploaded file itself is unusable (wrong type, missing columns)."""
+
+def read_rows(file_storage):
+    """
+    Yield `(line_number, {column: value})` from an uploaded CSV or XLSX file,
+    one row at a time, without loading the whole sheet into memory.
+    """
+    filename = (file_storage.filename or '').lower()
+    if filename.endswith('.csv'):
+        rows = _read_csv(file_storage.stream)
+    elif filename.endswith('.xlsx'):
+        rows = _read_xlsx(file_storage.stream)
+    else:
+        raise InvalidImportFile('Upload a .csv or .xlsx file.')
+
+    header = [str(h or '').strip().lower() for h in next(rows, [])]
+    missing = [c for c in REQUIRED if c not in header]
+    if missing:
+        raise InvalidImportFile(f"Missing column(s): {', '.join(missing)}")
+
+    for line, values in enumerate(rows, 2):
+        record = dict(zip(header, values))
+        if any(v not in (None, '') for v in record.values()):
+            yield line, record
+
+def _read_csv(stream):
+    # utf-8-sig swallows the BOM Excel puts in front of "CSV UTF-8" files
+    try:
+        yield from csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    except UnicodeDecodeError:
+        raise InvalidImportFile('The CSV is not UTF-8. In Excel, save it as "CSV UTF-8".')
+
+def _read_xlsx(stream):
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except zipfile.BadZipFile:
+        raise InvalidImportFile('The file is not a valid .xlsx workbook.')
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def parse_bool(value, default):
+    """Yes/no cell or form value; blank means `default`. Also used by pricing.py."""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text == '':
+        return default
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"expected yes/no, got {value!r}")
+
+def validate(record):
+    """Return `(clean_row, None)` or `(None, error message)` for one raw record."""
+    try:
+        name = str(record.get('name') or '').strip()
+        category = str(record.get('category') or '').strip()
+        if not name:
+            raise ValueError('name is required')
+        if len(name) > 100:
+            raise ValueError('name is longer than 100 characters')
+        if not category:
+            raise ValueError('category is required')
+        if len(category) > 50:
+            raise ValueError('category is longer than 50 characters')
+
+        try:
+            price = Decimal(str(record.get('price')).strip())
+        except (InvalidOperation, AttributeError):
+            raise ValueError(f"invalid price {record.get('price')!r}")
+        if not price.is_finite() or price < 0:
+            raise ValueError(f"invalid price {record.get('price')!r}")
+        if price >= MAX_PRICE or price.quantize(Decimal('0.01'), ROUND_HALF_UP) >= MAX_PRICE:
+            raise ValueError(f"price {record.get('price')!r} is too large")
+
+        stock_raw = record.get('stock_quantity')
+        try:
+            stock = Decimal(str(stock_raw).strip()) if stock_raw not in (None, '') else Decimal(0)
+        except InvalidOperation:
+            raise ValueError(f"invalid stock_quantity {stock_raw!r}")
+        if not stock.is_finite():
+            raise ValueError(f"invalid stock_quantity {stock_raw!r}")
+        if stock != stock.to_integral_value(): # 2.5 units is a typo, not 2
+            raise ValueError(f"stock_quantity {stock_raw!r} is not a whole number")
+        stock = int(stock)
+        if stock < 0:
+            raise ValueError('stock_quantity cannot be negative')
+        if stock > MAX_STOCK:
+            raise ValueError(f"stock_quantity {stock_raw!r} is too large")
+
+        managed = parse_bool(record.get('is_inventory_managed'), False)
+        active = parse_bool(record.get('is_active'), True)
+
+        # Excel turns long barcodes into numbers; 8991234500017.0 -> '8991234500017'
+        sku_raw = record.get('sku')
+        if isinstance(sku_raw, float) and sku_raw.is_integer():
+            sku_raw = int(sku_raw)
+        sku = str(sku_raw).strip() if sku_raw is not None else ''
+        if len(sku) > 64:
+            raise ValueError('sku is longer than 64 characters')
+    except ValueError as e:
+        return None, str(e)
+
+    return (name, category, price, managed, stock, active, sku or None), None
+
+def import_products(db_conn, records):
+    """
+    Validate `(line, record)` pairs in one streaming pass, then upsert every
+    valid row in a single transaction: rows are COPYed into a temp staging
+    table and merged into `products` with set-based statements.
+    Products are matched on their SKU when the row has one, otherwise on
+    their name (case-insensitive) when only one product has it. Categories
+    are matched case-insensitively too; unknown ones are created.
+
+    Returns {'inserted': [ids], 'updated': [ids], 'errors': [(line, message)]}.
+    """
+    errors = []
+    seen = {}
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    for line, record in records:
+        row, error = validate(record)
+        key = None
+        if error is None:
+            key = ('sku', row[6]) if row[6] else ('name', row[0].lower())
+            if key in seen:
+                error = f"duplicate of line {seen[key]}"
+        if error:
+            errors.append((line, error))
+            continue
+        seen[key] = line
+        writer.writerow((line,) + row)
+
+    if not seen:
+        return {'inserted': [], 'updated': [], 'errors': errors}
+
+    buffer.seek(0)
+    cursor = db_conn.cursor()
+    try:
+        cursor.execute("""
+            CREATE TEMP TABLE product_import (
+                line INTEGER, name VARCHAR(100), category VARCHAR(50), price DECIMAL(15, 2),
+                is_inventory_managed BOOLEAN, stock_quantity INTEGER, is_active BOOLEAN, sku VARCHAR(64),
+                product_id INTEGER, category_id INTEGER
+            ) ON COMMIT DROP
+        """)
+        cursor.copy_expert("COPY product_import (line, name, category, price, is_inventory_managed, "
+                           "stock_quantity, is_active, sku) FROM STDIN WITH (FORMAT csv)", buffer)
+
+        # Which product each row updates: same SKU, else same name (but never
+        # one that already has a different SKU)
+        cursor.execute("""
+            UPDATE product_import s SET product_id = p.id
+            FROM products p
+            WHERE s.sku IS NOT NULL AND p.sku = s.sku
+        """)
+        # Names aren't unique: a row whose name fits several products is an error, not a guess
+        cursor.execute("""
+            DELETE FROM product_import s
+            USING (
+                SELECT s.line, count(*) AS matches
+                FROM product_import s
+                JOIN products p ON lower(p.name) = lower(s.name) AND (s.sku IS NULL OR p.sku IS NULL)
+                WHERE s.product_id IS NULL
+                GROUP BY s.line
+                HAVING count(*) > 1
+            ) a
+            WHERE s.line = a.line
+            RETURNING s.line, s.name, a.matches
+        """)
+        errors.extend((r['line'], f"{r['matches']} products are named {r['name']!r}, add a SKU to tell them apart")
+                      for r in cursor.fetchall())
+        cursor.execute("""
+            UPDATE product_import s SET product_id = p.id
+            FROM products p
+            WHERE s.product_id IS NULL AND lower(p.name) = lower(s.name)
+              AND (s.sku IS NULL OR p.sku IS NULL)
+        """)
+        # Two rows (one by SKU, one by name) may still land on the same product
+        cursor.execute("""
+            DELETE FROM product_import s
+            USING (
+                SELECT product_id, min(line) AS line FROM product_import
+                WHERE product_id IS NOT NULL GROUP BY product_id
+            ) first
+            WHERE s.product_id = first.product_id AND s.line > first.line
+            RETURNING s.line, first.line AS first_line
+        """)
+        errors.extend((r['line'], f"updates the same product as line {r['first_line']}") for r in cursor.fetchall())
+        errors.sort()
+
+        # "coffee" in the file is the existing "Coffee"; a new category is
+        # created with the spelling of its first row
+        cursor.execute("""
+            INSERT INTO categories (name)
+            SELECT DISTINCT ON (lower(s.category)) s.category FROM product_import s
+            WHERE NOT EXISTS (SELECT 1 FROM categories c WHERE lower(c.name) = lower(s.category))
+            ORDER BY lower(s.category), s.line
+            ON CONFLICT (name) DO NOTHING
+        """)
+        cursor.execute("""
+            UPDATE product_import s SET category_id = (
+                SELECT c.id FROM categories c WHERE lower(c.name) = lower(s.category)
+                ORDER BY c.name <> s.category, c.id LIMIT 1
+            )
+        """)
+
+        cursor.execute("""
+            UPDATE products p
+            SET name = s.name, sku = COALESCE(s.sku, p.sku), category_id = s.category_id, price = s.price,
+                is_inventory_managed = s.is_inventory_managed, stock_quantity = s.stock_quantity,
+                is_active = s.is_active
+            FROM product_import s
+            WHERE p.id = s.product_id
+            RETURNING p.id
+        """)
+        updated = [r['id'] for r in cursor.fetchall()]
+
+        cursor.execute("""
+            INSERT INTO products (category_id, name, sku, price, is_inventory_managed, stock_quantity, is_active)
+            SELECT s.category_id, s.name, s.sku, s.price, s.is_inventory_managed, s.stock_quantity, s.is_active
+            FROM product_import s
+            WHERE s.product_id IS NULL
+            ORDER BY s.line
+            RETURNING id
+        """)
+        inserted = [r['id'] for r in cursor.fetchall()]
+
+        db_conn.commit()
+    except Exception as e:
+        db_conn.rollback()
+        raise e
+
+    return {'inserted': inserted, 'updated': updated, 'errors': errors}
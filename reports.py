@@ -0,0 +1,138 @@
+import click
+import db
+
+# Both statements are applied inside the caller's transaction, so a rollup can
+# never disagree with the orders it summarizes. `sign` is +1 when an order is
+# paid and -1 when it is voided. Rows are upserted in key order so concurrent
+# checkouts touching the same rollup rows lock them in the same order.
+RECORD_DAILY_SALES_SQL = """
+    INSERT INTO daily_sales (sale_date, sale_hour, user_id, payment_method, order_count, total_amount, tax_amount)
+    SELECT o.created_at::date, EXTRACT(HOUR FROM o.created_at), o.user_id, o.payment_method,
+           %(sign)s * COUNT(*), %(sign)s * SUM(o.total_amount), %(sign)s * SUM(o.tax_amount)
+    FROM orders o
+    WHERE {where}
+    GROUP BY 1, 2, 3, 4
+    ORDER BY 1, 2, 3, 4
+    ON CONFLICT (sale_date, sale_hour, user_id, payment_method) DO UPDATE SET
+        order_count = daily_sales.order_count + EXCLUDED.order_count,
+        total_amount = daily_sales.total_amount + EXCLUDED.total_amount,
+        tax_amount = daily_sales.tax_amount + EXCLUDED.tax_amount
+"""
+
+RECORD_PRODUCT_SALES_SQL = """
+    INSERT INTO daily_product_sales (sale_date, product_id, product_name_snapshot, price_snapshot, quantity, subtotal)
+    SELECT o.created_at::date, oi.product_id, oi.product_name_snapshot, oi.price_snapshot,
+           %(sign)s * SUM(oi.quantity), %(sign)s * SUM(oi.subtotal)
+    FROM order_items oi
+    JOIN orders o ON o.id = oi.order_id AND o.created_at = oi.order_created_at
+    WHERE {where}
+    GROUP BY 1, 2, 3, 4
+    ORDER BY 1, 2, 3, 4
+    ON CONFLICT (sale_date, product_id, product_name_snapshot, price_snapshot) DO UPDATE SET
+        quantity = daily_product_sales.quantity + EXCLUDED.quantity,
+        subtotal = daily_product_sales.subtotal + EXCLUDED.subtotal
+"""
+
+def record_orders(cursor, order_ids, sign=1, created=None):
+    """
+    Add (sign=1) or reverse (sign=-1) orders in the rollup tables. Does not commit.
+
+    `created` are the orders' created_at values: bounding both tables by them
+    lets the planner skip every other month's partitions.
+    """
+    for sql, params in record_statements(order_ids, sign, created):
+        cursor.execute(sql, params)
+
+def record_statements(order_ids, sign=1, created=None):
+    """The (sql, params) pairs `record_orders` runs; services_async awaits the same ones."""
+    params = {'order_ids': list(order_ids), 'sign': sign}
+    where = "o.id = ANY(%(order_ids)s)"
+    items_where = where
+    if created:
+        params.update(first_at=min(created), last_at=max(created))
+        where += " AND o.created_at BETWEEN %(first_at)s AND %(last_at)s"
+        items_where = where + " AND oi.order_created_at BETWEEN %(first_at)s AND %(last_at)s"
+    return [(RECORD_DAILY_SALES_SQL.format(where=where), params),
+            (RECORD_PRODUCT_SALES_SQL.format(where=items_where), params)]
+
+def rebuild(db_conn):
+    """Recompute both rollups from the orders (after a restore or a manual data fix); archived months are kept."""
+    cursor = db_conn.cursor()
+    try:
+        # Block checkouts/voids meanwhile so nothing is counted twice or missed
+        cursor.execute("LOCK TABLE orders IN SHARE MODE")
+        # Archived months (partitions.py) have no orders left to recount; their rollups stay
+        for table in ('daily_sales', 'daily_product_sales'):
+            cursor.execute(f"""DELETE FROM {table} WHERE date_trunc('month', sale_date)::date
+                               NOT IN (SELECT month FROM order_archives)""")
+        params = {'sign': 1}
+        cursor.execute(RECORD_DAILY_SALES_SQL.format(where="o.status = 'paid'"), params)
+        cursor.execute(RECORD_PRODUCT_SALES_SQL.format(where="o.status = 'paid'"), params)
+        cursor.execute("SELECT COUNT(*) AS count FROM orders WHERE status = 'paid'")
+        count = cursor.fetchone()['count']
+        db_conn.commit()
+        return count
+    except Exception as e:
+        db_conn.rollback()
+        raise e
+
+def sales_summary(db_conn, date_from, date_to, group_by='day'):
+    """Revenue and tax per day / cashier / payment method between two dates (inclusive)."""
+    group_columns = {
+        'day': ("ds.sale_date", "ds.sale_date AS key"),
+        'cashier': ("u.username", "u.username AS key"),
+        'payment_method': ("ds.payment_method", "ds.payment_method AS key"),
+    }
+    group_expr, select_expr = group_columns[group_by]
+
+    with db_conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT {select_expr},
+                   SUM(ds.order_count) AS order_count,
+                   SUM(ds.total_amount) AS total_amount,
+                   SUM(ds.tax_amount) AS tax_amount,
+                   SUM(ds.total_amount - ds.tax_amount) AS net_amount
+            FROM daily_sales ds
+            JOIN users u ON u.id = ds.user_id
+            WHERE ds.sale_date BETWEEN %s AND %s
+            GROUP BY {group_expr}
+            ORDER BY {group_expr}
+        """, (date_from, date_to))
+        return cur.fetchall()
+
+def top_products(db_conn, date_from, date_to, limit=10, order_by='subtotal'):
+    order_column = 'quantity' if order_by == 'quantity' else 'subtotal'
+    with db_conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT product_id, product_name_snapshot AS name,
+                   SUM(quantity) AS quantity, SUM(subtotal) AS subtotal
+            FROM daily_product_sales
+            WHERE sale_date BETWEEN %s AND %s
+            GROUP BY product_id, product_name_snapshot
+            HAVING SUM(quantity) > 0
+            ORDER BY {order_column} DESC
+            LIMIT %s
+        """, (date_from, date_to, limit))
+        return cur.fetchall()
+
+def hourly_heatmap(db_conn, date_from, date_to):
+    """Order count and revenue per (ISO weekday 1-7, hour 0-23)."""
+    with db_conn.cursor() as cur:
+        cur.execute("""
+            SELECT EXTRACT(ISODOW FROM sale_date)::int AS weekday, sale_hour AS hour,
+                   SUM(order_count) AS order_count, SUM(total_amount) AS total_amount
+            FROM daily_sales
+            WHERE sale_date BETWEEN %s AND %s
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """, (date_from, date_to))
+        return cur.fetchall()
+
+@click.command('rebuild-reports')
+def rebuild_reports_command():
+    """Recompute the daily_sales / daily_product_sales rollups from orders."""
+    count = rebuild(db.get_db())
+    click.echo(f'Rebuilt sales rollups from {count} paid orders.')
+
+def init_app(app):
+    app.cli.add_command(rebuild_reports_command)
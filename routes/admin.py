@@ -1,38 +1,173 @@
-from flask import Blueprint, render_template, request, g, redirect, url_for, flash, session, current_app
+from flask import Blueprint, render_template, request, g, redirect, url_for, flash, session, current_app, Response, stream_with_context, abort
 from decorators import login_required, admin_required
 import db
+import catalog
+import events
+import exports
+import images
+import product_import
+import metrics
 import services
+import hmac
 import os
-from werkzeug.utils import secure_filename
+import datetime
+import psycopg2
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
+def _save_uploaded_image():
+    """
+    Store the form's `image` upload (content-addressed + WebP thumbnail).
+    Returns `(image_url, thumbnail_url)`, or None when no usable file was sent.
+    """
+    file = request.files.get('image')
+    if not file or file.filename == '' or not images.allowed_file(file.filename):
+        return None
+
+    # Note: Di app.py config UPLOAD_FOLDER biasanya 'static/uploads'
+    # Kita simpan string 'uploads/<hash>.jpg' agar di HTML bisa panggil static
+    upload_dir = os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
+    return images.save_product_image(file, upload_dir, current_app.config['THUMBNAIL_SIZE'])
 
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def _sku_from_form():
+    """Barcode/SKU field; blank means none (kitchen items)."""
+    sku = request.form.get('sku', '').strip()
+    return sku or None
+
+def _encode_cursor(row):
+    return f"{row['created_at'].isoformat()}_{row['id']}"
+
+def _decode_cursor(value):
+    """'2024-01-31T10:15:00.123456_42' -> (datetime, 42), or None if malformed."""
+    try:
+        created_at, order_id = value.rsplit('_', 1)
+        return datetime.datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, AttributeError):
+        return None
+
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
 
 @bp.route('/dashboard')
 @admin_required
 def dashboard():
+    """
+    Transaction list with keyset pagination on (created_at, id).
+
+    `?before=<cursor>` pages to older orders, `?after=<cursor>` to newer ones;
+    each page is one index range scan of `page_size + 1` rows, however much
+    history there is. Optional filters: date_from, date_to, cashier, status.
+    """
     database = db.get_db()
+    page_size = current_app.config['DASHBOARD_PAGE_SIZE']
+
+    filters = {
+        'date_from': _parse_date(request.args.get('date_from')),
+        'date_to': _parse_date(request.args.get('date_to')),
+        'cashier': request.args.get('cashier', type=int),
+        'status': request.args.get('status') if request.args.get('status') in ('paid', 'cancelled') else None,
+    }
+
+    conditions = []
+    params = []
+    if filters['date_from']:
+        conditions.append("o.created_at >= %s")
+        params.append(filters['date_from'])
+    if filters['date_to']:
+        # Inclusive end date
+        conditions.append("o.created_at < %s")
+        params.append(filters['date_to'] + datetime.timedelta(days=1))
+    if filters['cashier']:
+        conditions.append("o.user_id = %s")
+        params.append(filters['cashier'])
+    if filters['status']:
+        conditions.append("o.status = %s")
+        params.append(filters['status'])
+
+    before = _decode_cursor(request.args.get('before'))
+    after = _decode_cursor(request.args.get('after')) if before is None else None
+    if before:
+        conditions.append("(o.created_at, o.id) < (%s, %s)")
+        params.extend(before)
+    elif after:
+        conditions.append("(o.created_at, o.id) > (%s, %s)")
+        params.extend(after)
 
-    # Reports: Fetch all transactions
-    # Menggunakan Cursor Context Manager
-    query = """
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    # Paging towards newer orders walks the index the other way, then flips the page
+    direction = "ASC" if after else "DESC"
+
+    query = f"""
         SELECT o.id, o.transaction_code, o.total_amount, o.status, o.created_at, u.username as cashier_name
         FROM orders o
         JOIN users u ON o.user_id = u.id
-        ORDER BY o.created_at DESC
+        {where}
+        ORDER BY o.created_at {direction}, o.id {direction}
+        LIMIT %s
     """
-    
-    # PERBAIKAN: Pakai Cursor
+    params.append(page_size + 1)
+
     with database.cursor() as cur:
-        cur.execute(query)
+        cur.execute(query, tuple(params))
         orders = cur.fetchall()
 
-    return render_template('admin/dashboard.html', orders=orders)
+        cur.execute("SELECT id, username FROM users ORDER BY username")
+        cashiers = cur.fetchall()
+
+    has_more = len(orders) > page_size
+    orders = orders[:page_size]
+    if after:
+        orders.reverse()
+
+    # Older page exists if we were cut off (or came from an older page); newer if we paged at all
+    older_cursor = newer_cursor = None
+    if orders:
+        if has_more or after:
+            older_cursor = _encode_cursor(orders[-1])
+        if before or (after and has_more):
+            newer_cursor = _encode_cursor(orders[0])
+
+    filter_args = {k: v for k, v in request.args.items() if k in filters and v}
+
+    return render_template('admin/dashboard.html', orders=orders, cashiers=cashiers,
+                           filters=filters, filter_args=filter_args,
+                           older_cursor=older_cursor, newer_cursor=newer_cursor)
+
+@bp.route('/export/<kind>.<fmt>')
+@admin_required
+def export(kind, fmt):
+    """
+    Stream orders or order items (with name/price snapshots) between
+    ?date_from and ?date_to (inclusive) as CSV or XLSX.
+    """
+    if kind not in exports.EXPORTS or fmt not in ('csv', 'xlsx'):
+        abort(404)
+
+    date_from = _parse_date(request.args.get('date_from'))
+    date_to = _parse_date(request.args.get('date_to'))
+    if not date_from or not date_to or date_from > date_to:
+        flash('Choose a valid date range to export.', 'error')
+        return redirect(url_for('admin.dashboard'))
+
+    columns = exports.EXPORTS[kind]['columns']
+    rows = exports.iter_rows(db.get_db(), kind, date_from, date_to + datetime.timedelta(days=1))
+    filename = f"{kind}_{date_from.isoformat()}_{date_to.isoformat()}.{fmt}"
+
+    if fmt == 'csv':
+        body = exports.stream_csv(columns, rows)
+        mimetype = 'text/csv'
+    else:
+        body = exports.stream_xlsx(columns, rows, title=kind.capitalize())
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    # stream_with_context keeps the request (and its DB connection) alive until the last chunk
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no',
+    })
 
 @bp.route('/products')
 @admin_required
@@ -60,45 +195,76 @@ def products():
 @admin_required
 def add_product():
     name = request.form['name']
+    sku = _sku_from_form()
     category_id = request.form['category_id']
     price = request.form['price']
     is_inventory_managed = 'is_inventory_managed' in request.form
     stock_quantity = request.form.get('stock_quantity', 0)
 
-    image_url = ''
-    if 'image' in request.files:
-        file = request.files['image']
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            upload_folder = current_app.config['UPLOAD_FOLDER']
-            
-            # Ensure upload folder exists
-            os.makedirs(os.path.join(current_app.root_path, upload_folder), exist_ok=True)
-
-            filepath = os.path.join(current_app.root_path, upload_folder, filename)
-            file.save(filepath)
-            
-            # Store relative path for frontend (e.g. 'uploads/foto.jpg')
-            # Note: Di app.py config UPLOAD_FOLDER biasanya 'static/uploads'
-            # Kita simpan string 'uploads/filename' agar di HTML bisa panggil static
-            image_url = f"uploads/{filename}"
+    image_url, thumbnail_url = '', None
+    try:
+        saved = _save_uploaded_image()
+    except images.InvalidImage as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.products'))
+    if saved:
+        image_url, thumbnail_url = saved
 
     database = db.get_db()
     
     # PERBAIKAN: Pakai Cursor + Commit
-    with database.cursor() as cur:
-        cur.execute(
-            "INSERT INTO products (name, category_id, price, is_inventory_managed, stock_quantity, image_url) VALUES (%s, %s, %s, %s, %s, %s)",
-            (name, category_id, price, is_inventory_managed, stock_quantity, image_url)
-        )
-        database.commit()
-        
+    try:
+        with database.cursor() as cur:
+            cur.execute(
+                "INSERT INTO products (name, sku, category_id, price, is_inventory_managed, stock_quantity, image_url, thumbnail_url) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
+                (name, sku, category_id, price, is_inventory_managed, stock_quantity, image_url, thumbnail_url)
+            )
+            product_id = cur.fetchone()['id']
+            database.commit()
+    except psycopg2.errors.UniqueViolation:
+        database.rollback()
+        flash(f'SKU {sku} is already used by another product.', 'error')
+        return redirect(url_for('admin.products'))
+
+    catalog.invalidate([product_id])
+    events.broker.publish('catalog', {'products': [product_id]})
+
+    return redirect(url_for('admin.products'))
+
+@bp.route('/products/import', methods=['POST'])
+@admin_required
+def import_products():
+    """Bulk insert/update products from a CSV or XLSX upload (one transaction)."""
+    file = request.files.get('file')
+    if not file or file.filename == '':
+        flash('Choose a CSV or XLSX file to import.', 'error')
+        return redirect(url_for('admin.products'))
+
+    try:
+        result = product_import.import_products(db.get_db(), product_import.read_rows(file))
+    except product_import.InvalidImportFile as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.products'))
+
+    if result['inserted'] or result['updated']:
+        # The import may also have created categories, so reload the whole catalog
+        catalog.invalidate()
+        events.broker.publish('catalog', {'products': result['inserted'] + result['updated']})
+
+    flash(f"Import finished: {len(result['inserted'])} added, {len(result['updated'])} updated, "
+          f"{len(result['errors'])} row(s) skipped.", 'success' if not result['errors'] else 'error')
+    for line, message in result['errors'][:20]:
+        flash(f"Line {line}: {message}", 'error')
+    if len(result['errors']) > 20:
+        flash(f"...and {len(result['errors']) - 20} more row errors.", 'error')
+
     return redirect(url_for('admin.products'))
 
 @bp.route('/products/edit/<int:id>', methods=['POST'])
 @admin_required
 def edit_product(id):
     name = request.form['name']
+    sku = _sku_from_form()
     category_id = request.form['category_id']
     price = request.form['price']
     is_inventory_managed = 'is_inventory_managed' in request.form
@@ -109,33 +275,36 @@ def edit_product(id):
 
     # Handle Image Upload
     update_image_sql = ""
-    params = [name, category_id, price, is_inventory_managed, stock_quantity, is_active]
-
-    if 'image' in request.files:
-        file = request.files['image']
-        if file and file.filename != '' and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            upload_folder = current_app.config['UPLOAD_FOLDER']
-            os.makedirs(os.path.join(current_app.root_path, upload_folder), exist_ok=True)
+    params = [name, sku, category_id, price, is_inventory_managed, stock_quantity, is_active]
 
-            filepath = os.path.join(current_app.root_path, upload_folder, filename)
-            file.save(filepath)
-
-            image_url = f"uploads/{filename}"
-            update_image_sql = ", image_url=%s"
-            params.append(image_url)
+    try:
+        saved = _save_uploaded_image()
+    except images.InvalidImage as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.products'))
+    if saved:
+        update_image_sql = ", image_url=%s, thumbnail_url=%s"
+        params.extend(saved)
 
     params.append(id)
 
     query = f"""UPDATE products 
-            SET name=%s, category_id=%s, price=%s, is_inventory_managed=%s, stock_quantity=%s, is_active=%s {update_image_sql}
+            SET name=%s, sku=%s, category_id=%s, price=%s, is_inventory_managed=%s, stock_quantity=%s, is_active=%s {update_image_sql}
             WHERE id=%s"""
 
     # PERBAIKAN: Pakai Cursor + Commit
-    with database.cursor() as cur:
-        cur.execute(query, tuple(params))
-        database.commit()
-        
+    try:
+        with database.cursor() as cur:
+            cur.execute(query, tuple(params))
+            database.commit()
+    except psycopg2.errors.UniqueViolation:
+        database.rollback()
+        flash(f'SKU {sku} is already used by another product.', 'error')
+        return redirect(url_for('admin.products'))
+
+    catalog.invalidate([id])
+    events.broker.publish('catalog', {'products': [id]})
+
     return redirect(url_for('admin.products'))
 
 @bp.route('/void/<int:order_id>', methods=['POST'])
@@ -150,4 +319,57 @@ def void_transaction(order_id):
     except Exception as e:
         flash(f'Error voiding order: {str(e)}', 'error')
 
-    return redirect(url_for('admin.dashboard'))
\ No newline at end of file
+    return redirect(url_for('admin.dashboard'))
+
+@bp.route('/void/bulk', methods=['POST'])
+@admin_required
+def void_bulk():
+    """
+    Void the ticked orders (`order_ids`), or with `scope=filter` every paid
+    order matching the dashboard's date / cashier filter, in one transaction.
+    """
+    database = db.get_db()
+    filter_args = {k: request.form[k] for k in ('date_from', 'date_to', 'cashier', 'status') if request.form.get(k)}
+
+    if request.form.get('scope') == 'filter':
+        criteria = {
+            'date_from': _parse_date(request.form.get('date_from')),
+            'date_to': _parse_date(request.form.get('date_to')),
+            'cashier': request.form.get('cashier', type=int),
+        }
+    else:
+        criteria = {'order_ids': request.form.getlist('order_ids', type=int)}
+
+    try:
+        summary = services.void_orders(
+            database, session['user_id'], reason=request.form.get('reason') or None,
+            max_orders=current_app.config['VOID_BATCH_MAX'], **criteria
+        )
+        restocked_units = sum(quantity for _, quantity in summary['restocked'])
+        flash(f"Voided {summary['voided']} orders (total {summary['total_amount']}), "
+              f"restocked {restocked_units} units. Audit batch #{summary['batch_id']}.", 'success')
+    except Exception as e:
+        flash(f'Error voiding orders: {str(e)}', 'error')
+
+    return redirect(url_for('admin.dashboard', **filter_args))
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """
+    Prometheus scrape endpoint. Admin session, or `Authorization: Bearer
+    <METRICS_TOKEN>` so a scraper doesn't need to log in.
+    """
+    token = current_app.config['METRICS_TOKEN']
+    sent = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(sent.encode(), f'Bearer {token}'.encode())):
+        if g.user is None:
+            return redirect(url_for('auth.login'))
+        if g.user['role_name'] != 'admin':
+            abort(403)
+
+    pool = current_app.extensions.get('db_pool')
+    body = metrics.registry.render(
+        pool_stats=pool.stats() if pool is not None else None,
+        sse_clients=events.broker.client_count(),
+    )
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,55 +1,127 @@
-from flask import Blueprint, jsonify, request, g, session
-from decorators import login_required
+from flask import Blueprint, jsonify, request, g, session, current_app, Response
+from decorators import login_required, admin_required
 import db
+import catalog
+import events
+import metrics
+import pricing
 import services
+import psycopg2
 import datetime
-import uuid
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
 @bp.route('/products', methods=['GET'])
 @login_required
 def get_products():
+    """
+    POS catalog. Supports conditional GET (ETag / If-None-Match -> 304) and a
+    delta mode: `?since=<version>` returns only the products that changed
+    (plus `removed` ids) since the `version` the till already has.
+    """
     database = db.get_db()
-    
-    # PERBAIKAN: Pakai Cursor Context Manager
-    with database.cursor() as cur:
-        # Fetch categories
-        cur.execute("SELECT id, name FROM categories")
-        categories = cur.fetchall()
-
-        # Fetch active products
-        cur.execute("""
-            SELECT p.id, p.category_id, p.name, p.price, p.is_inventory_managed, p.stock_quantity, p.image_url, c.name as category_name
-            FROM products p
-            JOIN categories c ON p.category_id = c.id
-            WHERE p.is_active = TRUE
-        """)
-        products = cur.fetchall()
-
-    # Format data untuk JSON
-    products_list = []
-    for p in products:
-        products_list.append({
-            'id': p['id'],
-            'category_id': p['category_id'],
-            'category_name': p['category_name'],
-            'name': p['name'],
-            'price': float(p['price']),
-            'is_inventory_managed': bool(p['is_inventory_managed']),
-            'stock_quantity': p['stock_quantity'],
-            'image_url': p['image_url']
-        })
+    max_age = current_app.config['CATALOG_CACHE_TTL']
 
-    return jsonify({
-        'products': products_list,
-        # List comprehension aman karena RealDictCursor return dict
-        'categories': [{'id': c['id'], 'name': c['name']} for c in categories]
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({'error': 'Invalid since version'}), 400
+
+        delta = catalog.cache.delta(database, since, max_age=max_age)
+        if delta is not None:
+            version, body = delta
+            return _catalog_response(version, body, etag=f"catalog-{version}-since-{since}")
+        # Unknown/expired version -> fall through to the full catalog
+
+    # Served from the in-process catalog cache; the DB is only hit after a change
+    version, body = catalog.cache.get(database, max_age=max_age)
+    return _catalog_response(version, body, etag=f"catalog-{version}")
+
+def _catalog_response(version, body, etag):
+    response = current_app.response_class(body, mimetype='application/json')
+    response.headers['X-Catalog-Version'] = str(version)
+    # Always revalidate, but let an unchanged catalog come back as a body-less 304
+    response.cache_control.no_cache = True
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+@bp.route('/products/search', methods=['GET'])
+@login_required
+def search_products():
+    """POS search box: `?q=<text>[&limit=n]`, matched on SKU and name."""
+    term = request.args.get('q', '')
+    limit = _search_limit(request.args, current_app.config)
+    if limit is None:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    return jsonify({'query': term, 'products': catalog.search(db.get_db(), term, limit)})
+
+@bp.route('/products/barcode/<path:code>', methods=['GET'])
+@login_required
+def lookup_barcode(code):
+    """Barcode scanners: the active product with this SKU, or 404."""
+    product = catalog.find_by_sku(db.get_db(), code.strip())
+    if product is None:
+        return jsonify({'error': 'Unknown barcode'}), 404
+    return jsonify(product)
+
+def _search_limit(args, config):
+    """`?limit=` clamped to 1..PRODUCT_SEARCH_MAX, or None if it isn't a number."""
+    try:
+        limit = int(args.get('limit', config['PRODUCT_SEARCH_LIMIT']))
+    except ValueError:
+        return None
+    return max(1, min(limit, config['PRODUCT_SEARCH_MAX']))
+
+@bp.route('/stream', methods=['GET'])
+@login_required
+def stream():
+    """
+    Server-Sent Events feed of stock changes for POS terminals.
+
+    `stock` events carry `[[product_id, stock_quantity], ...]`; `catalog` and
+    `resync` events tell the till to run a delta sync instead.
+    """
+    sub = events.broker.subscribe(maxsize=current_app.config['STREAM_BUFFER_SIZE'],
+                                  limit=current_app.config['STREAM_MAX_CLIENTS'])
+    if sub is None:
+        # Every stream holds a server thread; past the cap checkouts would queue
+        # behind them. EventSource gives up on a 503 and the till polls instead.
+        return jsonify({'error': 'Too many open streams, poll instead'}), 503, {'Retry-After': '60'}
+    heartbeat = current_app.config['STREAM_HEARTBEAT']
+
+    # Not wrapped in stream_with_context on purpose: the request (and its pooled
+    # DB connection) is released as soon as this view returns.
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                batch = sub.get(timeout=heartbeat)
+                if not batch:
+                    if sub.closed:
+                        return # Server shutting down
+                    yield ': keep-alive\n\n'
+                    continue
+                for event, data in batch:
+                    yield events.format_sse(event, data)
+        finally:
+            events.broker.unsubscribe(sub)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
     })
 
 @bp.route('/orders', methods=['POST'])
 @login_required
 def create_order():
+    """
+    Checkout. The till sends an `idempotency_key` with every order; posting
+    the same key again (a retry after a timeout, or a replay from the
+    offline queue) returns the original order instead of charging twice.
+    """
     data = request.get_json()
 
     if not data:
@@ -58,21 +130,22 @@ def create_order():
     cart_items = data.get('cart', [])
     payment_method = data.get('payment_method')
     amount_received = data.get('amount_received')
+    idempotency_key = data.get('idempotency_key') or request.headers.get('Idempotency-Key')
 
-    if not cart_items:
-        return jsonify({'error': 'Cart is empty'}), 400
+    error = _order_payload_error(cart_items, payment_method, amount_received, idempotency_key)
+    if error:
+        return jsonify({'error': error}), 400
 
-    if not payment_method or amount_received is None:
-        return jsonify({'error': 'Payment details missing'}), 400
+    try:
+        database = db.get_db()
 
-    # Generate Transaction Code
-    today_str = datetime.datetime.now().strftime('%Y%m%d')
-    random_suffix = str(uuid.uuid4().hex)[:4].upper()
-    transaction_code = f"TRX-{today_str}-{random_suffix}"
+        if idempotency_key:
+            existing = services.find_order(database, idempotency_key)
+            if existing:
+                return _replayed_order(existing)
 
-    database = db.get_db()
+        transaction_code = services.next_transaction_codes(database)[0]
 
-    try:
         # services.process_order sudah kita minta refactor sebelumnya
         # Dia akan handle cursor sendiri di dalamnya, kita cuma lempar koneksi
         order_id = services.process_order(
@@ -81,10 +154,254 @@ def create_order():
             transaction_code,
             payment_method,
             amount_received,
-            cart_items
+            cart_items,
+            idempotency_key=idempotency_key,
+            promotions=_promotions(database)
         )
         return jsonify({'success': True, 'order_id': order_id, 'transaction_code': transaction_code}), 201
+    except services.DuplicateOrder:
+        # Lost the race against a concurrent retry of the same order
+        return _replayed_order(services.find_order(database, idempotency_key))
+    except (psycopg2.OperationalError, db.PoolTimeout) as e:
+        # Not the order's fault: the till keeps it queued and tries again
+        current_app.logger.error("create_order: database unavailable: %s", e)
+        metrics.count_orders('unavailable')
+        return jsonify({'error': 'Database unavailable, please retry'}), 503
+    except Exception as e:
+        # Catat di log biar lu tau kenapa kalau gagal
+        current_app.logger.warning("create_order rejected: %s", e)
+        metrics.count_orders('rejected')
+        return jsonify({'error': str(e)}), 400
+
+@bp.route('/cart/quote', methods=['POST'])
+@login_required
+def quote_cart():
+    """
+    The till's running total: `{"cart": [...]}` (same lines as /api/orders)
+    priced by the same code and promotions as checkout, nothing is written.
+    """
+    data = request.get_json(silent=True)
+    cart_items = data.get('cart') if isinstance(data, dict) else None
+    error = _cart_error(cart_items)
+    if error:
+        return jsonify({'error': error}), 400
+
+    database = db.get_db()
+    try:
+        priced = services.quote_order(database, cart_items, _promotions(database))
+    except (psycopg2.OperationalError, db.PoolTimeout) as e:
+        current_app.logger.error("quote_cart: database unavailable: %s", e)
+        return jsonify({'error': 'Database unavailable, please retry'}), 503
     except Exception as e:
-        # Print error di terminal biar lu tau kenapa kalau gagal
-        print(f"ERROR create_order: {e}") 
-        return jsonify({'error': str(e)}), 400
\ No newline at end of file
+        return jsonify({'error': str(e)}), 400
+    return jsonify(_quote_body(priced)), 200
+
+def _promotions(database):
+    return pricing.cache.get(database, max_age=current_app.config['PROMOTIONS_CACHE_TTL'])
+
+def _cart_error(cart_items):
+    if not cart_items or not isinstance(cart_items, list):
+        return 'Cart is empty'
+    for item in cart_items:
+        if not isinstance(item, dict) or 'product_id' not in item or 'quantity' not in item:
+            return 'Invalid cart line'
+    return None
+
+def _quote_body(priced):
+    return {
+        'version': priced['pricing_version'],
+        'lines': [{
+            'product_id': item['product_id'],
+            'name': item['name_snapshot'],
+            'price': float(item['price_snapshot']),
+            'quantity': item['quantity'],
+            'discount_amount': float(item['discount_amount']),
+            'subtotal': float(item['subtotal']),
+            'promotions': item['promotions'],
+        } for item in priced['items']],
+        'subtotal': float(priced['subtotal']),
+        'discount_amount': float(priced['discount_amount']),
+        'tax_rate': float(pricing.TAX_RATE),
+        'tax_amount': float(priced['tax_amount']),
+        'grand_total': float(priced['grand_total']),
+    }
+
+@bp.route('/promotions', methods=['GET'])
+@admin_required
+def list_promotions():
+    return jsonify({'promotions': [_promotion_json(row) for row in pricing.list_promotions(db.get_db())]})
+
+@bp.route('/promotions', methods=['POST'])
+@admin_required
+def create_promotion():
+    """`{"name", "kind", "params", ...}`, the columns of the promotions table (schema.sql)."""
+    try:
+        row = pricing.save_promotion(db.get_db(), request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(_promotion_json(row)), 201
+
+@bp.route('/promotions/<int:promotion_id>', methods=['PUT'])
+@admin_required
+def update_promotion(promotion_id):
+    try:
+        row = pricing.save_promotion(db.get_db(), request.get_json(silent=True), promotion_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if row is None:
+        return jsonify({'error': 'Promotion not found'}), 404
+    return jsonify(_promotion_json(row)), 200
+
+@bp.route('/promotions/<int:promotion_id>', methods=['DELETE'])
+@admin_required
+def delete_promotion(promotion_id):
+    if not pricing.delete_promotion(db.get_db(), promotion_id):
+        return jsonify({'error': 'Promotion not found'}), 404
+    return jsonify({'success': True}), 200
+
+def _promotion_json(row):
+    # Timestamps and times as ISO strings, the format the API accepts back
+    return {key: value.isoformat() if isinstance(value, (datetime.datetime, datetime.time)) else value
+            for key, value in row.items()}
+
+@bp.route('/orders/batch', methods=['POST'])
+@login_required
+def create_orders_batch():
+    """
+    Many orders in one request (kiosk imports, offline backlogs):
+    `{"orders": [<same body as /api/orders>, ...], "chunk_size": 100, "atomic": false}`.
+
+    Orders are committed every `chunk_size` orders, each one isolated by a
+    savepoint so a bad cart doesn't sink its neighbours; `atomic: true`
+    makes it all-or-nothing. Returns one result per order, in order.
+    """
+    data = request.get_json(silent=True)
+    orders = data.get('orders') if isinstance(data, dict) else None
+
+    if not isinstance(orders, list) or not orders:
+        return jsonify({'error': 'No orders provided'}), 400
+
+    if len(orders) > current_app.config['ORDER_BATCH_MAX']:
+        return jsonify({'error': f"At most {current_app.config['ORDER_BATCH_MAX']} orders per batch"}), 413
+
+    chunk_size = data.get('chunk_size', current_app.config['ORDER_BATCH_CHUNK'])
+    if not isinstance(chunk_size, int) or isinstance(chunk_size, bool) or chunk_size < 1:
+        return jsonify({'error': 'Invalid chunk_size'}), 400
+    atomic = bool(data.get('atomic', False))
+
+    # Malformed entries are rejected here, only well-formed orders reach the database
+    results = [None] * len(orders)
+    valid, positions = [], []
+    for i, order in enumerate(orders):
+        if not isinstance(order, dict):
+            results[i] = {'success': False, 'error': 'Invalid order'}
+            continue
+        error = _order_payload_error(order.get('cart'), order.get('payment_method'),
+                                     order.get('amount_received'), order.get('idempotency_key'))
+        if error:
+            results[i] = {'success': False, 'error': error}
+            continue
+        valid.append({
+            'cart': order['cart'],
+            'payment_method': order['payment_method'],
+            'amount_received': order['amount_received'],
+            'idempotency_key': order.get('idempotency_key'),
+        })
+        positions.append(i)
+
+    if atomic and len(valid) < len(orders):
+        return jsonify({'error': 'Invalid orders in atomic batch', 'results': results}), 400
+
+    if valid:
+        # One savepoint + the order statements per order is expected here, not an N+1
+        metrics.expect_repeated_queries()
+        try:
+            database = db.get_db()
+            for order, code in zip(valid, services.next_transaction_codes(database, len(valid))):
+                order['transaction_code'] = code
+            processed = services.process_orders(
+                database, session['user_id'], valid, chunk_size=chunk_size, atomic=atomic,
+                promotions=_promotions(database)
+            )
+        except (psycopg2.OperationalError, db.PoolTimeout) as e:
+            current_app.logger.error("create_orders_batch: database unavailable: %s", e)
+            metrics.count_orders('unavailable', len(valid))
+            return jsonify({'error': 'Database unavailable, please retry'}), 503
+        for i, result in zip(positions, processed):
+            results[i] = result
+
+    succeeded = sum(1 for r in results if r['success'])
+    metrics.count_orders('replayed', sum(1 for r in results if r.get('replayed')))
+    metrics.count_orders('rejected', len(results) - succeeded)
+    return jsonify({
+        'results': results,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded
+    }), 200
+
+@bp.route('/orders/void', methods=['POST'])
+@admin_required
+def void_orders():
+    """
+    Bulk void: `{"order_ids": [...]}` or `{"date_from": "2024-05-01",
+    "date_to": "2024-05-01", "cashier": 7}`, plus an optional `reason`.
+    Returns the audit summary of `services.void_orders`.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'No data provided'}), 400
+
+    if 'order_ids' in data:
+        order_ids = data['order_ids']
+        if not isinstance(order_ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in order_ids):
+            return jsonify({'error': 'order_ids must be a list of ids'}), 400
+        criteria = {'order_ids': order_ids}
+    else:
+        try:
+            criteria = {
+                'date_from': datetime.date.fromisoformat(data['date_from']) if data.get('date_from') else None,
+                'date_to': datetime.date.fromisoformat(data['date_to']) if data.get('date_to') else None,
+                'cashier': int(data['cashier']) if data.get('cashier') else None,
+            }
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid date or cashier'}), 400
+
+    try:
+        summary = services.void_orders(
+            db.get_db(), session['user_id'], reason=data.get('reason'),
+            max_orders=current_app.config['VOID_BATCH_MAX'], **criteria
+        )
+        return jsonify(dict(summary, success=True)), 200
+    except (psycopg2.OperationalError, db.PoolTimeout) as e:
+        current_app.logger.error("void_orders: database unavailable: %s", e)
+        return jsonify({'error': 'Database unavailable, please retry'}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+def _order_payload_error(cart_items, payment_method, amount_received, idempotency_key):
+    if idempotency_key is not None and (not isinstance(idempotency_key, str) or len(idempotency_key) > 64):
+        return 'Invalid idempotency key'
+
+    if not cart_items:
+        return 'Cart is empty'
+
+    if not payment_method or amount_received is None:
+        return 'Payment details missing'
+
+    return None
+
+def _replayed_order(order):
+    if order is None:
+        metrics.count_orders('rejected')
+        return jsonify({'error': services.REPLAYED_ORDER_MISSING}), 404
+    if order['user_id'] != session['user_id']:
+        metrics.count_orders('rejected')
+        return jsonify({'error': 'Idempotency key belongs to another cashier'}), 409
+    metrics.count_orders('replayed')
+    return jsonify({
+        'success': True,
+        'order_id': order['id'],
+        'transaction_code': order['transaction_code'],
+        'status': order['status'],
+        'replayed': True
+    }), 200
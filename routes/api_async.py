@@ -0,0 +1,258 @@
+"""
+/api on asyncio (Quart + psycopg 3), served by asgi.py.
+
+Same URLs and JSON contracts as routes/api.py, but an open /api/stream or
+a request waiting on the database is a suspended coroutine instead of a
+blocked thread, so one process can hold hundreds of tills. Sessions are
+the Flask session cookie (same SECRET_KEY), so a till logged in through
+the WSGI app can talk to this one.
+"""
+import functools
+from quart import Blueprint, jsonify, request, g, session, current_app, redirect, Response
+import psycopg
+import psycopg_pool
+
+import auth
+import catalog
+import db_async
+import events
+import metrics
+import pricing
+import services
+import services_async
+from routes.api import _cart_error, _order_payload_error, _quote_body, _search_limit
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+def _identity_cache():
+    cache = current_app.extensions.get('identity_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault('identity_cache', auth.IdentityCache(
+            maxsize=current_app.config['USER_CACHE_SIZE'],
+            ttl=current_app.config['USER_CACHE_TTL'],
+        ))
+    return cache
+
+@bp.before_request
+async def load_logged_in_user():
+    """auth.load_logged_in_user, awaited."""
+    user_id = session.get('user_id')
+
+    if user_id is None:
+        g.user = None
+        return
+
+    cache = _identity_cache()
+    user = cache.get(user_id)
+    if user is None:
+        database = await db_async.get_db()
+        async with database.cursor() as cur:
+            await cur.execute(auth.IDENTITY_SQL, (user_id,))
+            user = await cur.fetchone()
+        await database.rollback() # don't hold a transaction open for the rest of the request
+        if user is not None:
+            user = dict(user)
+            cache.put(user_id, user)
+
+    g.user = user
+
+def login_required(view):
+    @functools.wraps(view)
+    async def wrapped_view(**kwargs):
+        if g.user is None:
+            return redirect('/auth/login')
+        return await view(**kwargs)
+    return wrapped_view
+
+def admin_required(view):
+    @functools.wraps(view)
+    async def wrapped_view(**kwargs):
+        if g.user is None:
+            return redirect('/auth/login')
+        if g.user['role_name'] != 'admin':
+            return jsonify({'error': 'Forbidden'}), 403
+        return await view(**kwargs)
+    return wrapped_view
+
+@bp.route('/products', methods=['GET'])
+@login_required
+async def get_products():
+    """Same as routes/api.py: ETag / 304 and `?since=<version>` deltas."""
+    database = await db_async.get_db()
+    max_age = current_app.config['CATALOG_CACHE_TTL']
+
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({'error': 'Invalid since version'}), 400
+
+        delta = await catalog.cache.delta_async(database, since, max_age=max_age)
+        if delta is not None:
+            version, body = delta
+            return await _catalog_response(version, body, etag=f"catalog-{version}-since-{since}")
+
+    version, body = await catalog.cache.get_async(database, max_age=max_age)
+    return await _catalog_response(version, body, etag=f"catalog-{version}")
+
+async def _catalog_response(version, body, etag):
+    await db_async.close_db() # catalog is in memory now; don't pin the connection
+    response = current_app.response_class(body, mimetype='application/json')
+    response.headers['X-Catalog-Version'] = str(version)
+    response.cache_control.no_cache = True
+    response.set_etag(etag)
+    await response.make_conditional(request)
+    return response
+
+@bp.route('/products/search', methods=['GET'])
+@login_required
+async def search_products():
+    """Same as routes/api.py: search by SKU and name."""
+    term = request.args.get('q', '')
+    limit = _search_limit(request.args, current_app.config)
+    if limit is None:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    products = await catalog.search_async(await db_async.get_db(), term, limit)
+    return jsonify({'query': term, 'products': products})
+
+@bp.route('/products/barcode/<path:code>', methods=['GET'])
+@login_required
+async def lookup_barcode(code):
+    product = await catalog.find_by_sku_async(await db_async.get_db(), code.strip())
+    if product is None:
+        return jsonify({'error': 'Unknown barcode'}), 404
+    return jsonify(product)
+
+@bp.route('/stream', methods=['GET'])
+@login_required
+async def stream():
+    """SSE stock feed, see routes/api.py. Each open stream is one coroutine."""
+    await db_async.close_db()
+    sub = events.broker.subscribe_async(maxsize=current_app.config['STREAM_BUFFER_SIZE'])
+    heartbeat = current_app.config['STREAM_HEARTBEAT']
+
+    async def generate():
+        try:
+            yield b'retry: 3000\n\n'
+            while True:
+                batch = await sub.get(timeout=heartbeat)
+                if not batch:
+                    if sub.closed:
+                        return
+                    yield b': keep-alive\n\n'
+                    continue
+                for event, data in batch:
+                    yield events.format_sse(event, data).encode()
+        finally:
+            events.broker.unsubscribe(sub)
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    response.timeout = None # streams stay open until the till disconnects
+    return response
+
+@bp.route('/orders', methods=['POST'])
+@login_required
+async def create_order():
+    """Checkout, with idempotent replay. Same contract as routes/api.py."""
+    data = await request.get_json(silent=True)
+
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+
+    cart_items = data.get('cart', [])
+    payment_method = data.get('payment_method')
+    amount_received = data.get('amount_received')
+    idempotency_key = data.get('idempotency_key') or request.headers.get('Idempotency-Key')
+
+    error = _order_payload_error(cart_items, payment_method, amount_received, idempotency_key)
+    if error:
+        return jsonify({'error': error}), 400
+
+    try:
+        database = await db_async.get_db()
+
+        if idempotency_key:
+            existing = await services_async.find_order(database, idempotency_key)
+            if existing:
+                return _replayed_order(existing)
+
+        transaction_code = (await services_async.next_transaction_codes(database))[0]
+        order_id = await services_async.process_order(
+            database,
+            session['user_id'],
+            transaction_code,
+            payment_method,
+            amount_received,
+            cart_items,
+            idempotency_key=idempotency_key,
+            promotions=await _promotions(database)
+        )
+        return jsonify({'success': True, 'order_id': order_id, 'transaction_code': transaction_code}), 201
+    except services.DuplicateOrder:
+        return _replayed_order(await services_async.find_order(database, idempotency_key))
+    except (psycopg.OperationalError, psycopg_pool.PoolTimeout) as e:
+        current_app.logger.error("create_order: database unavailable: %s", e)
+        metrics.count_orders('unavailable')
+        return jsonify({'error': 'Database unavailable, please retry'}), 503
+    except Exception as e:
+        current_app.logger.warning("create_order rejected: %s", e)
+        metrics.count_orders('rejected')
+        return jsonify({'error': str(e)}), 400
+
+@bp.route('/cart/quote', methods=['POST'])
+@login_required
+async def quote_cart():
+    """The till's running total, priced like checkout. Same contract as routes/api.py."""
+    data = await request.get_json(silent=True)
+    cart_items = data.get('cart') if isinstance(data, dict) else None
+    error = _cart_error(cart_items)
+    if error:
+        return jsonify({'error': error}), 400
+
+    try:
+        database = await db_async.get_db()
+        priced = await services_async.quote_order(database, cart_items, await _promotions(database))
+    except (psycopg.OperationalError, psycopg_pool.PoolTimeout) as e:
+        current_app.logger.error("quote_cart: database unavailable: %s", e)
+        return jsonify({'error': 'Database unavailable, please retry'}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(_quote_body(priced)), 200
+
+async def _promotions(database):
+    return await pricing.cache.get_async(database, max_age=current_app.config['PROMOTIONS_CACHE_TTL'])
+
+@bp.route('/orders/<int:order_id>/void', methods=['POST'])
+@admin_required
+async def void_order(order_id):
+    """JSON counterpart of the dashboard's void button (routes/admin.py)."""
+    try:
+        database = await db_async.get_db()
+        await services_async.void_order(database, order_id, session['user_id'])
+        return jsonify({'success': True, 'order_id': order_id, 'status': 'cancelled'}), 200
+    except (psycopg.OperationalError, psycopg_pool.PoolTimeout) as e:
+        current_app.logger.error("void_order: database unavailable: %s", e)
+        return jsonify({'error': 'Database unavailable, please retry'}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+def _replayed_order(order):
+    if order is None:
+        metrics.count_orders('rejected')
+        return jsonify({'error': services.REPLAYED_ORDER_MISSING}), 404
+    if order['user_id'] != session['user_id']:
+        metrics.count_orders('rejected')
+        return jsonify({'error': 'Idempotency key belongs to another cashier'}), 409
+    metrics.count_orders('replayed')
+    return jsonify({
+        'success': True,
+        'order_id': order['id'],
+        'transaction_code': order['transaction_code'],
+        'status': order['status'],
+        'replayed': True
+    }), 200
@@ -0,0 +1,86 @@
+from flask import Blueprint, jsonify, request
+from decorators import admin_required
+import db
+import reports
+import datetime
+
+bp = Blueprint('reports', __name__, url_prefix='/admin/reports')
+
+def _date_range():
+    """?date_from / ?date_to (YYYY-MM-DD, inclusive); defaults to the last 30 days."""
+    today = datetime.date.today()
+    try:
+        date_to = datetime.date.fromisoformat(request.args.get('date_to', today.isoformat()))
+        date_from = datetime.date.fromisoformat(
+            request.args.get('date_from', (date_to - datetime.timedelta(days=29)).isoformat())
+        )
+    except ValueError:
+        return None
+    return date_from, date_to
+
+def _money(value):
+    return float(value) if value is not None else 0.0
+
+@bp.route('/sales', methods=['GET'])
+@admin_required
+def sales():
+    """Revenue & tax, grouped by ?group_by=day|cashier|payment_method."""
+    date_range = _date_range()
+    group_by = request.args.get('group_by', 'day')
+    if date_range is None or group_by not in ('day', 'cashier', 'payment_method'):
+        return jsonify({'error': 'Invalid date range or group_by'}), 400
+
+    rows = reports.sales_summary(db.get_db(), *date_range, group_by=group_by)
+    result = [{
+        'key': r['key'].isoformat() if group_by == 'day' else r['key'],
+        'order_count': int(r['order_count']),
+        'total_amount': _money(r['total_amount']),
+        'tax_amount': _money(r['tax_amount']),
+        'net_amount': _money(r['net_amount']),
+    } for r in rows]
+
+    return jsonify({
+        'date_from': date_range[0].isoformat(),
+        'date_to': date_range[1].isoformat(),
+        'group_by': group_by,
+        'rows': result,
+        'totals': {
+            'order_count': sum(r['order_count'] for r in result),
+            'total_amount': round(sum(r['total_amount'] for r in result), 2),
+            'tax_amount': round(sum(r['tax_amount'] for r in result), 2),
+            'net_amount': round(sum(r['net_amount'] for r in result), 2),
+        }
+    })
+
+@bp.route('/top-products', methods=['GET'])
+@admin_required
+def top_products():
+    date_range = _date_range()
+    if date_range is None:
+        return jsonify({'error': 'Invalid date range'}), 400
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    order_by = request.args.get('order_by', 'subtotal')
+
+    rows = reports.top_products(db.get_db(), *date_range, limit=limit, order_by=order_by)
+    return jsonify({'products': [{
+        'product_id': r['product_id'],
+        'name': r['name'],
+        'quantity': int(r['quantity']),
+        'subtotal': _money(r['subtotal']),
+    } for r in rows]})
+
+@bp.route('/heatmap', methods=['GET'])
+@admin_required
+def heatmap():
+    """Orders and revenue per ISO weekday (1=Mon) x hour, for staffing decisions."""
+    date_range = _date_range()
+    if date_range is None:
+        return jsonify({'error': 'Invalid date range'}), 400
+
+    rows = reports.hourly_heatmap(db.get_db(), *date_range)
+    return jsonify({'cells': [{
+        'weekday': r['weekday'],
+        'hour': r['hour'],
+        'order_count': int(r['order_count']),
+        'total_amount': _money(r['total_amount']),
+    } for r in rows]})
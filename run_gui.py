@@ -1,20 +1,77 @@
-import webview
-from app import create_app
-import threading
+"""
+Desktop till: the app on waitress in a background thread, shown in a
+native window (pywebview). See startup.py for how the cold start is kept
+short; the phase timings are printed once the till is usable.
+"""
+import html
 import sys
+import threading
 
-# Create the Flask app
-app = create_app()
+import startup
 
-def start_server():
-    app.run(host='127.0.0.1', port=5000)
+HOST, PORT = '127.0.0.1', 5000
+URL = f'http://{HOST}:{PORT}/'
+READY_TIMEOUT = 30 # seconds to wait for the server before showing an error
 
-if __name__ == '__main__':
-    # Start Flask in a separate thread
-    t = threading.Thread(target=start_server)
-    t.daemon = True
-    t.start()
+def start_server(timer, ready, state):
+    """Server thread: import and create the app, bind, signal `ready`, then serve."""
+    try:
+        with timer.phase('import_app'):
+            from app import create_app
+            import serve
+        with timer.phase('create_app'):
+            state['app'] = create_app()
+        # waitress instead of the Werkzeug dev server: several threads with keep-alive,
+        # so the SSE stock stream and checkouts don't queue behind each other.
+        with timer.phase('bind'):
+            server = serve.make_server(state['app'], HOST, PORT)
+    except Exception as e:
+        state['error'] = e
+        return
+    finally:
+        ready.set()
+    server.run()
+
+def report(timer):
+    import metrics
+    metrics.log.info("Startup: %s", timer.summary())
+    metrics.record_startup(timer.phases)
+    print(f"CoffeePOS startup: {timer.summary()}", file=sys.stderr)
+
+def main():
+    timer = startup.StartupTimer(expected=('window_loaded', 'warmup'), on_complete=report)
+    ready, state = threading.Event(), {}
+    threading.Thread(target=start_server, args=(timer, ready, state), daemon=True).start()
+
+    # Overlaps with the server thread creating the app
+    with timer.phase('import_webview'):
+        import webview
 
-    # Create the desktop window
-    webview.create_window('CoffeePOS', 'http://127.0.0.1:5000')
+    error = None
+    ready.wait()
+    if 'error' in state:
+        error = state['error']
+    else:
+        try:
+            with timer.phase('first_response'):
+                startup.wait_until_serving(URL, timeout=READY_TIMEOUT)
+        except TimeoutError as e:
+            error = e
+
+    if error is not None:
+        print(f"CoffeePOS failed to start: {error}", file=sys.stderr)
+        webview.create_window('CoffeePOS', html=f'<h2>CoffeePOS gagal start</h2><pre>{html.escape(str(error))}</pre>')
+        webview.start()
+        return 1
+
+    threading.Thread(target=startup.warm_up, args=(state['app'], timer), daemon=True).start()
+
+    # Create the desktop window, pointing at a server that is already answering
+    window = webview.create_window('CoffeePOS', URL)
+    window.events.loaded += lambda: timer.mark('window_loaded')
+    timer.mark('window_created')
     webview.start()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,21 @@
 -- 1. AUTH & ROLES
+DROP TABLE IF EXISTS promotions;
+DROP TABLE IF EXISTS void_batches;
+DROP TABLE IF EXISTS daily_product_sales;
+DROP TABLE IF EXISTS daily_sales;
+DROP TABLE IF EXISTS order_archives;
+DROP TABLE IF EXISTS order_idempotency;
 DROP TABLE IF EXISTS order_items;
 DROP TABLE IF EXISTS orders;
+DROP FUNCTION IF EXISTS create_order_partitions(TIMESTAMP, TIMESTAMP);
+DROP FUNCTION IF EXISTS next_transaction_code();
+DROP SEQUENCE IF EXISTS transaction_code_seq;
 DROP TABLE IF EXISTS products;
 DROP TABLE IF EXISTS categories;
 DROP TABLE IF EXISTS users;
 DROP TABLE IF EXISTS roles;
+DROP FUNCTION IF EXISTS notify_product_changes();
+DROP FUNCTION IF EXISTS notify_table_changes();
 
 CREATE TABLE roles (
     id SERIAL PRIMARY KEY,
@@ -31,8 +42,10 @@ CREATE TABLE products (
     id SERIAL PRIMARY KEY,
     category_id INTEGER NOT NULL,
     name VARCHAR(100) NOT NULL,
+    sku VARCHAR(64) UNIQUE, -- Barcode (EAN/UPC) or internal code; NULL for made-to-order items
     price DECIMAL(15, 2) NOT NULL,
     image_url VARCHAR(255),
+    thumbnail_url VARCHAR(255), -- WebP tile-sized copy of image_url (see images.py)
 
     -- LOGIC:
     -- If is_inventory_managed = TRUE (e.g., Bottled Water), system strictly deducts stock_quantity.
@@ -46,30 +59,58 @@ CREATE TABLE products (
 );
 
 -- 3. ORDERS (HEADER)
+-- Transaction codes: TRX-YYYYMMDD-000123. The number comes from one global
+-- sequence, so codes never collide and nextval() never waits on another till.
+-- It keeps counting across days (gaps are normal: failed orders burn a number).
+CREATE SEQUENCE transaction_code_seq;
+
+CREATE FUNCTION next_transaction_code() RETURNS VARCHAR AS $$
+    SELECT 'TRX-' || to_char(CURRENT_TIMESTAMP, 'YYYYMMDD') || '-'
+           || lpad(nextval('transaction_code_seq')::text, 6, '0')
+$$ LANGUAGE SQL VOLATILE;
+
+-- orders and order_items are partitioned by month on the order timestamp
+-- (orders_p2025_01, order_items_p2025_01, ...), so old months can be detached
+-- and archived whole (see partitions.py). Unique keys of a partitioned table
+-- must include created_at: transaction codes are unique by construction (one
+-- sequence), idempotency keys are enforced in order_idempotency below.
 CREATE TABLE orders (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     user_id INTEGER NOT NULL, -- Cashier
-    transaction_code VARCHAR(20) NOT NULL UNIQUE, -- Generate: TRX-YYYYMMDD-XXXX
+    transaction_code VARCHAR(32) NOT NULL DEFAULT next_transaction_code(), -- TRX-YYYYMMDD-000123
     total_amount DECIMAL(15, 2) NOT NULL,
     tax_amount DECIMAL(15, 2) DEFAULT 0,
+    discount_amount DECIMAL(15, 2) NOT NULL DEFAULT 0, -- promotions, already taken off total_amount
     payment_method VARCHAR(50) NOT NULL, -- 'cash', 'qris'
     amount_received DECIMAL(15, 2),
     change_amount DECIMAL(15, 2),
     status VARCHAR(20) DEFAULT 'paid', -- 'paid', 'cancelled'
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    idempotency_key VARCHAR(64), -- Generated by the till; a retried POST returns the original order
 
     -- Void Logic
     voided_by INTEGER,
     voided_at TIMESTAMP,
 
+    PRIMARY KEY (id, created_at),
     FOREIGN KEY (user_id) REFERENCES users(id),
     FOREIGN KEY (voided_by) REFERENCES users(id)
+) PARTITION BY RANGE (created_at);
+
+-- Global uniqueness of idempotency keys (written by services.INSERT_ORDER_SQL
+-- in the same statement as the order). No foreign key, so a month can be
+-- detached; archiving a month deletes its keys.
+CREATE TABLE order_idempotency (
+    idempotency_key VARCHAR(64) PRIMARY KEY,
+    order_id INTEGER NOT NULL,
+    order_created_at TIMESTAMP NOT NULL
 );
 
 -- 4. ORDER ITEMS (SNAPSHOTS)
 CREATE TABLE order_items (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     order_id INTEGER NOT NULL,
+    order_created_at TIMESTAMP NOT NULL, -- orders.created_at, the partition key
     product_id INTEGER NOT NULL,
 
     -- CRITICAL AUDIT REQUIREMENT:
@@ -79,7 +120,194 @@ CREATE TABLE order_items (
     price_snapshot DECIMAL(15, 2) NOT NULL,
 
     quantity INTEGER NOT NULL,
-    subtotal DECIMAL(15, 2) NOT NULL,
-    FOREIGN KEY (order_id) REFERENCES orders(id),
+    subtotal DECIMAL(15, 2) NOT NULL, -- price_snapshot * quantity - discount_amount
+    discount_amount DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (id, order_created_at),
+    -- No foreign key to orders: checking one against a partitioned table
+    -- costs every checkout a lookup over all months. Lines are only written
+    -- with their order (services._insert_order) and archived with it.
+    FOREIGN KEY (product_id) REFERENCES products(id)
+) PARTITION BY RANGE (order_created_at);
+
+-- Monthly partitions for every month touching [from_ts, to_ts], both tables
+-- at once; months that already have one are skipped. Called ahead of time by
+-- partitions.ensure() and on demand when a checkout hits a missing month.
+CREATE FUNCTION create_order_partitions(from_ts TIMESTAMP, to_ts TIMESTAMP) RETURNS INTEGER AS $$
+DECLARE
+    m TIMESTAMP := date_trunc('month', from_ts);
+    created INTEGER := 0;
+BEGIN
+    -- Two tills starting a new month at once must not both create it
+    PERFORM pg_advisory_xact_lock(hashtext('create_order_partitions'));
+    WHILE m <= to_ts LOOP
+        IF to_regclass('orders_p' || to_char(m, 'YYYY_MM')) IS NULL
+           AND NOT EXISTS (SELECT 1 FROM order_archives a WHERE a.month = m::date) THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF orders FOR VALUES FROM (%L) TO (%L)',
+                           'orders_p' || to_char(m, 'YYYY_MM'), m, m + interval '1 month');
+            EXECUTE format('CREATE TABLE %I PARTITION OF order_items FOR VALUES FROM (%L) TO (%L)',
+                           'order_items_p' || to_char(m, 'YYYY_MM'), m, m + interval '1 month');
+            created := created + 1;
+        END IF;
+        m := m + interval '1 month';
+    END LOOP;
+    RETURN created;
+END
+$$ LANGUAGE plpgsql;
+
+-- Months moved out of the database by `flask partitions archive`. Their
+-- rollups stay in daily_sales / daily_product_sales; `restore` reloads them.
+CREATE TABLE order_archives (
+    month DATE PRIMARY KEY, -- first day of the month
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    order_count INTEGER NOT NULL,
+    item_count INTEGER NOT NULL,
+    orders_file VARCHAR(255) NOT NULL, -- gzip'd CSV (COPY ... WITH HEADER)
+    items_file VARCHAR(255) NOT NULL
+);
+
+SELECT create_order_partitions(LOCALTIMESTAMP::timestamp, (LOCALTIMESTAMP + interval '3 months')::timestamp);
+
+-- 5. REPORTING ROLLUPS
+-- Maintained incrementally by services.process_order / void_order (see reports.py),
+-- so revenue reports never scan orders/order_items. Only 'paid' orders are counted.
+CREATE TABLE daily_sales (
+    sale_date DATE NOT NULL,
+    sale_hour SMALLINT NOT NULL, -- 0-23, for the hourly heatmap
+    user_id INTEGER NOT NULL, -- Cashier
+    payment_method VARCHAR(50) NOT NULL,
+    order_count INTEGER NOT NULL DEFAULT 0,
+    total_amount DECIMAL(15, 2) NOT NULL DEFAULT 0, -- incl. tax, like orders.total_amount
+    tax_amount DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (sale_date, sale_hour, user_id, payment_method),
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+CREATE TABLE daily_product_sales (
+    sale_date DATE NOT NULL,
+    product_id INTEGER NOT NULL,
+    -- Keyed by the snapshot, so a renamed/repriced product reports its history correctly
+    product_name_snapshot VARCHAR(100) NOT NULL,
+    price_snapshot DECIMAL(15, 2) NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    subtotal DECIMAL(15, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (sale_date, product_id, product_name_snapshot, price_snapshot),
     FOREIGN KEY (product_id) REFERENCES products(id)
 );
+
+-- 6. BULK VOID AUDIT
+-- One row per services.void_orders call (a shift voided at once); single
+-- voids are audited by orders.voided_by / voided_at alone.
+CREATE TABLE void_batches (
+    id SERIAL PRIMARY KEY,
+    voided_by INTEGER NOT NULL,
+    voided_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    reason VARCHAR(255),
+    criteria JSONB NOT NULL, -- what was asked for: order ids, or a date/cashier filter
+    order_ids INTEGER[] NOT NULL, -- what was actually voided
+    order_count INTEGER NOT NULL,
+    total_amount DECIMAL(15, 2) NOT NULL,
+    tax_amount DECIMAL(15, 2) NOT NULL,
+    restocked JSONB NOT NULL, -- [[product_id, quantity], ...]
+    FOREIGN KEY (voided_by) REFERENCES users(id)
+);
+
+-- 7. PROMOTIONS
+-- Compiled into an in-memory rule index by pricing.py and applied by
+-- services.price_order, so checkout never evaluates them in SQL.
+CREATE TABLE promotions (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL, -- shown on the till and the receipt line
+    kind VARCHAR(20) NOT NULL, -- 'percent_off', 'buy_x_get_y', 'bundle'
+    params JSONB NOT NULL, -- per kind: {"percent": 20}, {"buy": 2, "get": 1}, {"items": [[id, qty], ...], "price": 25000}
+    -- Targets (bundles target their own items): listed products and/or a
+    -- category; neither = every product
+    product_ids INTEGER[],
+    category_id INTEGER,
+    starts_at TIMESTAMP,
+    ends_at TIMESTAMP,
+    daily_start TIME, -- Happy hour: only between these times of day (may wrap past midnight)
+    daily_end TIME,
+    priority INTEGER NOT NULL DEFAULT 0, -- higher goes first; a unit gets at most one promotion
+    is_active BOOLEAN DEFAULT TRUE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CHECK (kind IN ('percent_off', 'buy_x_get_y', 'bundle')),
+    FOREIGN KEY (category_id) REFERENCES categories(id)
+);
+
+-- 8. INDEXES
+-- Dashboard keyset pagination: WHERE (created_at, id) < (...) ORDER BY created_at DESC, id DESC LIMIT n
+CREATE INDEX idx_orders_created_at_id ON orders (created_at DESC, id DESC);
+-- Same, filtered by cashier
+CREATE INDEX idx_orders_user_created_at ON orders (user_id, created_at DESC, id DESC);
+-- Void / receipt lookups of an order's lines
+CREATE INDEX idx_order_items_order_id ON order_items (order_id);
+-- POS search-as-you-type: prefix matches walk this index in name order ("C" = byte order, so LIKE 'lat%' can use it)
+CREATE INDEX idx_products_name_prefix ON products ((lower(name) COLLATE "C"));
+-- ...and words inside the name ("iced la" -> 'iced:* & la:*'), built-in full-text GIN
+CREATE INDEX idx_products_name_words ON products USING gin (to_tsvector('simple', name));
+
+-- 9. CHANGE NOTIFICATIONS
+-- Every app process (each serve.py worker, the ASGI app) caches the catalog
+-- and the promotions in memory and pushes stock to its own tills over SSE.
+-- These triggers announce committed writes on the coffeepos_changes channel
+-- so the other processes hear about them too (changes.py). `origin` is the
+-- writer's application_name: a process skips its own writes, it has already
+-- handled them.
+CREATE FUNCTION notify_product_changes() RETURNS TRIGGER AS $$
+DECLARE
+    n_rows INTEGER;
+    stock JSON;       -- [[id, stock_quantity], ...] whose stock changed
+    product_ids JSON; -- ids added, removed or edited (anything but stock)
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT count(*), json_agg(id) INTO n_rows, product_ids FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT count(*), json_agg(id) INTO n_rows, product_ids FROM old_rows;
+    ELSE
+        SELECT count(*),
+               json_agg(json_build_array(n.id, n.stock_quantity))
+                   FILTER (WHERE n.stock_quantity IS DISTINCT FROM o.stock_quantity),
+               json_agg(n.id)
+                   FILTER (WHERE to_jsonb(n) - 'stock_quantity' IS DISTINCT FROM to_jsonb(o) - 'stock_quantity')
+          INTO n_rows, stock, product_ids
+          FROM new_rows n JOIN old_rows o ON o.id = n.id;
+    END IF;
+
+    IF stock IS NULL AND product_ids IS NULL THEN
+        RETURN NULL; -- e.g. a void of made-to-order items: nothing a till shows changed
+    ELSIF n_rows > 200 THEN
+        -- Payloads are capped at 8000 bytes: a bulk write (import) just says "products changed"
+        PERFORM pg_notify('coffeepos_changes', json_build_object(
+            'origin', current_setting('application_name'), 'table', TG_TABLE_NAME)::text);
+        RETURN NULL;
+    END IF;
+    PERFORM pg_notify('coffeepos_changes', json_build_object(
+        'origin', current_setting('application_name'), 'table', TG_TABLE_NAME,
+        'stock', coalesce(stock, '[]'), 'products', coalesce(product_ids, '[]'))::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- No row details: listeners reload everything from the table
+CREATE FUNCTION notify_table_changes() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('coffeepos_changes', json_build_object(
+        'origin', current_setting('application_name'), 'table', TG_TABLE_NAME)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- One notification per statement, not per row (transition tables allow one event per trigger)
+CREATE TRIGGER products_notify_insert AFTER INSERT ON products
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_product_changes();
+CREATE TRIGGER products_notify_update AFTER UPDATE ON products
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_product_changes();
+CREATE TRIGGER products_notify_delete AFTER DELETE ON products
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_product_changes();
+CREATE TRIGGER categories_notify AFTER INSERT OR UPDATE OR DELETE ON categories
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changes();
+CREATE TRIGGER promotions_notify AFTER INSERT OR UPDATE OR DELETE ON promotions
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changes();
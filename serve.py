@@ -0,0 +1,231 @@
+"""
+Production server for the POS backend (instead of `app.run()`).
+
+Runs the Flask app on waitress, a pure-Python multi-threaded WSGI server
+with HTTP/1.1 keep-alive. On POSIX it can also pre-fork several worker
+processes that share one listening socket, so a slow request or a long
+export in one worker doesn't hold up the tills served by the others.
+
+    python serve.py --host 0.0.0.0 --port 5000 --workers 4 --threads 48
+
+SIGTERM / SIGINT shut down gracefully: workers stop accepting connections,
+finish the requests they are serving (up to --graceful-timeout seconds)
+and exit. A worker that dies unexpectedly is replaced.
+
+Every open /api/stream (one per till) keeps a thread busy for as long as
+the till is connected. Each process therefore accepts at most
+--max-streams of them (default: --threads minus REQUEST_THREADS, or half
+the threads on a smaller server) and answers the rest with 503; those
+tills poll instead and retry later.
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+from waitress import create_server
+from waitress import wasyncore
+
+DEFAULT_THREADS = 48          # ~30 tills' streams plus REQUEST_THREADS in one process
+REQUEST_THREADS = 16          # threads never handed to streams, kept for checkouts and the dashboard
+DEFAULT_KEEP_ALIVE = 75       # seconds an idle keep-alive connection stays open
+DEFAULT_GRACEFUL_TIMEOUT = 30 # seconds to finish in-flight requests on shutdown
+
+
+def make_server(app, host='127.0.0.1', port=5000, threads=DEFAULT_THREADS,
+                keep_alive=DEFAULT_KEEP_ALIVE, sock=None, **adjustments):
+    """A waitress server for `app`, bound to host:port (or to an existing listening `sock`)."""
+    options = dict(
+        threads=threads,
+        channel_timeout=keep_alive,
+        connection_limit=max(100, threads * 25), # keep-alive connections are cheap while idle
+        ident='CoffeePOS',
+    )
+    options.update(adjustments)
+    if sock is not None:
+        options['sockets'] = [sock]
+    else:
+        options['host'] = host
+        options['port'] = port
+    return create_server(app, **options)
+
+
+def _busy(server):
+    dispatcher = server.task_dispatcher
+    if dispatcher.active_count or dispatcher.queue:
+        return True
+    # A request still being read or a response still being written
+    return any(channel.requests or channel.total_outbufs_len
+               for channel in list(server.active_channels.values()))
+
+
+def _close_streams():
+    # Open /api/stream responses never finish by themselves; end them so they
+    # don't hold up the drain. The tills' EventSource reconnects on its own.
+    import events
+    events.broker.close()
+
+
+def run_server(server, graceful_timeout=DEFAULT_GRACEFUL_TIMEOUT):
+    """
+    Serve until SIGTERM / SIGINT, then stop accepting, drain in-flight
+    requests for at most `graceful_timeout` seconds and return.
+    Must be called from the main thread (it installs signal handlers).
+    """
+    stopping = []
+
+    def stop(signum, frame):
+        if not stopping:
+            stopping.append(time.monotonic() + graceful_timeout)
+            server.accepting = False # No new connections; existing ones finish
+            _close_streams()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    timeout = server.adj.asyncore_loop_timeout
+    while not stopping or (_busy(server) and time.monotonic() < stopping[0]):
+        wasyncore.loop(timeout=timeout, map=server._map, use_poll=server.adj.asyncore_use_poll, count=1)
+
+    server.task_dispatcher.shutdown(cancel_pending=True, timeout=5)
+    wasyncore.close_all(server._map)
+
+
+def _listen(host, port, backlog=1024):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def _spawn(app, sock, threads, keep_alive, graceful_timeout):
+    pid = os.fork()
+    if pid:
+        return pid
+    # Worker: the pool is per process (db.ConnectionPool drops inherited connections)
+    status = 0
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        server = make_server(app, sock=sock, threads=threads, keep_alive=keep_alive)
+        run_server(server, graceful_timeout)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def run_prefork(app, host, port, workers, threads=DEFAULT_THREADS, keep_alive=DEFAULT_KEEP_ALIVE,
+                graceful_timeout=DEFAULT_GRACEFUL_TIMEOUT):
+    """
+    Bind once, fork `workers` processes that all accept on that socket, and
+    supervise them: respawn crashed workers, forward SIGTERM / SIGINT and
+    wait for every worker to drain before exiting.
+    """
+    sock = _listen(host, port)
+    print(f"Serving on http://{host}:{port} with {workers} workers x {threads} threads", flush=True)
+
+    children = {}
+    stopping = []
+
+    def stop(signum, frame):
+        if not stopping:
+            stopping.append(time.monotonic() + graceful_timeout + 5)
+            for pid in children:
+                _kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        pid = _spawn(app, sock, threads, keep_alive, graceful_timeout)
+        children[pid] = time.monotonic()
+
+    while children:
+        if stopping and time.monotonic() > stopping[0]:
+            for pid in children:
+                _kill(pid, signal.SIGKILL)
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.2)
+            continue
+
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        print(f"Worker {pid} exited with status {status}, restarting", file=sys.stderr, flush=True)
+        if time.monotonic() - started < 1:
+            time.sleep(1) # Crashing on startup: don't spin
+        new_pid = _spawn(app, sock, threads, keep_alive, graceful_timeout)
+        children[new_pid] = time.monotonic()
+
+    sock.close()
+
+
+def _kill(pid, sig):
+    try:
+        os.kill(pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def stream_limit(threads, max_streams=None):
+    """Open /api/stream responses one process may hold with `threads` threads."""
+    if max_streams is None:
+        # Small servers keep half their threads for requests
+        max_streams = threads - min(REQUEST_THREADS, threads // 2)
+    # Always leave at least one thread for ordinary requests
+    return max(0, min(max_streams, threads - 1))
+
+
+def serve(app, host='127.0.0.1', port=5000, workers=1, threads=DEFAULT_THREADS,
+          keep_alive=DEFAULT_KEEP_ALIVE, graceful_timeout=DEFAULT_GRACEFUL_TIMEOUT, max_streams=None):
+    if max_streams is None:
+        max_streams = app.config['STREAM_MAX_CLIENTS']
+    app.config['STREAM_MAX_CLIENTS'] = stream_limit(threads, max_streams)
+
+    if workers > 1 and hasattr(os, 'fork'):
+        run_prefork(app, host, port, workers, threads, keep_alive, graceful_timeout)
+        return
+
+    if workers > 1:
+        print("Multiple workers need fork(); serving with one process", file=sys.stderr)
+    server = make_server(app, host, port, threads=threads, keep_alive=keep_alive)
+    print(f"Serving on http://{host}:{port} with {threads} threads", flush=True)
+    run_server(server, graceful_timeout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=1, help='processes (POSIX only)')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help='request threads per process')
+    parser.add_argument('--max-streams', type=int, default=None,
+                        help=f'open /api/stream per process (default: threads - {REQUEST_THREADS}, at most half)')
+    parser.add_argument('--keep-alive', type=int, default=DEFAULT_KEEP_ALIVE,
+                        help='seconds before an idle connection is closed')
+    parser.add_argument('--graceful-timeout', type=int, default=DEFAULT_GRACEFUL_TIMEOUT,
+                        help='seconds to finish in-flight requests on shutdown')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    # Created before forking so a broken config fails once, in the parent.
+    # The DB pool is created lazily, i.e. separately in each worker.
+    app = create_app()
+    serve(app, args.host, args.port, args.workers, args.threads, args.keep_alive, args.graceful_timeout,
+          args.max_streams)
+
+
+if __name__ == '__main__':
+    main()
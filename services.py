@@ -1,11 +1,148 @@
 import psycopg2
 import datetime
-from decimal import Decimal
+import json
+from decimal import Decimal, InvalidOperation
+import catalog
+import events
+import metrics
+import partitions
+import pricing
+import reports
 
-def process_order(db_conn, user_id, transaction_code, payment_method, amount_received, cart_items):
+# SQL shared with services_async.py, which runs the same statements on an async driver
+NEXT_TRANSACTION_CODES_SQL = "SELECT next_transaction_code() AS code FROM generate_series(1, %s)"
+
+# Replay lookups: the key table first (the usual answer is "no such key"),
+# then only the months the found orders live in
+FIND_KEYS_SQL = """SELECT idempotency_key, order_id, order_created_at FROM order_idempotency
+           WHERE idempotency_key = ANY(%s)"""
+
+FIND_ORDERS_SQL = """SELECT id, user_id, transaction_code, status FROM orders
+           WHERE id = ANY(%(order_ids)s) AND created_at BETWEEN %(first_at)s AND %(last_at)s"""
+
+LOCK_PRODUCTS_SQL = """SELECT id, category_id, name, price, is_inventory_managed, stock_quantity, is_active
+           FROM products WHERE id = ANY(%s) ORDER BY id FOR UPDATE"""
+
+# /api/cart/quote: the same rows, without the locks
+QUOTE_PRODUCTS_SQL = """SELECT id, category_id, name, price, is_inventory_managed, stock_quantity, is_active
+           FROM products WHERE id = ANY(%s)"""
+
+DEDUCT_STOCK_SQL = """UPDATE products AS p SET stock_quantity = p.stock_quantity - d.qty
+                FROM (VALUES {values}) AS d(id, qty)
+                WHERE p.id = d.id AND p.stock_quantity >= d.qty
+                RETURNING p.id, p.stock_quantity"""
+
+# orders is partitioned, so the idempotency key is unique in order_idempotency
+# instead; claiming it happens in the same statement. No row comes back when
+# the key was already taken (and the whole transaction is then rolled back).
+INSERT_ORDER_SQL = """WITH new_order AS (
+               INSERT INTO orders (user_id, transaction_code, total_amount, tax_amount, discount_amount, payment_method,
+                                   amount_received, change_amount, idempotency_key)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+               RETURNING id, created_at, idempotency_key
+           ), claimed AS (
+               INSERT INTO order_idempotency (idempotency_key, order_id, order_created_at)
+               SELECT idempotency_key, id, created_at FROM new_order WHERE idempotency_key IS NOT NULL
+               ON CONFLICT (idempotency_key) DO NOTHING RETURNING order_id
+           )
+           SELECT id, created_at FROM new_order
+           WHERE idempotency_key IS NULL OR EXISTS (SELECT 1 FROM claimed)"""
+
+INSERT_ORDER_ITEMS_SQL = """INSERT INTO order_items (order_id, product_id, product_name_snapshot, price_snapshot, quantity, subtotal,
+                                     discount_amount, order_created_at)
+            VALUES {values}"""
+
+LOCK_ORDER_SQL = "SELECT status, created_at FROM orders WHERE id = %s FOR UPDATE"
+
+LOCK_ORDERS_SQL = """SELECT id, transaction_code, status, total_amount, tax_amount, created_at FROM orders
+           WHERE {where} ORDER BY id FOR UPDATE"""
+
+# Restock: lock the managed products in id order (like checkout, so the two
+# can't deadlock), then add back the summed quantities in one UPDATE.
+# Voids name orders by id and by the span of their created_at, so only the
+# partitions of those months are planned and scanned.
+LOCK_RESTOCK_PRODUCTS_SQL = """SELECT id FROM products
+           WHERE is_inventory_managed AND id IN (SELECT product_id FROM order_items WHERE order_id = ANY(%(order_ids)s)
+                                                 AND order_created_at BETWEEN %(first_at)s AND %(last_at)s)
+           ORDER BY id FOR UPDATE"""
+
+RESTOCK_ORDERS_SQL = """UPDATE products AS p SET stock_quantity = p.stock_quantity + r.qty
+           FROM (SELECT product_id, SUM(quantity) AS qty FROM order_items
+                 WHERE order_id = ANY(%(order_ids)s) AND order_created_at BETWEEN %(first_at)s AND %(last_at)s
+                 GROUP BY product_id) AS r
+           WHERE p.id = r.product_id AND p.is_inventory_managed
+           RETURNING p.id, p.stock_quantity, r.qty AS quantity"""
+
+CANCEL_ORDERS_SQL = """UPDATE orders SET status = 'cancelled', voided_by = %(user_id)s, voided_at = %(now)s
+           WHERE id = ANY(%(order_ids)s) AND created_at BETWEEN %(first_at)s AND %(last_at)s"""
+
+INSERT_VOID_BATCH_SQL = """INSERT INTO void_batches (voided_by, voided_at, reason, criteria, order_ids, order_count,
+                                     total_amount, tax_amount, restocked)
+           VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id"""
+
+class DuplicateOrder(Exception):
+    """An order with this idempotency key was already committed."""
+
+    def __init__(self, idempotency_key):
+        super().__init__(f"Order {idempotency_key} was already processed")
+        self.idempotency_key = idempotency_key
+
+class _BatchAborted(Exception):
+    """Order `index` of an atomic batch failed; the whole batch is rolled back."""
+
+    def __init__(self, index, error):
+        super().__init__(str(error))
+        self.index = index
+        self.error = error
+
+def _values_list(rows):
+    """
+    Build a multi-row `VALUES (...), (...)` placeholder list and its flattened params,
+    so N rows go to the server in one statement instead of N round trips.
+    """
+    placeholder = '(' + ', '.join(['%s'] * len(rows[0])) + ')'
+    params = [value for row in rows for value in row]
+    return ', '.join([placeholder] * len(rows)), params
+
+def next_transaction_codes(db_conn, count=1):
+    """
+    `count` fresh transaction codes (TRX-YYYYMMDD-000123) in one round trip.
+    They come from a Postgres sequence, so they are unique across tills and
+    worker processes without any locking.
+    """
+    with db_conn.cursor() as cur:
+        cur.execute(NEXT_TRANSACTION_CODES_SQL, (count,))
+        return [row['code'] for row in cur.fetchall()]
+
+def find_order(db_conn, idempotency_key):
+    """The already committed order for `idempotency_key`, or None."""
+    return find_orders(db_conn, [idempotency_key]).get(idempotency_key)
+
+def find_orders(db_conn, idempotency_keys):
+    """{idempotency_key: order} for the keys that already have an order."""
+    with db_conn.cursor() as cur:
+        cur.execute(FIND_KEYS_SQL, (list(idempotency_keys),))
+        keys = cur.fetchall()
+        if not keys:
+            return {}
+        cur.execute(FIND_ORDERS_SQL, order_params([k['order_id'] for k in keys], [k['order_created_at'] for k in keys]))
+        return found_orders(keys, cur.fetchall())
+
+def found_orders(keys, orders):
+    """Match FIND_KEYS_SQL rows to FIND_ORDERS_SQL rows: {idempotency_key: order}."""
+    by_id = {order['id']: order for order in orders}
+    return {k['idempotency_key']: dict(by_id[k['order_id']], idempotency_key=k['idempotency_key'])
+            for k in keys if k['order_id'] in by_id}
+
+def process_order(db_conn, user_id, transaction_code, payment_method, amount_received, cart_items,
+                  idempotency_key=None, promotions=None):
     """
     Atomic transaction to process an order.
 
+    The number of statements is constant regardless of cart size: all cart
+    products are locked and fetched in one query, stock is deducted with one
+    set-based UPDATE and the line items go in with one multi-row INSERT.
+
     Args:
         db_conn: PostgreSQL connection object (must support rollback/commit)
         user_id: ID of the cashier/user
@@ -13,132 +150,508 @@ def process_order(db_conn, user_id, transaction_code, payment_method, amount_rec
         payment_method: 'cash' or 'qris'
         amount_received: Decimal amount
         cart_items: List of dicts {'product_id': int, 'quantity': int}
+        idempotency_key: Optional client-generated key; a second order with
+            the same key is rolled back and raises DuplicateOrder
+        promotions: pricing.RuleIndex to price with; defaults to pricing.cache
 
     Returns:
         order_id on success, raises Exception on failure.
     """
+    if promotions is None:
+        promotions = pricing.cache.get(db_conn)
+
+    for attempt in range(2):
+        cursor = db_conn.cursor()
+
+        try:
+            order, stock_rows = run_steps(cursor, place_order_steps(
+                user_id, transaction_code, payment_method, amount_received, cart_items, idempotency_key, promotions
+            ))
+
+            db_conn.commit()
+            orders_placed(stock_rows)
+            return order['id']
+
+        except Exception as e:
+            db_conn.rollback()
+            # First order of a month nobody created partitions for: create them, try once more
+            if attempt == 0 and partitions.missing_partition(e):
+                partitions.ensure(db_conn)
+                continue
+            raise e
+
+def process_orders(db_conn, user_id, orders, chunk_size=100, atomic=False, promotions=None):
+    """
+    Process many orders with the same validation, pricing and stock rules as
+    `process_order`, for kiosk imports and offline backlogs.
+
+    Each order runs inside its own SAVEPOINT, so a rejected cart only undoes
+    itself. Orders are committed every `chunk_size` orders; the rollups are
+    updated once per chunk. With `atomic=True` the whole batch is a single
+    transaction and the first failure rolls everything back.
+
+    Args:
+        orders: List of dicts {'cart', 'payment_method', 'amount_received',
+            'transaction_code', optional 'idempotency_key'}
+
+    Returns:
+        One dict per order, in input order: {'success': True, 'order_id',
+        'transaction_code'[, 'replayed': True]} or {'success': False, 'error'};
+        orders that were rolled back only because of another failure also
+        carry 'retry': True.
+    """
+    results = [None] * len(orders)
+    if promotions is None:
+        promotions = pricing.cache.get(db_conn)
+    if atomic:
+        chunk_size = len(orders) or 1
+
+    # Replays of already committed orders are answered without touching stock
+    keys = [order['idempotency_key'] for order in orders if order.get('idempotency_key')]
+    existing = find_orders(db_conn, keys) if keys else {}
+
     cursor = db_conn.cursor()
 
+    for chunk_start in range(0, len(orders), chunk_size):
+        chunk = range(chunk_start, min(chunk_start + chunk_size, len(orders)))
+        placed = [] # order ids placed in this chunk
+        placed_at = [] # ...and their created_at
+        stock = {} # product_id -> latest stock row
+        try:
+            for i in chunk:
+                order = orders[i]
+                if order.get('idempotency_key') in existing:
+                    results[i] = _replay_result(existing[order['idempotency_key']], user_id)
+                    continue
+
+                cursor.execute("SAVEPOINT batch_order")
+                try:
+                    placed_order, stock_rows = _insert_batch_order(cursor, user_id, order, promotions)
+                except DuplicateOrder:
+                    cursor.execute("ROLLBACK TO SAVEPOINT batch_order")
+                    # Same key earlier in this batch (or a concurrent request)
+                    results[i] = _replay_result(find_order(db_conn, order['idempotency_key']), user_id)
+                    continue
+                except Exception as e:
+                    if atomic:
+                        raise _BatchAborted(i, e)
+                    cursor.execute("ROLLBACK TO SAVEPOINT batch_order")
+                    results[i] = {'success': False, 'error': str(e)}
+                    continue
+
+                # Released savepoints still hold a subtransaction until COMMIT;
+                # that is what bounds the chunk size.
+                cursor.execute("RELEASE SAVEPOINT batch_order")
+                placed.append(placed_order['id'])
+                placed_at.append(placed_order['created_at'])
+                stock.update((row['id'], row) for row in stock_rows)
+                results[i] = {'success': True, 'order_id': placed_order['id'],
+                              'transaction_code': order['transaction_code']}
+
+            if placed:
+                reports.record_orders(cursor, placed, created=placed_at)
+            db_conn.commit()
+            metrics.count_orders('created', len(placed))
+
+        except Exception as e:
+            # Earlier chunks stay committed; this one and everything after it
+            # are reported as failed so the client can resend them (same keys).
+            db_conn.rollback()
+            failed_at, error = (e.index, e.error) if isinstance(e, _BatchAborted) else (None, e)
+            for i in range(chunk_start, len(orders)):
+                key = orders[i].get('idempotency_key')
+                if key in existing:
+                    # Committed by an earlier request, still valid (and maybe not reached yet)
+                    results[i] = _replay_result(existing[key], user_id)
+                elif i == failed_at:
+                    results[i] = {'success': False, 'error': str(error)}
+                else:
+                    results[i] = {'success': False, 'error': f"Not processed: {error}", 'retry': True}
+            return results
+
+        if stock:
+            catalog.invalidate(stock)
+            events.publish_stock(list(stock.values()))
+
+    return results
+
+def _insert_batch_order(cursor, user_id, order, promotions):
+    """_insert_order inside the batch savepoint, creating a missing month's partitions once."""
+    args = (cursor, user_id, order['transaction_code'], order['payment_method'], order['amount_received'],
+            order['cart'], order.get('idempotency_key'), promotions)
     try:
-        # Calculate totals and validate stock first
-        total_amount = Decimal('0.00')
-        final_items = []
-
-        for item in cart_items:
-            product_id = item['product_id']
-            qty = item['quantity']
-
-            # Fetch current product state
-            cursor.execute(
-                "SELECT name, price, is_inventory_managed, stock_quantity, is_active FROM products WHERE id = %s",
-                (product_id,)
-            )
-            product = cursor.fetchone()
-
-            if not product:
-                raise Exception(f"Product ID {product_id} not found.")
-
-            if not product['is_active']:
-                raise Exception(f"Product {product['name']} is inactive.")
-
-            # Check Stock
-            if product['is_inventory_managed']:
-                if product['stock_quantity'] < qty:
-                    raise Exception(f"Insufficient stock for {product['name']}. Available: {product['stock_quantity']}")
-
-                # Deduct Stock
-                new_stock = product['stock_quantity'] - qty
-                cursor.execute("UPDATE products SET stock_quantity = %s WHERE id = %s", (new_stock, product_id))
-
-            # Snapshot data
-            price = Decimal(str(product['price']))
-            subtotal = price * qty
-            total_amount += subtotal
-
-            final_items.append({
-                'product_id': product_id,
-                'name_snapshot': product['name'],
-                'price_snapshot': price,
-                'quantity': qty,
-                'subtotal': subtotal
-            })
-
-        # Calculate Tax (10%)
-        tax_amount = total_amount * Decimal('0.10')
-        grand_total = total_amount + tax_amount
-
-        # Create Order Header
-        change_amount = Decimal(amount_received) - grand_total
+        return _insert_order(*args)
+    except Exception as e:
+        if not partitions.missing_partition(e):
+            raise
+    cursor.execute("ROLLBACK TO SAVEPOINT batch_order")
+    partitions.create(cursor)
+    return _insert_order(*args)
+
+# The key is recorded but its order can't be found any more (deleted by hand,
+# or archived between the key lookup and the order lookup)
+REPLAYED_ORDER_MISSING = 'The order for this idempotency key no longer exists'
+
+def _replay_result(order, user_id):
+    if order is None:
+        return {'success': False, 'error': REPLAYED_ORDER_MISSING}
+    if order['user_id'] != user_id:
+        return {'success': False, 'error': 'Idempotency key belongs to another cashier'}
+    return {'success': True, 'order_id': order['id'], 'transaction_code': order['transaction_code'], 'replayed': True}
+
+def price_order(products, cart_items, amount_received, promotions=None, now=None):
+    """
+    Validate a cart against the locked `products` rows ({id: row}) and price
+    it, applying the `promotions` (a pricing.RuleIndex) active at `now`.
+    Pure function, no I/O. Raises with the same messages the till shows.
+    `amount_received=None` (a quote) skips the payment check.
+
+    Returns {'items', 'deductions', 'subtotal', 'discount_amount', 'tax_amount',
+    'grand_total', 'change_amount', 'pricing_version'}.
+    """
+    # Calculate totals and validate stock first
+    total_amount = Decimal('0.00')
+    final_items = []
+    deductions = {} # product_id -> quantity to deduct (summed over repeated lines)
+
+    for item in cart_items:
+        product_id = cart_line_product_id(item)
+        qty = item['quantity']
+        if not isinstance(qty, int) or isinstance(qty, bool) or qty < 1:
+            raise Exception(f"Invalid quantity for product ID {product_id}")
+
+        product = products.get(product_id)
+
+        if not product:
+            raise Exception(f"Product ID {product_id} not found.")
+
+        if not product['is_active']:
+            raise Exception(f"Product {product['name']} is inactive.")
+
+        # Check Stock (earlier lines of the same product already claimed part of it)
+        if product['is_inventory_managed']:
+            available = product['stock_quantity'] - deductions.get(product_id, 0)
+            if available < qty:
+                raise Exception(f"Insufficient stock for {product['name']}. Available: {available}")
+            deductions[product_id] = deductions.get(product_id, 0) + qty
+
+        # Snapshot data
+        price = Decimal(str(product['price']))
+        subtotal = price * qty
+        total_amount += subtotal
+
+        final_items.append({
+            'product_id': product_id,
+            'category_id': product.get('category_id'),
+            'name_snapshot': product['name'],
+            'price_snapshot': price,
+            'quantity': qty,
+            'subtotal': subtotal
+        })
+
+    # Promotions (in memory, see pricing.py); line subtotals become net of discounts
+    discount_amount = pricing.apply(promotions, final_items, now or datetime.datetime.now())
+
+    # Calculate Tax (10%), on what the customer actually pays. Rounded to
+    # cents here, so the total the till shows is the one stored and compared.
+    tax_amount = pricing.to_cents((total_amount - discount_amount) * pricing.TAX_RATE)
+    grand_total = total_amount - discount_amount + tax_amount
+
+    # Create Order Header
+    change_amount = None
+    if amount_received is not None:
+        # Via str(): the till sends JSON floats, and Decimal(48400.1) isn't 48400.10
+        try:
+            received = Decimal(str(amount_received))
+        except InvalidOperation:
+            received = None
+        if received is None or not received.is_finite():
+            raise Exception(f"Invalid amount received: {amount_received!r}")
+        change_amount = received - grand_total
         if change_amount < 0:
              raise Exception(f"Insufficient payment. Total: {grand_total}, Received: {amount_received}")
 
-        cursor.execute(
-            """INSERT INTO orders (user_id, transaction_code, total_amount, tax_amount, payment_method, amount_received, change_amount)
-               VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id""",
-            (user_id, transaction_code, grand_total, tax_amount, payment_method, amount_received, change_amount)
-        )
-        order_id = cursor.fetchone()['id']
-
-        # Create Order Items
-        for item in final_items:
-            cursor.execute(
-                """INSERT INTO order_items (order_id, product_id, product_name_snapshot, price_snapshot, quantity, subtotal)
-                   VALUES (%s, %s, %s, %s, %s, %s)""",
-                (order_id, item['product_id'], item['name_snapshot'], item['price_snapshot'], item['quantity'], item['subtotal'])
-            )
+    return {
+        'items': final_items,
+        'deductions': deductions,
+        'subtotal': total_amount,
+        'discount_amount': discount_amount,
+        'tax_amount': tax_amount,
+        'grand_total': grand_total,
+        'change_amount': change_amount,
+        'pricing_version': promotions.version if promotions is not None else None,
+    }
+
+def quote_order(db_conn, cart_items, promotions=None):
+    """
+    Price a cart exactly like checkout would (same `price_order`, same
+    promotions) without locking or writing anything: the till's live total.
+    """
+    if not cart_items:
+        raise Exception("Cart is empty")
+    if promotions is None:
+        promotions = pricing.cache.get(db_conn)
+    with db_conn.cursor() as cur:
+        cur.execute(QUOTE_PRODUCTS_SQL, (cart_product_ids(cart_items),))
+        products = {row['id']: row for row in cur.fetchall()}
+    db_conn.rollback()
+    return price_order(products, cart_items, None, promotions)
+
+def cart_product_ids(cart_items):
+    return sorted({cart_line_product_id(item) for item in cart_items})
+
+def cart_line_product_id(item):
+    """A cart line's product ID as an int; raises with the till's message if the line is malformed."""
+    if not isinstance(item, dict) or 'product_id' not in item or 'quantity' not in item:
+        raise Exception("Invalid cart line")
+    product_id = item['product_id']
+    if isinstance(product_id, str) and product_id.isdigit(): # old tills send IDs as strings
+        product_id = int(product_id)
+    if not isinstance(product_id, int) or isinstance(product_id, bool) or product_id < 1:
+        raise Exception(f"Invalid product ID {item['product_id']!r}")
+    return product_id
+
+def check_deducted(products, deductions, stock_rows):
+    """Raise if the guarded stock UPDATE skipped a product (someone else sold it first)."""
+    updated = {row['id'] for row in stock_rows}
+    for product_id in sorted(deductions):
+        if product_id not in updated:
+            product = products[product_id]
+            raise Exception(f"Insufficient stock for {product['name']}. Available: {product['stock_quantity']}")
+
+def order_item_rows(order, items):
+    """VALUES rows for INSERT_ORDER_ITEMS_SQL; `order` is the row INSERT_ORDER_SQL returned."""
+    return [
+        (order['id'], item['product_id'], item['name_snapshot'], item['price_snapshot'], item['quantity'], item['subtotal'],
+         item['discount_amount'], order['created_at'])
+        for item in items
+    ]
+
+# Checkout and void flows are written once, as generators of statements:
+# they yield `(sql, params, fetch)` and are sent back the rows ('all' /
+# 'one') or None. `run_steps` drives one on a psycopg2 cursor,
+# services_async.run_steps awaits the very same statements on psycopg 3.
+
+def run_steps(cursor, steps):
+    """Execute the statements `steps` yields on `cursor`; returns the flow's result."""
+    rows = None
+    while True:
+        try:
+            sql, params, fetch = steps.send(rows)
+        except StopIteration as done:
+            return done.value
+        cursor.execute(sql, params)
+        rows = cursor.fetchall() if fetch == 'all' else cursor.fetchone() if fetch == 'one' else None
+
+def _statements(pairs):
+    # (sql, params) pairs that return nothing, e.g. reports.record_statements
+    for sql, params in pairs:
+        yield sql, params, None
+
+def _insert_order(cursor, *args):
+    """`insert_order_steps` run on `cursor`."""
+    return run_steps(cursor, insert_order_steps(*args))
+
+def place_order_steps(user_id, transaction_code, payment_method, amount_received, cart_items, idempotency_key,
+                      promotions):
+    """One complete checkout: `insert_order_steps`, then the order into the rollups."""
+    order, stock_rows = yield from insert_order_steps(
+        user_id, transaction_code, payment_method, amount_received, cart_items, idempotency_key, promotions)
+    # Keep the daily sales rollups in step, inside the same transaction
+    yield from _statements(reports.record_statements([order['id']], created=[order['created_at']]))
+    return order, stock_rows
+
+def insert_order_steps(user_id, transaction_code, payment_method, amount_received, cart_items, idempotency_key,
+                       promotions):
+    """
+    Validate and write one order: lock products, deduct stock, insert the
+    order and its items. Does not touch the rollups and does not commit.
+
+    Returns `(order, stock_rows)`: the new `{'id', 'created_at'}` and the
+    updated `{'id', 'stock_quantity'}` of managed products.
+    """
+    if not cart_items:
+        raise Exception("Cart is empty")
+
+    # Lock & fetch every product in the cart in a single round trip
+    product_ids = cart_product_ids(cart_items)
+    # ORDER BY id makes every till take the row locks in the same order,
+    # so two overlapping carts can never deadlock each other.
+    products = {row['id']: row for row in (yield LOCK_PRODUCTS_SQL, (product_ids,), 'all')}
+
+    priced = price_order(products, cart_items, amount_received, promotions)
+    deductions = priced['deductions']
+
+    # Deduct Stock (one set-based UPDATE for every managed product).
+    # The arithmetic happens in SQL and is guarded by `stock_quantity >= qty`,
+    # so a deduction can never be computed from a stale read or go negative.
+    stock_rows = []
+    if deductions:
+        values, params = _values_list(sorted(deductions.items()))
+        stock_rows = yield DEDUCT_STOCK_SQL.format(values=values), params, 'all'
+        check_deducted(products, deductions, stock_rows)
+
+    # A retried request that raced the original waits on the unique key here,
+    # then claims nothing; everything done so far is rolled back by the caller.
+    order = yield INSERT_ORDER_SQL, (
+        user_id, transaction_code, priced['grand_total'], priced['tax_amount'], priced['discount_amount'],
+        payment_method, amount_received, priced['change_amount'], idempotency_key
+    ), 'one'
+    if order is None:
+        raise DuplicateOrder(idempotency_key)
+
+    # Create Order Items (one multi-row INSERT, into the order's month)
+    values, params = _values_list(order_item_rows(order, priced['items']))
+    yield INSERT_ORDER_ITEMS_SQL.format(values=values), params, None
+
+    return order, stock_rows
+
+def orders_placed(stock_rows, count=1):
+    """After the commit: count the orders and publish the stock they took."""
+    metrics.count_orders('created', count)
+    if stock_rows:
+        catalog.invalidate([row['id'] for row in stock_rows])
+        events.publish_stock(stock_rows)
+
+def void_order(db_conn, order_id, user_id):
+    """
+    Void an order and restock inventory if applicable.
+    """
+    cursor = db_conn.cursor()
+
+    try:
+        restocked = run_steps(cursor, void_order_steps(order_id, user_id, datetime.datetime.now()))
 
         db_conn.commit()
-        return order_id
+        orders_voided(restocked)
+        return True
 
     except Exception as e:
         db_conn.rollback()
         raise e
 
-def void_order(db_conn, order_id, user_id):
+def void_orders(db_conn, user_id, order_ids=None, date_from=None, date_to=None, cashier=None,
+                reason=None, max_orders=None):
     """
-    Void an order and restock inventory if applicable.
+    Void many orders in one transaction, e.g. a whole shift of a misbehaving
+    till: either the given `order_ids`, or every paid order matching
+    `date_from` / `date_to` (inclusive dates) and/or `cashier` (user id).
+
+    The orders are locked once, stock comes back with one aggregated UPDATE
+    and the rollups are reversed set-based, so the statement count doesn't
+    grow with the number of orders. Cancelled or unknown ids are skipped.
+    Raises (and voids nothing) when no paid order matches or more than
+    `max_orders` do.
+
+    Returns the audit summary, which is also stored in `void_batches`:
+    {'batch_id', 'voided', 'order_ids', 'total_amount', 'tax_amount',
+     'restocked': [[product_id, quantity], ...], 'already_cancelled', 'not_found'}
     """
+    params = {}
+    if order_ids is not None:
+        requested = sorted({int(i) for i in order_ids})
+        if not requested:
+            raise Exception("No orders selected")
+        where = "id = ANY(%(order_ids)s)"
+        params['order_ids'] = requested
+        criteria = {'order_ids': requested}
+    else:
+        conditions = []
+        if date_from:
+            conditions.append("created_at >= %(date_from)s")
+            params['date_from'] = date_from
+        if date_to:
+            conditions.append("created_at < %(date_end)s")
+            params['date_end'] = date_to + datetime.timedelta(days=1)
+        if cashier:
+            conditions.append("user_id = %(cashier)s")
+            params['cashier'] = cashier
+        if not conditions:
+            # Never "void everything" by accident
+            raise Exception("Select orders or a date / cashier filter")
+        conditions.append("status = 'paid'")
+        where = " AND ".join(conditions)
+        criteria = {'date_from': date_from and date_from.isoformat(),
+                    'date_to': date_to and date_to.isoformat(), 'cashier': cashier}
+
     cursor = db_conn.cursor()
 
     try:
-        # Get order status
-        cursor.execute("SELECT status FROM orders WHERE id = %s", (order_id,))
-        order = cursor.fetchone()
-
-        if not order:
-             raise Exception("Order not found")
-
-        if order['status'] == 'cancelled':
-            raise Exception("Order is already cancelled")
-
-        # Get Order Items
-        cursor.execute("""
-            SELECT oi.product_id, oi.quantity, p.is_inventory_managed
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            WHERE oi.order_id = %s
-        """, (order_id,))
-
-        items = cursor.fetchall()
-
-        # Restock
-        for item in items:
-            if item['is_inventory_managed']:
-                cursor.execute(
-                    "UPDATE products SET stock_quantity = stock_quantity + %s WHERE id = %s",
-                    (item['quantity'], item['product_id'])
-                )
-
-        # Update Order Status
+        cursor.execute(LOCK_ORDERS_SQL.format(where=where), params)
+        orders = cursor.fetchall()
+        paid = [o for o in orders if o['status'] == 'paid']
+
+        if not paid:
+            raise Exception("No paid orders to void")
+        if max_orders and len(paid) > max_orders:
+            raise Exception(f"{len(paid)} orders match, more than the limit of {max_orders} per bulk void")
+
+        ids = [o['id'] for o in paid]
         now = datetime.datetime.now()
-        cursor.execute(
-            "UPDATE orders SET status = 'cancelled', voided_by = %s, voided_at = %s WHERE id = %s",
-            (user_id, now, order_id)
-        )
+        restocked = _void_locked(cursor, ids, [o['created_at'] for o in paid], user_id, now)
 
-        db_conn.commit()
-        return True
+        summary = {
+            'voided': len(ids),
+            'order_ids': ids,
+            'total_amount': sum((o['total_amount'] for o in paid), Decimal('0.00')),
+            'tax_amount': sum((o['tax_amount'] for o in paid), Decimal('0.00')),
+            'restocked': sorted([row['id'], int(row['quantity'])] for row in restocked),
+            'already_cancelled': [o['id'] for o in orders if o['status'] != 'paid'],
+            'not_found': sorted(set(params.get('order_ids', [])) - {o['id'] for o in orders}),
+        }
+        cursor.execute(INSERT_VOID_BATCH_SQL, (
+            user_id, now, reason, json.dumps(criteria), ids, len(ids),
+            summary['total_amount'], summary['tax_amount'], json.dumps(summary['restocked'])
+        ))
+        summary['batch_id'] = cursor.fetchone()['id']
 
+        db_conn.commit()
     except Exception as e:
         db_conn.rollback()
         raise e
+
+    orders_voided(restocked, len(ids))
+    return summary
+
+def void_order_steps(order_id, user_id, now):
+    """Lock one order, check it can be voided, then `void_locked_steps`. Does not commit."""
+    # Get order status (locked, so two admins can't void & restock the same order twice)
+    order = yield LOCK_ORDER_SQL, (order_id,), 'one'
+
+    if not order:
+        raise Exception("Order not found")
+
+    if order['status'] == 'cancelled':
+        raise Exception("Order is already cancelled")
+
+    return (yield from void_locked_steps([order_id], [order['created_at']], user_id, now))
+
+def _void_locked(cursor, *args):
+    """`void_locked_steps` run on `cursor`."""
+    return run_steps(cursor, void_locked_steps(*args))
+
+def void_locked_steps(order_ids, created, user_id, now):
+    """Restock, reverse the rollups and cancel paid orders the caller has locked. Does not commit."""
+    params = order_params(order_ids, created)
+    yield LOCK_RESTOCK_PRODUCTS_SQL, params, None
+    restocked = yield RESTOCK_ORDERS_SQL, params, 'all'
+
+    # Take the orders back out of the sales rollups
+    yield from _statements(reports.record_statements(order_ids, sign=-1, created=created))
+
+    yield CANCEL_ORDERS_SQL, dict(params, user_id=user_id, now=now), None
+    return restocked
+
+def orders_voided(restocked, count=1):
+    """After the commit: count the voids and publish the stock that came back."""
+    metrics.count_orders('voided', count)
+    if restocked:
+        catalog.invalidate([row['id'] for row in restocked])
+        events.publish_stock(restocked)
+
+def order_params(order_ids, created):
+    """
+    Params naming orders by id and by the span of their created_at, so a
+    statement only plans and scans those months' partitions.
+    """
+    return {'order_ids': list(order_ids), 'first_at': min(created), 'last_at': max(created)}
@@ -0,0 +1,93 @@
+"""
+asyncio versions of the checkout and void services for the ASGI app.
+
+Same statements, same order, same locking and the same error messages as
+services.py: the checkout and void flows are services.py's statement
+generators (`services.place_order_steps`, `services.void_order_steps`),
+only the I/O is awaited here. `db_conn` is a psycopg 3 AsyncConnection
+with dict rows (see db_async.py).
+"""
+import datetime
+import partitions
+import pricing
+import services
+
+async def next_transaction_codes(db_conn, count=1):
+    async with db_conn.cursor() as cur:
+        await cur.execute(services.NEXT_TRANSACTION_CODES_SQL, (count,))
+        return [row['code'] for row in await cur.fetchall()]
+
+async def find_order(db_conn, idempotency_key):
+    async with db_conn.cursor() as cur:
+        await cur.execute(services.FIND_KEYS_SQL, ([idempotency_key],))
+        keys = await cur.fetchall()
+        if not keys:
+            return None
+        await cur.execute(services.FIND_ORDERS_SQL, services.order_params(
+            [k['order_id'] for k in keys], [k['order_created_at'] for k in keys]))
+        return services.found_orders(keys, await cur.fetchall()).get(idempotency_key)
+
+async def process_order(db_conn, user_id, transaction_code, payment_method, amount_received, cart_items,
+                        idempotency_key=None, promotions=None):
+    """See `services.process_order`. Returns order_id, raises on failure."""
+    if not cart_items:
+        raise Exception("Cart is empty")
+    if promotions is None:
+        promotions = await pricing.cache.get_async(db_conn)
+
+    for attempt in range(2):
+        try:
+            async with db_conn.cursor() as cursor:
+                order, stock_rows = await run_steps(cursor, services.place_order_steps(
+                    user_id, transaction_code, payment_method, amount_received, cart_items, idempotency_key,
+                    promotions
+                ))
+
+            await db_conn.commit()
+            break
+        except Exception as e:
+            await db_conn.rollback()
+            if attempt == 0 and partitions.missing_partition(e):
+                await partitions.ensure_async(db_conn)
+                continue
+            raise e
+
+    services.orders_placed(stock_rows)
+    return order['id']
+
+async def quote_order(db_conn, cart_items, promotions=None):
+    """See `services.quote_order`."""
+    if not cart_items:
+        raise Exception("Cart is empty")
+    if promotions is None:
+        promotions = await pricing.cache.get_async(db_conn)
+    async with db_conn.cursor() as cur:
+        await cur.execute(services.QUOTE_PRODUCTS_SQL, (services.cart_product_ids(cart_items),))
+        products = {row['id']: row for row in await cur.fetchall()}
+    await db_conn.rollback()
+    return services.price_order(products, cart_items, None, promotions)
+
+async def void_order(db_conn, order_id, user_id):
+    """See `services.void_order`."""
+    try:
+        async with db_conn.cursor() as cursor:
+            restocked = await run_steps(cursor, services.void_order_steps(order_id, user_id, datetime.datetime.now()))
+
+        await db_conn.commit()
+    except Exception as e:
+        await db_conn.rollback()
+        raise e
+
+    services.orders_voided(restocked)
+    return True
+
+async def run_steps(cursor, steps):
+    """`services.run_steps` with the statements awaited on a psycopg 3 cursor."""
+    rows = None
+    while True:
+        try:
+            sql, params, fetch = steps.send(rows)
+        except StopIteration as done:
+            return done.value
+        await cursor.execute(sql, params)
+        rows = await cursor.fetchall() if fetch == 'all' else await cursor.fetchone() if fetch == 'one' else None
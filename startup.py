@@ -0,0 +1,103 @@
+"""
+Cold start of the desktop till (run_gui.py).
+
+The tills reboot every night, so start-up time is the cashier's time:
+
+* the app is created and the server bound in a background thread while the
+  main thread loads the GUI toolkit;
+* the window opens only once the server has answered a real request
+  (`wait_until_serving`), never on a connection-refused page;
+* the DB pool and the catalog / promotion caches are filled in the
+  background (`warm_up`) while the cashier logs in;
+* every phase is timed (`StartupTimer`) and reported in one log line and
+  on /admin/metrics (`coffeepos_startup_phase_seconds`).
+
+Only the standard library is imported here; the app itself is imported by
+the phase that needs it, so its import time shows up in the breakdown.
+"""
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+
+class StartupTimer:
+    """
+    Phase durations in seconds, in the order they finished. Phases may run
+    in different threads. `on_complete(timer)` is called once, as soon as
+    every phase in `expected` has been recorded.
+    """
+
+    def __init__(self, expected=(), on_complete=None):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self._expected = set(expected)
+        self._on_complete = on_complete
+        self._lock = threading.Lock()
+        self._completed = False
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def mark(self, name):
+        """A milestone: seconds since start. Only the first mark of `name` counts."""
+        if name not in self.phases:
+            self.record(name, time.perf_counter() - self.started)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.phases[name] = seconds
+            complete = not self._completed and self._expected <= set(self.phases)
+            self._completed = self._completed or complete
+        if complete and self._on_complete is not None:
+            self._on_complete(self)
+
+    def summary(self):
+        return ', '.join(f'{name} {seconds:.3f}s' for name, seconds in list(self.phases.items()))
+
+def wait_until_serving(url, timeout=30.0, interval=0.05):
+    """
+    Poll `url` until the server answers it (any status: a 500 is still the
+    app talking). Raises TimeoutError after `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=max(interval, 2.0)) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except OSError as e: # refused / reset while the server is still coming up
+            error = e
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"{url} is not answering after {timeout:.0f}s: {error}")
+        time.sleep(interval)
+
+def warm_up(app, timer):
+    """
+    Open the DB pool's connections and load the catalog and the promotions,
+    so the first product grid and the first sale don't pay for them.
+    Failures are only logged: requests do the same work on demand.
+    """
+    import catalog
+    import db
+    import metrics
+    import pricing
+
+    with timer.phase('warmup'), app.app_context():
+        try:
+            with timer.phase('warmup_db_pool'):
+                pool = db.get_pool() # connects DB_POOL_MIN connections
+            with pool.connection() as conn:
+                with timer.phase('warmup_catalog'):
+                    catalog.cache.get(conn, max_age=app.config['CATALOG_CACHE_TTL'])
+                with timer.phase('warmup_promotions'):
+                    pricing.cache.get(conn, max_age=app.config['PROMOTIONS_CACHE_TTL'])
+                conn.rollback()
+        except Exception as e:
+            metrics.log.warning("Start-up warm-up failed, the first requests will do it: %s", e)
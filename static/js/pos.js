@@ -1,6 +1,36 @@
 let products = [];
+let productIndex = new Map(); // productId -> product, rebuilt whenever `products` is replaced
+let skuIndex = new Map(); // barcode -> product, for scanning while offline
 let categories = [];
+let activeCategory = 'all'; // Survives re-renders (taps, stock pushes, catalog sync)
 let cart = {}; // Object: productId -> { product, quantity }
+let visibleProducts = []; // What the grid shows (search results or the active category), in order
+const productCards = new Map(); // productId -> { el, badge, stock, state }: built once, then patched
+const cartRows = new Map(); // productId -> { el, key }
+const GRID_WINDOW_MIN = 60; // Up to this many cards are all in the DOM; bigger menus only render the rows in view
+const GRID_OVERSCAN_ROWS = 3; // Extra rows above/below the viewport so fast scrolling doesn't flash blanks
+let gridRowStride = null; // Card height + row gap (px), measured from the first card; cards are fixed-height
+let gridFrame = null;
+let searchResults = null; // Product ids from /api/products/search; null = no search, show the category
+let searchSeq = 0; // Answers to superseded keystrokes are dropped
+let searchTimer = null;
+const SEARCH_DEBOUNCE_MS = 150;
+const SEARCH_LIMIT = 60;
+let catalogVersion = null; // Catalog version from the server, used for delta sync
+const CATALOG_POLL_MS = 15000;
+let stockStream = null; // EventSource pushing stock changes from other tills
+let streamStartedAt = 0;
+const STREAM_RETRY_MS = 60000; // A stream the server turned away (503: too many tills) is retried this often
+const ORDER_QUEUE_KEY = 'pos.pendingOrders'; // localStorage: orders not yet confirmed by the server
+const ORDER_DRAIN_BATCH = 50; // Orders sent per /api/orders/batch request when draining
+let draining = false;
+// Totals come from /api/cart/quote, priced with the server's promotions by the same
+// code as checkout. Until it answers (or while offline) the cart shows a local estimate.
+let quote = null; // Last quote, with the `key` of the cart it was for
+let quoteSeq = 0; // Answers for an older cart are dropped
+let quoteTimer = null;
+const QUOTE_DEBOUNCE_MS = 120;
+let taxRate = 0.10; // Only for the offline estimate; updated from every quote
 
 // Formatter for IDR (Rupiah, No Decimals)
 const formatter = new Intl.NumberFormat('id-ID', {
@@ -13,8 +43,44 @@ const formatter = new Intl.NumberFormat('id-ID', {
 document.addEventListener('DOMContentLoaded', () => {
     fetchProducts();
     setupEventListeners();
+    connectStockStream();
+    // Cheap poll keeps stock fresh, only needed while the push stream is down
+    setInterval(() => {
+        if (!stockStream || stockStream.readyState !== EventSource.OPEN) syncProducts();
+        // EventSource retries network errors by itself, but gives up on an error status
+        if (stockStream && stockStream.readyState === EventSource.CLOSED
+                && Date.now() - streamStartedAt >= STREAM_RETRY_MS) connectStockStream();
+        drainOrderQueue();
+    }, CATALOG_POLL_MS);
+    window.addEventListener('online', drainOrderQueue);
+    drainOrderQueue(); // Orders left over from before a reload / crash
 });
 
+// Server-Sent Events: other tills' sales and voids show up without a reload
+function connectStockStream() {
+    if (!window.EventSource) return;
+
+    stockStream = new EventSource('/api/stream');
+    streamStartedAt = Date.now();
+    stockStream.addEventListener('open', () => {
+        // (Re)connected: catch up on anything we missed while offline
+        if (catalogVersion !== null) syncProducts();
+        drainOrderQueue();
+    });
+    stockStream.addEventListener('stock', (e) => applyStockUpdates(JSON.parse(e.data).products));
+    stockStream.addEventListener('catalog', () => syncProducts());
+    stockStream.addEventListener('resync', () => syncProducts());
+}
+
+function applyStockUpdates(rows) {
+    rows.forEach(([id, stock]) => {
+        const product = productIndex.get(id);
+        if (product) product.stock_quantity = stock;
+        if (cart[id]) cart[id].product.stock_quantity = stock;
+        refreshCard(id);
+    });
+}
+
 function setupEventListeners() {
     // QRIS Logic Toggle
     const paymentSelect = document.getElementById('payment-method');
@@ -32,12 +98,8 @@ function setupEventListeners() {
                 cashArea.classList.add('hidden');
                 qrisArea.classList.remove('hidden');
                 
-                // LOGIKA: Auto-fill harga pas (Termasuk Pajak)
-                const subtotal = Object.values(cart).reduce((sum, item) => sum + (item.product.price * item.quantity), 0);
-                const tax = Math.round(subtotal * 0.10);
-                const total = subtotal + tax;
-                
-                amountInput.value = total; // Isi otomatis input tersembunyi
+                // LOGIKA: Auto-fill harga pas (Termasuk Pajak & Diskon)
+                amountInput.value = currentGrandTotal; // Isi otomatis input tersembunyi
                 
                 // Matikan validasi visual, langsung enable tombol
                 document.getElementById('validation-msg').classList.add('hidden');
@@ -61,6 +123,35 @@ function setupEventListeners() {
             }
         });
     }
+
+    // Search box; barcode scanners type the code and press Enter
+    const search = document.getElementById('product-search');
+    if (search) {
+        search.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => searchProducts(search.value), SEARCH_DEBOUNCE_MS);
+        });
+        search.addEventListener('keydown', (e) => {
+            if (e.key !== 'Enter') return;
+            e.preventDefault();
+            clearTimeout(searchTimer);
+            scanBarcode(search.value.trim());
+        });
+    }
+
+    // Product grid: one delegated click handler instead of one per card
+    const grid = document.getElementById('product-grid');
+    if (grid) {
+        grid.addEventListener('click', (e) => {
+            const card = e.target.closest('[data-product-id]');
+            if (card) addToCart(Number(card.dataset.productId));
+        });
+        grid.addEventListener('scroll', scheduleGridWindow, { passive: true });
+        window.addEventListener('resize', () => {
+            gridRowStride = null; // Card size may have changed
+            scheduleGridWindow();
+        });
+    }
 }
 
 async function fetchProducts() {
@@ -69,64 +160,308 @@ async function fetchProducts() {
         const data = await response.json();
         products = data.products;
         categories = data.categories;
+        catalogVersion = data.version;
+        indexProducts();
 
         renderCategories();
-        renderProducts('all');
+        renderProducts();
     } catch (error) {
         console.error('Error fetching products:', error);
     }
 }
 
+// Delta sync: only download products whose price/stock/active flag changed
+// since the catalog version we already have. Falls back to a full refresh
+// when the server no longer knows our version (e.g. after a restart).
+async function syncProducts() {
+    if (catalogVersion === null) {
+        return fetchProducts();
+    }
+    try {
+        const response = await fetch(`/api/products?since=${catalogVersion}`);
+        if (response.status === 304) return;
+        const data = await response.json();
+
+        if (data.since === undefined) {
+            products = data.products;
+            categories = data.categories;
+            indexProducts();
+            renderCategories();
+        } else {
+            if (data.products.length === 0 && data.removed.length === 0 && !data.categories) {
+                catalogVersion = data.version;
+                return;
+            }
+            const removed = new Set(data.removed);
+            const changed = new Map(data.products.map(p => [p.id, p]));
+            products = products
+                .filter(p => !removed.has(p.id) && !changed.has(p.id))
+                .concat(data.products)
+                .sort((a, b) => a.id - b.id);
+            indexProducts();
+            if (data.categories) {
+                categories = data.categories;
+                renderCategories();
+            }
+        }
+        // Keep cart entries pointing at the fresh stock numbers
+        Object.keys(cart).forEach(id => {
+            const fresh = productIndex.get(cart[id].product.id);
+            if (fresh) cart[id].product = fresh;
+        });
+        catalogVersion = data.version;
+        renderProducts();
+    } catch (error) {
+        console.error('Error syncing products:', error);
+    }
+}
+
+function indexProducts() {
+    productIndex = new Map(products.map(p => [p.id, p]));
+    skuIndex = new Map(products.filter(p => p.sku).map(p => [p.sku, p]));
+    // Forget cards of products that were removed from the menu
+    productCards.forEach((entry, id) => {
+        if (!productIndex.has(id)) {
+            entry.el.remove();
+            productCards.delete(id);
+        }
+    });
+}
+
+function categoryButtonClass(active) {
+    return `px-4 py-2 rounded-full whitespace-nowrap transition ${active ? 'bg-blue-900 text-white' : 'bg-gray-200 hover:bg-gray-300'}`;
+}
+
 function renderCategories() {
     const container = document.getElementById('category-filter');
-    let html = `<button onclick="renderProducts('all')" class="px-4 py-2 bg-gray-200 rounded-full hover:bg-gray-300 focus:bg-blue-900 focus:text-white whitespace-nowrap transition">All</button>`;
+    // The active category may have been deleted in the meantime
+    if (activeCategory !== 'all' && !categories.some(c => c.id === activeCategory)) activeCategory = 'all';
+
+    const button = (id, name) =>
+        `<button data-category="${id}" onclick="selectCategory(${id === 'all' ? "'all'" : id})" class="${categoryButtonClass(id === activeCategory)}">${name}</button>`;
+    container.innerHTML = button('all', 'All') + categories.map(cat => button(cat.id, cat.name)).join('');
+}
 
-    categories.forEach(cat => {
-        html += `<button onclick="renderProducts(${cat.id})" class="px-4 py-2 bg-gray-200 rounded-full hover:bg-gray-300 focus:bg-blue-900 focus:text-white whitespace-nowrap transition">${cat.name}</button>`;
+function selectCategory(categoryId) {
+    activeCategory = categoryId;
+    clearSearch();
+    document.querySelectorAll('#category-filter button').forEach(btn => {
+        btn.className = categoryButtonClass(btn.dataset.category === String(categoryId));
     });
+    document.getElementById('product-grid').scrollTop = 0;
+    renderProducts();
+}
+
+// Recompute which products the grid shows (search results or active category), then draw the part in view
+function renderProducts() {
+    if (searchResults !== null) {
+        visibleProducts = searchResults.map(id => productIndex.get(id)).filter(Boolean);
+    } else {
+        visibleProducts = activeCategory === 'all'
+            ? products
+            : products.filter(p => p.category_id === activeCategory);
+    }
+    renderGridWindow();
+}
+
+async function searchProducts(term) {
+    const seq = ++searchSeq;
+    term = term.trim();
+    if (!term) {
+        searchResults = null;
+        renderProducts();
+        return;
+    }
+
+    let ids;
+    try {
+        const response = await fetch(`/api/products/search?q=${encodeURIComponent(term)}&limit=${SEARCH_LIMIT}`);
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        ids = (await response.json()).products.map(p => p.id);
+    } catch (error) {
+        // Offline: match names in the catalog we already have
+        const needle = term.toLowerCase();
+        ids = products.filter(p => p.sku === term || p.name.toLowerCase().includes(needle))
+            .slice(0, SEARCH_LIMIT).map(p => p.id);
+    }
+    if (seq !== searchSeq) return;
 
-    container.innerHTML = html;
+    searchResults = ids;
+    document.getElementById('product-grid').scrollTop = 0;
+    renderProducts();
 }
 
-function renderProducts(categoryId) {
+async function scanBarcode(code) {
+    if (!code) return;
+    let product = null;
+    try {
+        const response = await fetch(`/api/products/barcode/${encodeURIComponent(code)}`);
+        if (response.ok) {
+            product = await response.json();
+        } else if (response.status !== 404) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+    } catch (error) {
+        product = skuIndex.get(code) || null;
+    }
+
+    if (!product || !productIndex.has(product.id)) {
+        // Enter on a typed name: just search now; on a scanned code: tell the cashier
+        if (/^\d+$/.test(code)) {
+            showToast(`Barcode ${code} tidak dikenal`, 'error');
+        } else {
+            searchProducts(code);
+        }
+        return;
+    }
+    clearSearch();
+    renderProducts();
+    addToCart(product.id);
+}
+
+function clearSearch() {
+    const input = document.getElementById('product-search');
+    if (input) input.value = '';
+    clearTimeout(searchTimer);
+    searchSeq++;
+    searchResults = null;
+}
+
+function scheduleGridWindow() {
+    if (gridFrame !== null || visibleProducts.length <= GRID_WINDOW_MIN) return;
+    gridFrame = requestAnimationFrame(() => {
+        gridFrame = null;
+        renderGridWindow();
+    });
+}
+
+// Windowed grid: big menus only keep the rows around the viewport in the DOM;
+// padding on the grid stands in for the rows above and below so the
+// scrollbar still matches the whole menu.
+function renderGridWindow() {
     const container = document.getElementById('product-grid');
-    container.innerHTML = '';
-
-    const filtered = categoryId === 'all'
-        ? products
-        : products.filter(p => p.category_id === categoryId);
-
-    filtered.forEach(p => {
-        const isOutOfStock = p.is_inventory_managed && p.stock_quantity <= 0;
-        
-        // Cek kuantitas di cart buat badge
-        const inCart = cart[p.id] ? cart[p.id].quantity : 0;
-
-        const card = document.createElement('div');
-        card.className = `bg-white p-4 rounded-xl shadow-sm border border-gray-100 cursor-pointer transition transform hover:scale-105 relative ${isOutOfStock ? 'opacity-60 cursor-not-allowed' : ''}`;
-        
-        if (!isOutOfStock) {
-            card.onclick = () => addToCart(p.id);
+    const windowed = visibleProducts.length > GRID_WINDOW_MIN;
+    let start = 0;
+    let end = visibleProducts.length;
+
+    if (windowed) {
+        const columns = getComputedStyle(container).gridTemplateColumns.split(' ').length || 1;
+        const totalRows = Math.ceil(visibleProducts.length / columns);
+        if (gridRowStride) {
+            const firstRow = Math.max(0, Math.floor(container.scrollTop / gridRowStride) - GRID_OVERSCAN_ROWS);
+            const rows = Math.ceil(container.clientHeight / gridRowStride) + 2 * GRID_OVERSCAN_ROWS;
+            start = firstRow * columns;
+            end = Math.min(visibleProducts.length, (firstRow + rows) * columns);
+        } else {
+            end = GRID_WINDOW_MIN; // First paint: enough to fill the screen and measure a card
         }
+        container.style.paddingTop = `${(start / columns) * (gridRowStride || 0)}px`;
+        container.style.paddingBottom = `${(totalRows - Math.ceil(end / columns)) * (gridRowStride || 0)}px`;
+    } else {
+        container.style.paddingTop = '';
+        container.style.paddingBottom = '';
+    }
+
+    // Keyed reconcile: reuse each product's card, only move/insert what is out of place
+    const wanted = new Set();
+    for (let i = start; i < end; i++) wanted.add(productCard(visibleProducts[i]));
+    Array.from(container.childNodes).forEach(node => {
+        // Detached, not destroyed: the card (and its loaded <img>) stays in productCards
+        if (!wanted.has(node)) node.remove();
+    });
+    let next = container.firstChild;
+    wanted.forEach(el => {
+        if (el === next) {
+            next = next.nextSibling;
+        } else {
+            container.insertBefore(el, next);
+        }
+    });
+
+    if (windowed && !gridRowStride && measureGridRow(container)) renderGridWindow();
+}
+
+function measureGridRow(container) {
+    const card = container.querySelector('[data-product-id]');
+    if (!card || !card.offsetHeight) return false; // Not laid out yet (hidden tab)
+    gridRowStride = card.offsetHeight + (parseFloat(getComputedStyle(container).rowGap) || 0);
+    return true;
+}
+
+// The card for `p`: built on first use, afterwards only the parts that
+// changed (badge, stock, out-of-stock look) are touched, so a tap never
+// re-creates cards or reloads their images.
+function productCard(p) {
+    let entry = productCards.get(p.id);
+    if (!entry) {
+        entry = { el: document.createElement('div'), state: {} };
+        entry.el.dataset.productId = p.id;
+        productCards.set(p.id, entry);
+    }
+    patchCard(entry, p);
+    return entry.el;
+}
+
+function patchCard(entry, p) {
+    const { el, state } = entry;
+    const isOutOfStock = p.is_inventory_managed && p.stock_quantity <= 0;
+    // Cek kuantitas di cart buat badge
+    const inCart = cart[p.id] ? cart[p.id].quantity : 0;
+    const image = p.image_url ? (p.thumbnail_url || p.image_url) : null;
+
+    // Name, price or photo changed (admin edit): rebuild the card body
+    if (state.name !== p.name || state.price !== p.price || state.image !== image) {
+        el.innerHTML = `
+            <div data-role="badge" class="hidden absolute top-2 right-2 bg-blue-600 text-white text-xs font-bold w-6 h-6 flex items-center justify-center rounded-full shadow-md z-10"></div>
 
-        card.innerHTML = `
-            ${inCart > 0 ? `<div class="absolute top-2 right-2 bg-blue-600 text-white text-xs font-bold w-6 h-6 flex items-center justify-center rounded-full shadow-md z-10">${inCart}</div>` : ''}
-            
             <div class="h-32 bg-gray-100 rounded-lg mb-3 flex items-center justify-center overflow-hidden">
-                ${p.image_url ?
-                    `<img src="/static/${p.image_url}" class="h-full w-full object-cover" onerror="this.onerror=null;this.parentElement.innerText='No Image';">`
+                ${image ?
+                    `<img src="/static/${image}" loading="lazy" decoding="async" class="h-full w-full object-cover" onerror="this.onerror=null;this.parentElement.innerText='No Image';">`
                     : '<span class="text-gray-400 text-sm">No Image</span>'}
             </div>
             <h3 class="font-bold text-gray-800 text-sm h-10 leading-tight overflow-hidden">${p.name}</h3>
             <div class="flex justify-between items-center mt-2">
                 <span class="font-bold text-blue-700">${formatter.format(p.price)}</span>
-                ${isOutOfStock ? `<span class="text-xs text-red-500 font-bold">Habis</span>` : 
-                  (p.is_inventory_managed ? `<span class="text-xs text-gray-500">Stok: ${p.stock_quantity}</span>` : '')}
+                <span data-role="stock"></span>
             </div>
         `;
+        entry.badge = el.querySelector('[data-role="badge"]');
+        entry.stock = el.querySelector('[data-role="stock"]');
+        Object.assign(state, { name: p.name, price: p.price, image, inCart: undefined, stock: undefined });
+    }
 
-        container.appendChild(card);
-    });
+    if (state.outOfStock !== isOutOfStock) {
+        el.className = `bg-white p-4 rounded-xl shadow-sm border border-gray-100 cursor-pointer transition transform hover:scale-105 relative ${isOutOfStock ? 'opacity-60 cursor-not-allowed' : ''}`;
+        state.outOfStock = isOutOfStock;
+    }
+
+    if (state.inCart !== inCart) {
+        entry.badge.textContent = inCart;
+        entry.badge.classList.toggle('hidden', inCart === 0);
+        state.inCart = inCart;
+    }
+
+    const stock = isOutOfStock ? 'out' : (p.is_inventory_managed ? p.stock_quantity : null);
+    if (state.stock !== stock) {
+        if (isOutOfStock) {
+            entry.stock.className = 'text-xs text-red-500 font-bold';
+            entry.stock.textContent = 'Habis';
+        } else if (p.is_inventory_managed) {
+            entry.stock.className = 'text-xs text-gray-500';
+            entry.stock.textContent = `Stok: ${p.stock_quantity}`;
+        } else {
+            entry.stock.className = '';
+            entry.stock.textContent = '';
+        }
+        state.stock = stock;
+    }
+}
+
+// Patch one card in place; cards outside the window catch up when scrolled back in
+function refreshCard(productId) {
+    const entry = productCards.get(Number(productId));
+    const product = productIndex.get(Number(productId));
+    if (entry && product && entry.el.isConnected) patchCard(entry, product);
 }
 
 // Toast Notification (Pengganti Alert)
@@ -165,7 +500,8 @@ function createToastContainer() {
 }
 
 function addToCart(productId) {
-    const product = products.find(p => p.id === productId);
+    const product = productIndex.get(productId);
+    if (!product || (product.is_inventory_managed && product.stock_quantity <= 0)) return; // Habis: card is disabled
 
     if (product.is_inventory_managed) {
         const currentQty = cart[productId] ? cart[productId].quantity : 0;
@@ -184,7 +520,7 @@ function addToCart(productId) {
         };
     }
     renderCart();
-    renderProducts('all'); // Refresh badges
+    refreshCard(productId); // Refresh badge
 }
 
 function updateQuantity(productId, change) {
@@ -203,21 +539,30 @@ function updateQuantity(productId, change) {
             cart[productId].quantity = newQty;
         }
         renderCart();
-        renderProducts('all'); // Refresh badges
+        refreshCard(productId); // Refresh badge
     }
 }
 
+function clearCart() {
+    const ids = Object.keys(cart);
+    cart = {};
+    renderCart();
+    ids.forEach(refreshCard); // Drop the badges
+}
+
+// Keyed like the product grid: each cart line keeps its row, which is only
+// rewritten when its quantity/price/name changed.
 function renderCart() {
     const container = document.getElementById('cart-items');
     const totalEl = document.getElementById('cart-total');
     const checkoutBtn = document.getElementById('checkout-btn');
 
-    container.innerHTML = '';
-    let subtotal = 0;
-
     const itemIds = Object.keys(cart);
+    const priced = cartPricing();
+    if (!priced.quoted) scheduleQuote();
 
     if (itemIds.length === 0) {
+        cartRows.clear();
         container.innerHTML = '<div class="text-center text-gray-400 mt-10 italic">Keranjang kosong</div>';
         checkoutBtn.disabled = true;
         totalEl.innerText = formatter.format(0);
@@ -226,52 +571,151 @@ function renderCart() {
 
     checkoutBtn.disabled = false;
 
+    let summaryDiv = container.querySelector('[data-role="cart-summary"]');
+    if (!summaryDiv) {
+        container.innerHTML = ''; // Was showing "Keranjang kosong"
+        summaryDiv = document.createElement('div');
+        summaryDiv.dataset.role = 'cart-summary';
+        summaryDiv.className = 'mt-4 border-t border-dashed border-gray-300 pt-3 text-sm space-y-1';
+        container.appendChild(summaryDiv);
+    }
+
+    cartRows.forEach((row, id) => {
+        if (!cart[id]) {
+            row.el.remove();
+            cartRows.delete(id);
+        }
+    });
+
+    let next = container.firstChild;
     itemIds.forEach(id => {
         const item = cart[id];
-        const itemSubtotal = item.product.price * item.quantity;
-        subtotal += itemSubtotal;
-
-        const div = document.createElement('div');
-        div.className = 'flex justify-between items-center bg-gray-50 p-3 rounded-lg border border-gray-100';
-        div.innerHTML = `
-            <div class="flex-1">
-                <div class="font-bold text-gray-800">${item.product.name}</div>
-                <div class="text-xs text-gray-500">${formatter.format(item.product.price)} x ${item.quantity}</div>
-            </div>
-            <div class="font-bold text-gray-700 mr-3">${formatter.format(itemSubtotal)}</div>
-            <div class="flex space-x-1">
-                <button onclick="updateQuantity(${id}, -1)" class="w-7 h-7 bg-red-100 text-red-600 rounded hover:bg-red-200 font-bold">-</button>
-                <button onclick="updateQuantity(${id}, 1)" class="w-7 h-7 bg-blue-100 text-blue-600 rounded hover:bg-blue-200 font-bold">+</button>
-            </div>
-        `;
-        container.appendChild(div);
-    });
+        const line = priced.lines.get(Number(id));
 
-    const tax = Math.round(subtotal * 0.10);
-    const total = subtotal + tax;
+        let row = cartRows.get(id);
+        if (!row) {
+            row = { el: document.createElement('div'), key: null };
+            row.el.className = 'flex justify-between items-center bg-gray-50 p-3 rounded-lg border border-gray-100';
+            cartRows.set(id, row);
+        }
+        const key = `${item.quantity}|${item.product.price}|${item.product.name}|${line.subtotal}|${line.promotions}`;
+        if (row.key !== key) {
+            row.el.innerHTML = `
+                <div class="flex-1">
+                    <div class="font-bold text-gray-800">${item.product.name}</div>
+                    <div class="text-xs text-gray-500">${formatter.format(item.product.price)} x ${item.quantity}</div>
+                    ${line.discount ? `<div class="text-xs text-green-600">${line.promotions} -${formatter.format(line.discount)}</div>` : ''}
+                </div>
+                <div class="font-bold text-gray-700 mr-3">${formatter.format(line.subtotal)}</div>
+                <div class="flex space-x-1">
+                    <button onclick="updateQuantity(${id}, -1)" class="w-7 h-7 bg-red-100 text-red-600 rounded hover:bg-red-200 font-bold">-</button>
+                    <button onclick="updateQuantity(${id}, 1)" class="w-7 h-7 bg-blue-100 text-blue-600 rounded hover:bg-blue-200 font-bold">+</button>
+                </div>
+            `;
+            row.key = key;
+        }
+        if (row.el === next) {
+            next = next.nextSibling;
+        } else {
+            container.insertBefore(row.el, next);
+        }
+    });
 
     // Breakdown
-    const summaryDiv = document.createElement('div');
-    summaryDiv.className = 'mt-4 border-t border-dashed border-gray-300 pt-3 text-sm space-y-1';
     summaryDiv.innerHTML = `
-        <div class="flex justify-between text-gray-600"><span>Subtotal:</span> <span>${formatter.format(subtotal)}</span></div>
-        <div class="flex justify-between text-gray-500"><span>Pajak (10%):</span> <span>${formatter.format(tax)}</span></div>
+        <div class="flex justify-between text-gray-600"><span>Subtotal:</span> <span>${formatter.format(priced.subtotal)}</span></div>
+        ${priced.discount ? `<div class="flex justify-between text-green-600"><span>Diskon:</span> <span>-${formatter.format(priced.discount)}</span></div>` : ''}
+        <div class="flex justify-between text-gray-500"><span>Pajak (${Math.round(taxRate * 100)}%):</span> <span>${formatter.format(priced.tax)}</span></div>
     `;
-    container.appendChild(summaryDiv);
 
-    totalEl.innerText = formatter.format(total);
+    totalEl.innerText = formatter.format(priced.total);
+    refreshCheckoutTotal(priced);
+}
+
+function cartKey() {
+    return Object.keys(cart).map(id => `${id}x${cart[id].quantity}`).join(',');
+}
+
+function cartLines() {
+    return Object.keys(cart).map(id => ({
+        product_id: parseInt(id),
+        quantity: cart[id].quantity
+    }));
+}
+
+// The quote for the cart as it is now, or a local estimate without promotions:
+// { quoted, lines: Map(productId -> { subtotal, discount, promotions }), subtotal, discount, tax, total }
+function cartPricing() {
+    const key = cartKey();
+    if (quote && quote.key === key) {
+        const lines = new Map();
+        quote.lines.forEach(l => lines.set(l.product_id, {
+            subtotal: l.subtotal,
+            discount: l.discount_amount,
+            promotions: l.promotions.map(p => p.name).join(', ')
+        }));
+        return { quoted: true, lines, subtotal: quote.subtotal, discount: quote.discount_amount,
+                 tax: quote.tax_amount, total: quote.grand_total };
+    }
+    const lines = new Map();
+    let subtotal = 0;
+    Object.keys(cart).forEach(id => {
+        const lineSubtotal = cart[id].product.price * cart[id].quantity;
+        lines.set(Number(id), { subtotal: lineSubtotal, discount: 0, promotions: '' });
+        subtotal += lineSubtotal;
+    });
+    const tax = Math.round(subtotal * taxRate * 100) / 100; // cents, as the server rounds
+    return { quoted: key === '', lines, subtotal, discount: 0, tax, total: subtotal + tax };
+}
+
+function scheduleQuote() {
+    clearTimeout(quoteTimer);
+    quoteTimer = setTimeout(fetchQuote, QUOTE_DEBOUNCE_MS);
+}
+
+async function fetchQuote() {
+    const key = cartKey();
+    if (!key) return;
+    const seq = ++quoteSeq;
+    try {
+        const response = await fetch('/api/cart/quote', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ cart: cartLines() })
+        });
+        // Stock or validation problems are reported by checkout itself; keep the estimate
+        if (!response.ok) return;
+        const result = await response.json();
+        if (seq !== quoteSeq || key !== cartKey()) return; // The cart changed meanwhile
+        taxRate = result.tax_rate;
+        quote = Object.assign(result, { key });
+        renderCart();
+    } catch (e) {
+        // Offline: the estimate stays; the server prices the order when it's sent
+    }
 }
 
 // Checkout Logic Global
 let currentGrandTotal = 0;
 
+// Keeps an open checkout modal on the latest price (a quote can land after it opened)
+function refreshCheckoutTotal(priced) {
+    currentGrandTotal = priced.total;
+    const modal = document.getElementById('checkout-modal');
+    if (!modal || modal.classList.contains('hidden')) return;
+    document.getElementById('modal-total-display').innerText = formatter.format(currentGrandTotal);
+    if (document.getElementById('payment-method').value === 'qris') {
+        document.getElementById('amount-received').value = currentGrandTotal;
+    } else {
+        calculateChange();
+    }
+}
+
 function openCheckoutModal() {
     const modal = document.getElementById('checkout-modal');
     modal.classList.remove('hidden');
 
-    const subtotal = Object.values(cart).reduce((sum, item) => sum + (item.product.price * item.quantity), 0);
-    const tax = Math.round(subtotal * 0.10);
-    currentGrandTotal = subtotal + tax;
+    currentGrandTotal = cartPricing().total;
 
     document.getElementById('modal-total-display').innerText = formatter.format(currentGrandTotal);
 
@@ -316,39 +760,144 @@ function calculateChange() {
     }
 }
 
-async function submitOrder() {
-    const paymentMethod = document.getElementById('payment-method').value;
-    const amountReceived = parseFloat(document.getElementById('amount-received').value);
+// --- Offline order queue ---
+// Every order is written to localStorage with its idempotency key *before* it
+// is sent, and removed only once the server has answered. If the network or
+// server is down the sale still completes at the till; the queue is replayed
+// later and the key guarantees it is recorded exactly once.
 
-    const payload = {
-        cart: Object.keys(cart).map(id => ({
-            product_id: parseInt(id),
-            quantity: cart[id].quantity
-        })),
-        payment_method: paymentMethod,
-        amount_received: amountReceived
-    };
+function loadOrderQueue() {
+    try {
+        return JSON.parse(localStorage.getItem(ORDER_QUEUE_KEY)) || [];
+    } catch (e) {
+        return [];
+    }
+}
+
+function saveOrderQueue(queue) {
+    localStorage.setItem(ORDER_QUEUE_KEY, JSON.stringify(queue));
+}
+
+function enqueueOrder(payload) {
+    const queue = loadOrderQueue();
+    queue.push(payload);
+    saveOrderQueue(queue);
+}
+
+function dequeueOrder(key) {
+    saveOrderQueue(loadOrderQueue().filter(o => o.idempotency_key !== key));
+}
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    // randomUUID needs a secure context; tills on plain http over the LAN fall back here
+    const bytes = crypto.getRandomValues(new Uint8Array(16));
+    return Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+}
 
+// Returns { status: 'ok' | 'rejected' | 'offline', result }
+async function postOrder(payload) {
+    let response;
     try {
-        const response = await fetch('/api/orders', {
+        response = await fetch('/api/orders', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(payload)
         });
+    } catch (error) {
+        return { status: 'offline' };
+    }
+    // 5xx / gateway errors: the order may or may not exist yet, replaying the key is safe
+    if (response.status >= 500) return { status: 'offline' };
 
-        const result = await response.json();
+    let result = {};
+    try {
+        result = await response.json();
+    } catch (e) {
+        // Not our JSON (e.g. a login page after the session expired)
+        return { status: 'offline' };
+    }
+    return { status: response.ok ? 'ok' : 'rejected', result };
+}
 
-        if (response.ok) {
-            showToast(`Transaksi Sukses! Kode: ${result.transaction_code}`, 'success');
-            cart = {};
-            renderCart();
-            closeCheckoutModal();
-            fetchProducts(); // Refresh stock
-        } else {
-            showToast(`Gagal: ${result.error}`, 'error');
+async function drainOrderQueue() {
+    if (draining) return;
+    const batch = loadOrderQueue().slice(0, ORDER_DRAIN_BATCH);
+    if (!batch.length) return;
+
+    draining = true;
+    try {
+        let response;
+        try {
+            response = await fetch('/api/orders/batch', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ orders: batch })
+            });
+        } catch (error) {
+            return; // Still offline, try again later
         }
-    } catch (error) {
-        console.error('Order error:', error);
-        showToast('Terjadi kesalahan koneksi.', 'error');
+        if (!response.ok) return;
+
+        let data;
+        try {
+            data = await response.json();
+        } catch (e) {
+            return;
+        }
+
+        let sent = 0;
+        data.results.forEach((result, i) => {
+            if (result.retry) return; // Rolled back with a neighbour, stays queued
+            dequeueOrder(batch[i].idempotency_key);
+            if (result.success) {
+                sent++;
+            } else {
+                console.error('Queued order rejected:', batch[i], result);
+                showToast(`Order offline ditolak: ${result.error}`, 'error');
+            }
+        });
+        if (sent) {
+            showToast(`${sent} transaksi offline terkirim.`, 'success');
+            syncProducts();
+        }
+        // More waiting and the server is reachable: keep going
+        if (batch.length === ORDER_DRAIN_BATCH && !data.results.some(r => r.retry)) setTimeout(drainOrderQueue, 0);
+    } finally {
+        draining = false;
+    }
+}
+
+async function submitOrder() {
+    const paymentMethod = document.getElementById('payment-method').value;
+    const amountReceived = parseFloat(document.getElementById('amount-received').value);
+
+    const payload = {
+        cart: cartLines(),
+        payment_method: paymentMethod,
+        amount_received: amountReceived,
+        idempotency_key: newIdempotencyKey()
+    };
+
+    enqueueOrder(payload);
+    const { status, result } = await postOrder(payload);
+
+    if (status === 'offline') {
+        // Keep it queued; the sale is done from the customer's point of view
+        showToast('Offline: transaksi disimpan dan akan dikirim otomatis.', 'info');
+        clearCart();
+        closeCheckoutModal();
+        return;
+    }
+
+    dequeueOrder(payload.idempotency_key);
+    if (status === 'ok') {
+        showToast(`Transaksi Sukses! Kode: ${result.transaction_code}`, 'success');
+        clearCart();
+        closeCheckoutModal();
+        syncProducts(); // Refresh stock
+        drainOrderQueue(); // We're online: flush anything queued earlier
+    } else {
+        showToast(`Gagal: ${result.error}`, 'error');
     }
-}
\ No newline at end of file
+}
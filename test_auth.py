@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import patch
+from auth import IdentityCache
+
+class TestIdentityCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = IdentityCache(maxsize=2, ttl=60)
+        cache.put(1, {'id': 1})
+        cache.put(2, {'id': 2})
+        cache.get(1) # 1 is now most recently used
+        cache.put(3, {'id': 3})
+
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(1), {'id': 1})
+        self.assertEqual(cache.get(3), {'id': 3})
+
+    def test_entries_expire(self):
+        cache = IdentityCache(ttl=60)
+        with patch('auth.time.monotonic', return_value=1000.0):
+            cache.put(1, {'id': 1, 'role_name': 'admin'})
+        with patch('auth.time.monotonic', return_value=1059.0):
+            self.assertIsNotNone(cache.get(1))
+        with patch('auth.time.monotonic', return_value=1061.0):
+            self.assertIsNone(cache.get(1))
+
+    def test_invalidate(self):
+        cache = IdentityCache()
+        cache.put(1, {'id': 1})
+        cache.put(2, {'id': 2})
+
+        cache.invalidate(1)
+        self.assertIsNone(cache.get(1))
+        self.assertIsNotNone(cache.get(2))
+
+        cache.invalidate()
+        self.assertIsNone(cache.get(2))
+
+if __name__ == '__main__':
+    unittest.main()
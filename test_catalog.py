@@ -0,0 +1,136 @@
+import unittest
+import json
+from unittest.mock import MagicMock
+import catalog
+
+def product_row(pid, name, stock=0, active=True):
+    return {
+        'id': pid, 'category_id': 1, 'category_name': 'Drinks', 'name': name, 'sku': None, 'price': 2.00,
+        'is_inventory_managed': True, 'stock_quantity': stock, 'image_url': None, 'thumbnail_url': None, 'is_active': active
+    }
+
+class TestCatalogCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = catalog.CatalogCache()
+        self.mock_conn = MagicMock()
+        self.mock_cursor = self.mock_conn.cursor.return_value.__enter__.return_value
+
+    def test_served_from_memory_until_invalidated(self):
+        self.mock_cursor.fetchall.side_effect = [
+            [{'id': 1, 'name': 'Drinks'}],
+            [product_row(1, 'Water', 10), product_row(2, 'Juice', 5)],
+        ]
+
+        version, body = self.cache.get(self.mock_conn)
+        self.assertEqual(self.cache.get(self.mock_conn), (version, body))
+        self.assertEqual(self.mock_cursor.execute.call_count, 2)
+
+        data = json.loads(body)
+        self.assertEqual([p['name'] for p in data['products']], ['Water', 'Juice'])
+        self.assertEqual(data['categories'], [{'id': 1, 'name': 'Drinks'}])
+
+    def test_invalidate_refreshes_only_changed_products(self):
+        self.mock_cursor.fetchall.side_effect = [
+            [{'id': 1, 'name': 'Drinks'}],
+            [product_row(1, 'Water', 10), product_row(2, 'Juice', 5)],
+            [product_row(1, 'Water', 7), product_row(2, 'Juice', 5, active=False)],
+        ]
+        old_version, _ = self.cache.get(self.mock_conn)
+
+        self.cache.invalidate([1, 2])
+        version, body = self.cache.get(self.mock_conn)
+
+        self.assertGreater(version, old_version)
+        sql, params = self.mock_cursor.execute.call_args[0]
+        self.assertIn('p.id = ANY(%s)', sql)
+        self.assertEqual(params, ([1, 2],))
+
+        # Stock updated in place, deactivated product dropped from the POS
+        products = json.loads(body)['products']
+        self.assertEqual([(p['id'], p['stock_quantity']) for p in products], [(1, 7)])
+
+    def test_delta_since_version(self):
+        self.mock_cursor.fetchall.side_effect = [
+            [{'id': 1, 'name': 'Drinks'}],
+            [product_row(1, 'Water', 10), product_row(2, 'Juice', 5), product_row(3, 'Soda', 4)],
+            [product_row(1, 'Water', 8), product_row(3, 'Soda', 4, active=False)],
+        ]
+        since, _ = self.cache.get(self.mock_conn)
+
+        self.cache.invalidate([1, 3])
+        version, body = self.cache.delta(self.mock_conn, since)
+
+        data = json.loads(body)
+        self.assertEqual(data['version'], version)
+        self.assertEqual([(p['id'], p['stock_quantity']) for p in data['products']], [(1, 8)])
+        self.assertEqual(data['removed'], [3])
+        self.assertNotIn('categories', data)
+
+        # Nothing changed after the latest version
+        _, body = self.cache.delta(self.mock_conn, version)
+        self.assertEqual(json.loads(body)['products'], [])
+
+    def test_delta_unknown_version_needs_full_catalog(self):
+        self.mock_cursor.fetchall.side_effect = [[{'id': 1, 'name': 'Drinks'}], [product_row(1, 'Water', 10)]]
+        version, _ = self.cache.get(self.mock_conn)
+
+        self.assertIsNone(self.cache.delta(self.mock_conn, 42))          # from an older process
+        self.assertIsNone(self.cache.delta(self.mock_conn, version + 1)) # from the future
+
+    def test_versions_never_shared_between_processes(self):
+        # A forked worker starts its own cache; another process's version is unknown to ours
+        self.mock_cursor.fetchall.side_effect = [[{'id': 1, 'name': 'Drinks'}], [product_row(1, 'Water', 10)]] * 2
+        parent = catalog.cache
+        self.addCleanup(setattr, catalog, 'cache', parent)
+        catalog._reset_after_fork()
+        self.assertIsNot(catalog.cache, parent)
+
+        theirs, _ = catalog.CatalogCache().get(self.mock_conn)
+        ours, _ = self.cache.get(self.mock_conn)
+        self.assertNotEqual(theirs // catalog.VERSION_SPAN, ours // catalog.VERSION_SPAN)
+        self.assertIsNone(self.cache.delta(self.mock_conn, theirs))
+
+    def test_used_up_epoch_starts_a_new_one(self):
+        self.mock_cursor.fetchall.side_effect = [[{'id': 1, 'name': 'Drinks'}], [product_row(1, 'Water', 10)]] * 2
+        since, _ = self.cache.get(self.mock_conn)
+        self.cache._version = self.cache._base_version + catalog.VERSION_SPAN - 1
+
+        self.cache.invalidate([1])
+        version, _ = self.cache.get(self.mock_conn)
+
+        self.assertEqual(version, self.cache._base_version + 1)
+        self.assertIsNone(self.cache.delta(self.mock_conn, since))
+
+class TestProductSearch(unittest.TestCase):
+    def setUp(self):
+        self.mock_conn = MagicMock()
+        self.mock_cursor = self.mock_conn.cursor.return_value.__enter__.return_value
+
+    def test_sku_then_prefix_then_words(self):
+        self.mock_cursor.fetchall.side_effect = [
+            [],                                                       # SKU
+            [product_row(4, 'Latte'), product_row(9, 'Latte 50% Less Sugar')],  # prefix
+            [product_row(7, 'Iced Latte'), product_row(2, 'Hot Latte')],  # word match
+        ]
+        results = catalog.search(self.mock_conn, ' Latte ', 5)
+
+        self.assertEqual([p['name'] for p in results], ['Latte', 'Latte 50% Less Sugar', 'Hot Latte', 'Iced Latte'])
+        params = self.mock_cursor.execute.call_args_list[1][0][1]
+        self.assertEqual((params['prefix'], params['words'], params['limit']), ('latte%', 'latte:*', 5))
+
+    def test_short_or_literal_terms(self):
+        self.mock_cursor.fetchall.side_effect = [[], [product_row(1, 'La Mer Tea')]]
+        catalog.search(self.mock_conn, 'l', 5)
+        # Too short to look inside names
+        self.assertEqual(self.mock_cursor.execute.call_count, 2)
+
+        self.mock_cursor.fetchall.side_effect = [[], [], []]
+        catalog.search(self.mock_conn, "50%_ & !x", 5)
+        params = self.mock_cursor.execute.call_args_list[3][0][1]
+        self.assertEqual(params['prefix'], '50\\%\\_ & !x%')
+        self.assertEqual(params['words'], '50:* & x:*')
+
+        self.assertEqual(catalog.search(self.mock_conn, '   ', 5), [])
+
+if __name__ == '__main__':
+    unittest.main()
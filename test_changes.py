@@ -0,0 +1,61 @@
+import json
+import unittest
+from unittest.mock import patch
+import changes
+import db
+import events
+
+def payload(**change):
+    return json.dumps({'origin': 'coffeepos-1-other', **change})
+
+class TestChangeNotifications(unittest.TestCase):
+    def setUp(self):
+        self.broker = events.Broker()
+        self.sub = self.broker.subscribe()
+        patch('events.broker', self.broker).start()
+        self.catalog = patch('changes.catalog').start()
+        self.pricing = patch('changes.pricing').start()
+        self.addCleanup(patch.stopall)
+
+    def test_sale_on_another_worker_reaches_our_tills(self):
+        changes.handle(payload(table='products', stock=[[3, 47], [5, 0]], products=[]))
+
+        self.catalog.invalidate.assert_called_once_with([3, 5])
+        self.assertEqual(self.sub.get(timeout=0), [('stock', {'products': [[3, 47], [5, 0]]})])
+
+    def test_product_edit_asks_tills_to_sync(self):
+        changes.handle(payload(table='products', stock=[], products=[7]))
+
+        self.catalog.invalidate.assert_called_once_with([7])
+        self.assertEqual(self.sub.get(timeout=0), [('catalog', {'products': [7]})])
+
+    def test_bulk_or_category_change_reloads_everything(self):
+        changes.handle(payload(table='products'))
+        changes.handle(payload(table='categories'))
+
+        self.assertEqual(self.catalog.invalidate.call_args_list, [((),), ((),)])
+        self.assertEqual(self.sub.get(timeout=0), [('catalog', {}), ('catalog', {})])
+
+    def test_promotions(self):
+        changes.handle(payload(table='promotions'))
+
+        self.pricing.invalidate.assert_called_once_with()
+        self.catalog.invalidate.assert_not_called()
+
+    def test_own_writes_are_skipped(self):
+        changes.handle(json.dumps({'origin': db.application_name(), 'table': 'products', 'stock': [[3, 47]],
+                                   'products': []}))
+
+        self.catalog.invalidate.assert_not_called()
+        self.assertEqual(self.sub.get(timeout=0), [])
+
+    def test_unreadable_payload_resyncs(self):
+        with self.assertLogs('coffeepos', level='WARNING'):
+            changes.handle('{"origin": ')
+
+        self.catalog.invalidate.assert_called_once_with()
+        self.pricing.invalidate.assert_called_once_with()
+        self.assertEqual(self.sub.get(timeout=0), [('resync', {})])
+
+if __name__ == '__main__':
+    unittest.main()
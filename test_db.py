@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from psycopg2 import extensions
+import db
+
+def make_conn():
+    conn = MagicMock()
+    conn.closed = 0
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('db.psycopg2.connect', side_effect=lambda **kw: make_conn())
+        self.mock_connect = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reuses_connections(self):
+        pool = db.ConnectionPool({'dbname': 'x'}, minconn=1, maxconn=2)
+
+        conn = pool.getconn()
+        pool.putconn(conn)
+        self.assertIs(pool.getconn(), conn)
+
+        self.assertEqual(self.mock_connect.call_count, 1)
+        self.assertEqual(pool.stats()['in_use'], 1)
+
+    def test_broken_connection_is_recycled(self):
+        pool = db.ConnectionPool({'dbname': 'x'}, minconn=1, maxconn=1)
+
+        conn = pool.getconn()
+        conn.closed = 2 # Server went away while checked out
+        pool.putconn(conn)
+
+        fresh = pool.getconn()
+        self.assertIsNot(fresh, conn)
+        self.assertEqual(pool.stats()['recycled'], 1)
+
+        # Shutdown is counted apart from retired connections
+        pool.putconn(fresh)
+        pool.closeall()
+        self.assertEqual(pool.stats()['recycled'], 1)
+        self.assertEqual(pool.stats()['closed'], 1)
+
+    def test_failed_ping_reconnects(self):
+        pool = db.ConnectionPool({'dbname': 'x'}, minconn=1, maxconn=1, ping_after=0)
+        stale = pool._idle[0]
+        stale.cursor.return_value.__enter__.return_value.execute.side_effect = \
+            db.psycopg2.OperationalError('server closed the connection')
+
+        conn = pool.getconn()
+
+        self.assertIsNot(conn, stale)
+        self.assertEqual(pool.stats()['failed_pings'], 1)
+
+    def test_open_transaction_rolled_back_on_return(self):
+        pool = db.ConnectionPool({'dbname': 'x'}, minconn=0, maxconn=1)
+
+        conn = pool.getconn()
+        conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+        pool.putconn(conn)
+
+        conn.rollback.assert_called_once()
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_autocommit_reset_and_failed_cleanup_discards(self):
+        pool = db.ConnectionPool({'dbname': 'x'}, minconn=0, maxconn=1)
+
+        conn = pool.getconn()
+        conn.autocommit = True # e.g. init_db.py
+        pool.putconn(conn)
+        self.assertIs(conn.autocommit, False)
+        self.assertIs(pool.getconn(), conn)
+
+        conn.info.transaction_status = extensions.TRANSACTION_STATUS_INERROR
+        conn.rollback.side_effect = db.psycopg2.DatabaseError('rollback failed')
+        pool.putconn(conn)
+        conn.close.assert_called_once()
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    def test_exhausted_pool_times_out(self):
+        pool = db.ConnectionPool({'dbname': 'x'}, minconn=0, maxconn=1, timeout=0.05)
+        pool.getconn()
+
+        with self.assertRaises(db.PoolTimeout):
+            pool.getconn()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_forked_child_never_reuses_parent_connections(self):
+        pool = db.ConnectionPool({'dbname': 'x'}, minconn=2, maxconn=2)
+        inherited = list(pool._idle)
+
+        with patch('db.os.getpid', return_value=pool._pid + 1):
+            conn = pool.getconn()
+
+        self.assertNotIn(conn, inherited)
+        for parent_conn in inherited:
+            parent_conn.close.assert_not_called() # would kill the parent's session
+        self.assertEqual(pool.stats()['in_use'], 1)
+        self.assertEqual(pool.stats()['idle'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import unittest
+import events
+
+class TestBroker(unittest.TestCase):
+    def setUp(self):
+        self.broker = events.Broker()
+
+    def test_publish_reaches_every_subscriber(self):
+        a = self.broker.subscribe()
+        b = self.broker.subscribe()
+
+        events.broker, original = self.broker, events.broker
+        try:
+            events.publish_stock([{'id': 3, 'stock_quantity': 48}])
+        finally:
+            events.broker = original
+
+        for sub in (a, b):
+            self.assertEqual(sub.get(timeout=0), [('stock', {'products': [[3, 48]]})])
+
+    def test_slow_client_gets_resync_instead_of_backlog(self):
+        sub = self.broker.subscribe(maxsize=2)
+        for i in range(5):
+            self.broker.publish('stock', {'products': [[1, i]]})
+
+        self.assertEqual(sub.get(timeout=0), [('resync', {})])
+        self.assertEqual(sub.get(timeout=0), [])
+
+    def test_unsubscribe(self):
+        sub = self.broker.subscribe()
+        self.broker.unsubscribe(sub)
+        self.broker.publish('catalog', {})
+
+        self.assertEqual(self.broker.client_count(), 0)
+        self.assertEqual(sub.get(timeout=0), [])
+
+    def test_limit_turns_extra_terminals_away(self):
+        first = self.broker.subscribe(limit=1)
+        self.assertIsNone(self.broker.subscribe(limit=1))
+
+        self.broker.unsubscribe(first)
+        self.assertIsNotNone(self.broker.subscribe(limit=1))
+
+    def test_async_subscriber_wakes_on_publish_from_thread(self):
+        async def run():
+            sub = self.broker.subscribe_async(maxsize=2)
+            waiter = asyncio.ensure_future(sub.get(timeout=5))
+            await asyncio.sleep(0)
+            threading.Thread(target=self.broker.publish, args=('catalog', {})).start()
+            first = await waiter
+
+            for i in range(5):
+                self.broker.publish('stock', {'products': [[1, i]]})
+            await asyncio.sleep(0)
+            return first, await sub.get(timeout=0), await sub.get(timeout=0)
+
+        first, overflow, empty = asyncio.run(run())
+        self.assertEqual(first, [('catalog', {})])
+        self.assertEqual(overflow, [('resync', {})])
+        self.assertEqual(empty, [])
+
+    def test_format_sse(self):
+        self.assertEqual(events.format_sse('stock', {'products': [[1, 2]]}),
+                         'event: stock\ndata: {"products":[[1,2]]}\n\n')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import io
+import os
+import threading
+import tempfile
+from werkzeug.datastructures import FileStorage
+from PIL import Image
+import images
+
+def _jpeg(color='red', size=(1200, 900)):
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, 'JPEG')
+    return out.getvalue()
+
+class TestImages(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _save(self, data, filename='photo.JPEG'):
+        return images.save_product_image(FileStorage(io.BytesIO(data), filename=filename), self.tmp.name)
+
+    def test_content_addressed_names_and_thumbnail(self):
+        image_url, thumbnail_url = self._save(_jpeg())
+
+        self.assertTrue(images.is_content_addressed(image_url))
+        self.assertTrue(images.is_content_addressed(thumbnail_url))
+        self.assertTrue(image_url.endswith('.jpg'))
+        self.assertTrue(thumbnail_url.endswith('.thumb.webp'))
+
+        with Image.open(os.path.join(self.tmp.name, os.path.basename(thumbnail_url))) as thumb:
+            self.assertEqual(thumb.format, 'WEBP')
+            self.assertLessEqual(thumb.width, 320)
+            self.assertLessEqual(thumb.height, 256)
+
+    def test_same_photo_is_stored_once(self):
+        first = self._save(_jpeg(), 'latte.jpg')
+        second = self._save(_jpeg(), 'copy of latte.jpg')
+        other = self._save(_jpeg('blue'), 'tea.jpg')
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(len(os.listdir(self.tmp.name)), 4)
+
+    def test_rejects_non_images(self):
+        with self.assertRaises(images.InvalidImage):
+            self._save(b'not really a jpeg')
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_concurrent_writes_of_one_file(self):
+        # Two uploads of the same photo in one process race on the same target
+        path = os.path.join(self.tmp.name, 'same.jpg')
+        payloads = [bytes([n]) * 100000 for n in range(8)]
+        errors = []
+        def write(data):
+            try:
+                images._atomic_write(path, data)
+            except OSError as e:
+                errors.append(e)
+        threads = [threading.Thread(target=write, args=(data,)) for data in payloads]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(self.tmp.name), ['same.jpg'])
+        with open(path, 'rb') as f:
+            self.assertIn(f.read(), payloads)
+
+    def test_is_content_addressed(self):
+        self.assertFalse(images.is_content_addressed('uploads/latte.jpg'))
+        self.assertFalse(images.is_content_addressed('css/style.css'))
+
+if __name__ == '__main__':
+    unittest.main()
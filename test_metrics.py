@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import patch
+from flask import Flask
+import metrics
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Metrics()
+        patcher = patch('metrics.registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.app = Flask(__name__)
+        self.app.config.update(SLOW_QUERY_MS=50, N_PLUS_ONE_THRESHOLD=3)
+
+        @self.app.route('/void')
+        def void():
+            # A query in a loop: the same statement once per order item
+            for product_id in range(5):
+                metrics.record_query(f"UPDATE products SET stock_quantity = stock_quantity + %s WHERE id = {product_id}", 0.001)
+            metrics.record_query("SELECT pg_sleep(0.1)", 0.1)
+            return 'ok'
+
+        metrics.init_app(self.app)
+
+    def test_request_stats_and_n_plus_one(self):
+        with self.assertLogs('coffeepos', level='WARNING') as logs:
+            response = self.app.test_client().get('/void')
+
+        self.assertIn('db;dur=105.0;desc="6 queries"', response.headers.getlist('Server-Timing'))
+        # Flagged once per request, not once per extra execution
+        self.assertEqual(sum('Possible N+1 in void' in line for line in logs.output), 1)
+        self.assertEqual(sum('Slow query' in line for line in logs.output), 1)
+
+        body = self.registry.render()
+        self.assertIn('coffeepos_http_requests_total{method="GET",endpoint="void",status="200"} 1', body)
+        self.assertIn('coffeepos_http_request_queries_bucket{endpoint="void",le="5"} 0', body)
+        self.assertIn('coffeepos_http_request_queries_bucket{endpoint="void",le="10"} 1', body)
+        self.assertIn('coffeepos_db_queries_total{endpoint="void"} 6', body)
+        self.assertIn('coffeepos_db_n_plus_one_total{endpoint="void"} 1', body)
+        self.assertIn('coffeepos_db_slow_queries_total{endpoint="void"} 1', body)
+
+    def test_histogram_buckets_are_cumulative(self):
+        h = metrics.Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            h.observe(value)
+        out = []
+        metrics._histogram(out, 'x', 'help', {'a="b"': h})
+        self.assertEqual(out[1:4], ['x_bucket{a="b",le="0.1"} 2\n', 'x_bucket{a="b",le="1.0"} 3\n',
+                                    'x_bucket{a="b",le="+Inf"} 4\n'])
+        self.assertEqual(out[5], 'x_count{a="b"} 4\n')
+
+    def test_pool_and_orders(self):
+        self.registry.count_orders('created', 3)
+        self.registry.count_orders('replayed')
+        body = self.registry.render(pool_stats={
+            'size': 2, 'idle': 1, 'in_use': 1, 'maxconn': 10, 'checkouts': 7, 'connects': 2,
+            'recycled': 0, 'closed': 0, 'failed_pings': 0, 'waits': 0, 'timeouts': 0, 'wait_seconds': 0.0,
+        }, sse_clients=4)
+        self.assertIn('coffeepos_orders_total{outcome="created"} 3\n', body)
+        self.assertIn('coffeepos_db_pool_in_use 1\n', body)
+        self.assertIn('coffeepos_db_pool_checkouts_total 7\n', body)
+        self.assertIn('coffeepos_sse_clients 4\n', body)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import datetime
+import gzip
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+import psycopg2
+import partitions
+
+class TestPartitions(unittest.TestCase):
+    def setUp(self):
+        self.mock_conn = MagicMock()
+        self.mock_cursor = MagicMock()
+        self.mock_conn.cursor.return_value = self.mock_cursor
+        self.dir = tempfile.mkdtemp()
+
+    def test_missing_partition(self):
+        self.assertTrue(partitions.missing_partition(
+            psycopg2.errors.CheckViolation('no partition of relation "orders" found for row')))
+        self.assertFalse(partitions.missing_partition(
+            psycopg2.errors.CheckViolation('new row violates check constraint "positive_price"')))
+        self.assertFalse(partitions.missing_partition(Exception('no partition of relation')))
+
+    def test_archive_month_dumps_then_drops(self):
+        def copy_expert(sql, f):
+            f.write(b'id,created_at\n1,2024-06-01 10:00:00\n')
+            self.mock_cursor.rowcount = 1
+        self.mock_cursor.copy_expert.side_effect = copy_expert
+
+        summary = partitions.archive_month(self.mock_conn, datetime.date(2024, 6, 1), self.dir)
+
+        self.assertEqual((summary['orders'], summary['items']), (1, 1))
+        with gzip.open(os.path.join(self.dir, 'orders_2024_06.csv.gz'), 'rt') as f:
+            self.assertEqual(f.readline(), 'id,created_at\n')
+        self.assertFalse([name for name in os.listdir(self.dir) if name.endswith('.tmp')])
+
+        statements = [c[0][0] for c in self.mock_cursor.execute.call_args_list]
+        self.assertEqual(statements[1:4], [
+            "ALTER TABLE order_items DETACH PARTITION order_items_p2024_06",
+            "ALTER TABLE orders DETACH PARTITION orders_p2024_06",
+            "DROP TABLE order_items_p2024_06, orders_p2024_06",
+        ])
+        self.mock_conn.commit.assert_called_once()
+
+    def test_archive_month_failure_keeps_partitions(self):
+        self.mock_cursor.copy_expert.side_effect = lambda sql, f: f.write(b'id\n')
+        self.mock_cursor.execute.side_effect = [None, Exception('lock timeout')]
+
+        with self.assertRaises(Exception):
+            partitions.archive_month(self.mock_conn, datetime.date(2024, 6, 1), self.dir)
+
+        self.mock_conn.rollback.assert_called_once()
+        self.mock_conn.commit.assert_not_called()
+        self.assertEqual(os.listdir(self.dir), [])
+
+if __name__ == '__main__':
+    unittest.main()
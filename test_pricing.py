@@ -0,0 +1,143 @@
+import datetime
+import unittest
+from decimal import Decimal
+from unittest.mock import MagicMock
+import pricing
+import services
+
+NOW = datetime.datetime(2025, 3, 14, 16, 30)
+
+PRODUCTS = {
+    1: {'id': 1, 'category_id': 1, 'name': 'Latte', 'price': Decimal('30000'), 'is_inventory_managed': False,
+        'stock_quantity': 0, 'is_active': True},
+    2: {'id': 2, 'category_id': 1, 'name': 'Americano', 'price': Decimal('20000'), 'is_inventory_managed': False,
+        'stock_quantity': 0, 'is_active': True},
+    3: {'id': 3, 'category_id': 2, 'name': 'Croissant', 'price': Decimal('25000'), 'is_inventory_managed': True,
+        'stock_quantity': 10, 'is_active': True},
+}
+
+def promotion(id, kind, params, **fields):
+    return pricing.compile_rule(dict(fields, id=id, name=f'Promo {id}', kind=kind, params=params))
+
+def index(*rules):
+    return pricing.RuleIndex(1, list(rules))
+
+class TestPricing(unittest.TestCase):
+    def price(self, cart, *rules, now=NOW):
+        return services.price_order(PRODUCTS, cart, None, index(*rules), now)
+
+    def test_no_promotions_is_plain_price_plus_tax(self):
+        priced = self.price([{'product_id': 1, 'quantity': 2}])
+        self.assertEqual(priced['discount_amount'], Decimal('0.00'))
+        self.assertEqual(priced['tax_amount'], Decimal('6000'))
+        self.assertEqual(priced['grand_total'], Decimal('66000'))
+        self.assertIsNone(priced['change_amount'])
+
+    def test_category_discount_and_happy_hour(self):
+        category = promotion(1, 'percent_off', {'percent': 10}, category_id=1)
+        happy_hour = promotion(2, 'percent_off', {'percent': 50}, product_ids=[2], priority=5,
+                               daily_start=datetime.time(15), daily_end=datetime.time(17))
+        cart = [{'product_id': 1, 'quantity': 1}, {'product_id': 2, 'quantity': 2}, {'product_id': 3, 'quantity': 1}]
+
+        # 16:30: the Americanos get the happy hour (higher priority), the Latte the category discount
+        lines = self.price(cart, category, happy_hour)['items']
+        self.assertEqual([l['discount_amount'] for l in lines], [Decimal('3000.00'), Decimal('20000.00'), Decimal('0.00')])
+        self.assertEqual(lines[1]['promotions'], [{'id': 2, 'name': 'Promo 2'}])
+        self.assertEqual(lines[1]['subtotal'], Decimal('20000.00'))
+
+        # 18:00: happy hour is over, the category discount takes the Americanos too
+        later = self.price(cart, category, happy_hour, now=NOW.replace(hour=18))
+        self.assertEqual(later['discount_amount'], Decimal('7000.00'))
+
+    def test_buy_x_get_y_cheapest_units_free(self):
+        rule = promotion(1, 'buy_x_get_y', {'buy': 2, 'get': 1}, category_id=1)
+        # 5 units sorted by price: L L A | A A -> one complete group, its cheapest (an Americano) is free
+        priced = self.price([{'product_id': 2, 'quantity': 3}, {'product_id': 1, 'quantity': 2}], rule)
+        self.assertEqual(priced['discount_amount'], Decimal('20000.00'))
+        self.assertEqual(priced['items'][0]['discount_amount'], Decimal('20000.00'))
+
+        # 6 units: two groups, two free
+        priced = self.price([{'product_id': 2, 'quantity': 6}], rule)
+        self.assertEqual(priced['discount_amount'], Decimal('40000.00'))
+
+    def test_bundle_spreads_saving_and_leaves_rest(self):
+        bundle = promotion(1, 'bundle', {'items': [[1, 1], [3, 1]], 'price': 45000})
+        everything = promotion(2, 'percent_off', {'percent': 10}, priority=-1)
+        priced = self.price([{'product_id': 1, 'quantity': 2}, {'product_id': 3, 'quantity': 1}], bundle, everything)
+
+        # One bundle (saving 10000, split 30:25), the second Latte gets 10% instead
+        latte, croissant = priced['items']
+        self.assertEqual(croissant['discount_amount'], Decimal('4545.45'))
+        self.assertEqual(latte['discount_amount'], Decimal('5454.55') + Decimal('3000.00'))
+        self.assertEqual(priced['discount_amount'], Decimal('13000.00'))
+        self.assertEqual(priced['grand_total'], (Decimal('85000') - Decimal('13000.00')) * Decimal('1.10'))
+
+    def test_totals_in_cents_and_exact_float_payment(self):
+        products = {4: dict(PRODUCTS[1], id=4, price=Decimal('12345'))}
+        rule = promotion(1, 'percent_off', {'percent': 7})
+        quoted = services.price_order(products, [{'product_id': 4, 'quantity': 1}], None, index(rule), NOW)
+        # 12345 - 864.15 = 11480.85, tax 1148.085 -> 1148.09
+        self.assertEqual(str(quoted['tax_amount']), '1148.09')
+        self.assertEqual(str(quoted['grand_total']), '12628.94')
+
+        # The QRIS path pays exactly the quote's (JSON float) grand_total
+        paid = services.price_order(products, [{'product_id': 4, 'quantity': 1}], float(quoted['grand_total']),
+                                    index(rule), NOW)
+        self.assertEqual(paid['change_amount'], 0)
+        with self.assertRaises(Exception) as cm:
+            services.price_order(products, [{'product_id': 4, 'quantity': 1}], 'abc', index(rule), NOW)
+        self.assertEqual(str(cm.exception), "Invalid amount received: 'abc'")
+
+    def test_inactive_window_and_invalid_rules(self):
+        future = promotion(1, 'percent_off', {'percent': 10}, starts_at=NOW + datetime.timedelta(days=1))
+        self.assertEqual(self.price([{'product_id': 1, 'quantity': 1}], future)['discount_amount'], Decimal('0.00'))
+
+        with self.assertRaises(ValueError):
+            promotion(2, 'percent_off', {'percent': 150})
+        with self.assertRaises(ValueError):
+            promotion(3, 'bundle', {'items': [[1, 1]], 'price': 1000})
+        with self.assertRaises(ValueError):
+            pricing.promotion_fields({'name': 'x', 'kind': 'percent_off', 'params': {}})
+
+        base = {'name': 'x', 'kind': 'percent_off', 'params': {'percent': 10}}
+        for value, expected in [(False, False), ('false', False), ('0', False), (None, True), ('yes', True)]:
+            self.assertIs(pricing.promotion_fields(dict(base, is_active=value))['is_active'], expected)
+        with self.assertRaises(ValueError):
+            pricing.promotion_fields(dict(base, is_active='maybe'))
+
+    def test_save_rejects_unknown_products_and_category(self):
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchall.return_value = [{'id': 3}]
+        cursor.fetchone.return_value = None
+
+        with self.assertRaises(ValueError) as cm:
+            pricing.save_promotion(conn, {'name': 'Set', 'kind': 'bundle', 'params': {'items': [[3, 1], [7, 1]], 'price': 1}})
+        self.assertEqual(str(cm.exception), 'Unknown product ID(s): 7')
+
+        with self.assertRaises(ValueError) as cm:
+            pricing.save_promotion(conn, {'name': 'Pastry', 'kind': 'percent_off', 'params': {'percent': 10},
+                                          'category_id': 999})
+        self.assertEqual(str(cm.exception), 'Unknown category ID: 999')
+        conn.commit.assert_not_called()
+
+    def test_cache_compiles_once_per_version(self):
+        conn = MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [{'id': 1, 'name': 'Promo', 'kind': 'percent_off', 'params': {'percent': 10},
+                                         'product_ids': None, 'category_id': 1, 'starts_at': None, 'ends_at': None,
+                                         'daily_start': None, 'daily_end': None, 'priority': 0}]
+        cache = pricing.PromotionCache()
+
+        first = cache.get(conn)
+        self.assertIs(cache.get(conn), first)
+        self.assertEqual(cursor.execute.call_count, 1)
+
+        cache.invalidate()
+        second = cache.get(conn)
+        self.assertEqual(second.version, first.version + 1)
+        self.assertEqual(len(second), 1)
+        self.assertEqual(cursor.execute.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
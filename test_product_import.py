@@ -0,0 +1,122 @@
+import unittest
+import io
+from decimal import Decimal
+from unittest.mock import MagicMock
+from werkzeug.datastructures import FileStorage
+import product_import
+
+class TestProductImport(unittest.TestCase):
+    def test_validate_clean_row(self):
+        row, error = product_import.validate({
+            'name': ' Latte ', 'category': 'Coffee', 'price': '25000',
+            'is_inventory_managed': 'no', 'stock_quantity': '', 'is_active': 'yes'
+        })
+        self.assertIsNone(error)
+        self.assertEqual(row, ('Latte', 'Coffee', Decimal('25000'), False, 0, True, None))
+
+    def test_validate_reports_bad_values(self):
+        cases = [
+            ({'name': '', 'category': 'Coffee', 'price': '1'}, 'name is required'),
+            ({'name': 'Latte', 'category': 'Coffee', 'price': 'abc'}, "invalid price 'abc'"),
+            ({'name': 'Latte', 'category': 'Coffee', 'price': '-1'}, "invalid price '-1'"),
+            ({'name': 'Latte', 'category': 'Coffee', 'price': '1', 'stock_quantity': '-3'}, 'stock_quantity cannot be negative'),
+            ({'name': 'Latte', 'category': 'Coffee', 'price': '1', 'is_active': 'maybe'}, "expected yes/no, got 'maybe'"),
+            ({'name': 'Latte', 'category': 'Coffee', 'price': '1e20'}, "price '1e20' is too large"),
+            ({'name': 'Latte', 'category': 'Coffee', 'price': '9999999999999.999'}, "price '9999999999999.999' is too large"),
+            ({'name': 'Latte', 'category': 'Coffee', 'price': '1', 'stock_quantity': '99999999999'},
+             "stock_quantity '99999999999' is too large"),
+            ({'name': 'Latte', 'category': 'Coffee', 'price': '1', 'stock_quantity': 'inf'}, "invalid stock_quantity 'inf'"),
+            ({'name': 'Latte', 'category': 'Coffee', 'price': '1', 'stock_quantity': '2.5'},
+             "stock_quantity '2.5' is not a whole number"),
+        ]
+        for record, message in cases:
+            self.assertEqual(product_import.validate(record), (None, message))
+
+    def test_read_rows_csv(self):
+        data = b"Name,Category,Price\nLatte,Coffee,25000\n,,\nTea,Tea,8000\n"
+        rows = list(product_import.read_rows(FileStorage(io.BytesIO(data), filename='menu.csv')))
+
+        self.assertEqual([line for line, _ in rows], [2, 4])
+        self.assertEqual(rows[1][1], {'name': 'Tea', 'category': 'Tea', 'price': '8000'})
+
+    def test_read_rows_missing_columns(self):
+        with self.assertRaises(product_import.InvalidImportFile):
+            list(product_import.read_rows(FileStorage(io.BytesIO(b"name\nLatte\n"), filename='menu.csv')))
+
+    def test_read_rows_bad_encoding_or_workbook(self):
+        cp1252 = "name,category,price\nCaf\xe9 Latte,Coffee,25000\n".encode('cp1252')
+        for data, filename in [(cp1252, 'menu.csv'), (b'not a zip', 'menu.xlsx')]:
+            with self.assertRaises(product_import.InvalidImportFile):
+                list(product_import.read_rows(FileStorage(io.BytesIO(data), filename=filename)))
+
+    def test_import_skips_invalid_and_duplicate_rows(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value
+        mock_cursor.fetchall.side_effect = [[], [], [{'id': 1}], [{'id': 7}]]
+
+        records = [
+            (2, {'name': 'Latte', 'category': 'Coffee', 'price': '25000'}),
+            (3, {'name': 'Mocha', 'category': 'Coffee', 'price': 'x'}),
+            (4, {'name': 'LATTE', 'category': 'Coffee', 'price': '1'}),
+            (5, {'name': 'Donut', 'category': 'Pastry', 'price': '12000'}),
+        ]
+        result = product_import.import_products(mock_conn, records)
+
+        self.assertEqual(result['updated'], [1])
+        self.assertEqual(result['inserted'], [7])
+        self.assertEqual(result['errors'], [(3, "invalid price 'x'"), (4, 'duplicate of line 2')])
+
+        # Valid rows went through one COPY, inside one committed transaction
+        copy_buffer = mock_cursor.copy_expert.call_args[0][1]
+        self.assertEqual(copy_buffer.getvalue().splitlines(),
+                         ['2,Latte,Coffee,25000,False,0,True,', '5,Donut,Pastry,12000,False,0,True,'])
+        mock_conn.commit.assert_called_once()
+
+    def test_import_keys_on_sku(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value
+        mock_cursor.fetchall.side_effect = [[], [], [{'id': 3}], [{'id': 8}]]
+
+        records = [
+            # Same name, different barcodes: two products. Excel sent the barcode as a float.
+            (2, {'name': 'Water', 'category': 'Beverage', 'price': '5000', 'sku': 8991234500017.0}),
+            (3, {'name': 'Water', 'category': 'Beverage', 'price': '9000', 'sku': '8991234500031'}),
+            (4, {'name': 'Water 1L', 'category': 'Beverage', 'price': '9000', 'sku': '8991234500031'}),
+        ]
+        result = product_import.import_products(mock_conn, records)
+
+        self.assertEqual(result['errors'], [(4, 'duplicate of line 3')])
+        copy_buffer = mock_cursor.copy_expert.call_args[0][1]
+        self.assertEqual(copy_buffer.getvalue().splitlines(),
+                         ['2,Water,Beverage,5000,False,0,True,8991234500017',
+                          '3,Water,Beverage,9000,False,0,True,8991234500031'])
+        # Rows are matched by SKU before falling back to the name
+        statements = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        self.assertIn('p.sku = s.sku', statements[1])
+        self.assertIn('lower(p.name) = lower(s.name)', statements[3])
+
+    def test_import_reports_ambiguous_and_colliding_matches(self):
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value
+        mock_cursor.fetchall.side_effect = [
+            [{'line': 3, 'name': 'Tea', 'matches': 2}],  # two products are called "tea"
+            [{'line': 4, 'first_line': 2}],              # by name, onto the product line 2 matched by SKU
+            [{'id': 5}], [],
+        ]
+
+        records = [
+            (2, {'name': 'Water', 'category': 'Beverage', 'price': '5000', 'sku': '8991234500017'}),
+            (3, {'name': 'Tea', 'category': 'Tea', 'price': '8000'}),
+            (4, {'name': 'Water', 'category': 'Beverage', 'price': '6000'}),
+        ]
+        result = product_import.import_products(mock_conn, records)
+
+        self.assertEqual(result['updated'], [5])
+        self.assertEqual(result['errors'], [
+            (3, "2 products are named 'Tea', add a SKU to tell them apart"),
+            (4, 'updates the same product as line 2'),
+        ])
+        mock_conn.commit.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,12 @@
+import datetime
 import unittest
-from unittest.mock import MagicMock, call
+from unittest.mock import MagicMock, call, patch
 from decimal import Decimal
+import psycopg2
 import services
 
+CREATED_AT = datetime.datetime(2025, 3, 14, 9, 30)
+
 class TestPOS(unittest.TestCase):
     def setUp(self):
         self.mock_conn = MagicMock()
@@ -12,10 +16,10 @@ class TestPOS(unittest.TestCase):
     def test_process_order_success(self):
         # Mock product fetch
         # Product: id=1, name='Water', price=2.00, managed=True, stock=10, active=True
-        self.mock_cursor.fetchone.side_effect = [
-            {'name': 'Water', 'price': 2.00, 'is_inventory_managed': True, 'stock_quantity': 10, 'is_active': True},
-            {'id': 101} # Return order ID
+        self.mock_cursor.fetchall.return_value = [
+            {'id': 1, 'name': 'Water', 'price': 2.00, 'is_inventory_managed': True, 'stock_quantity': 10, 'is_active': True},
         ]
+        self.mock_cursor.fetchone.return_value = {'id': 101, 'created_at': CREATED_AT} # Return order ID
 
         cart = [{'product_id': 1, 'quantity': 2}]
         # Subtotal: 4.00, Tax: 0.40, Total: 4.40
@@ -28,15 +32,16 @@ class TestPOS(unittest.TestCase):
         self.mock_conn.commit.assert_called_once()
 
         # Verify calls
-        # 1. Select Product
+        # 1. Select + lock all products
         # 2. Update Stock
         # 3. Insert Order
         # 4. Insert Order Items
+        # 5-6. Update sales rollups
+        self.assertEqual(self.mock_cursor.execute.call_count, 6)
 
         # Verify Stock Deduction
-        self.mock_cursor.execute.assert_any_call(
-            "UPDATE products SET stock_quantity = %s WHERE id = %s", (8, 1)
-        )
+        update_call = [c for c in self.mock_cursor.execute.call_args_list if "UPDATE products" in c[0][0]]
+        self.assertEqual(update_call[0][0][1], [1, 2])
 
         # Verify Order Insert (Check Total and Tax)
         # We need to find the call to INSERT INTO orders
@@ -51,11 +56,60 @@ class TestPOS(unittest.TestCase):
         self.assertEqual(total_amount, Decimal('4.40')) # 4.00 + 10%
         self.assertEqual(tax_amount, Decimal('0.40'))
 
+    def test_process_order_batches_statements(self):
+        # Three lines (two of them the same product) still cost the same six statements
+        self.mock_cursor.fetchall.return_value = [
+            {'id': 1, 'name': 'Water', 'price': 2.00, 'is_inventory_managed': True, 'stock_quantity': 10, 'is_active': True},
+            {'id': 2, 'name': 'Latte', 'price': 5.00, 'is_inventory_managed': False, 'stock_quantity': 0, 'is_active': True},
+        ]
+        self.mock_cursor.fetchone.return_value = {'id': 101, 'created_at': CREATED_AT}
+
+        cart = [
+            {'product_id': 1, 'quantity': 2},
+            {'product_id': 2, 'quantity': 1},
+            {'product_id': 1, 'quantity': 3},
+        ]
+        services.process_order(self.mock_conn, 1, 'TRX-002', 'cash', Decimal('50.00'), cart)
+
+        self.assertEqual(self.mock_cursor.execute.call_count, 6)
+        calls = self.mock_cursor.execute.call_args_list
+
+        # Repeated lines are summed into one deduction; unmanaged items are skipped
+        self.assertEqual(calls[1][0][1], [1, 5])
+
+        # All three lines go in with one INSERT, snapshots in cart order, into the order's month
+        items_params = calls[3][0][1]
+        self.assertEqual(len(items_params), 3 * 8)
+        self.assertEqual(items_params[1:8], [1, 'Water', Decimal('2.0'), 2, Decimal('4.0'), Decimal('0.00'), CREATED_AT])
+        self.assertEqual(items_params[9:16], [2, 'Latte', Decimal('5.0'), 1, Decimal('5.0'), Decimal('0.00'), CREATED_AT])
+
+    def test_process_order_repeated_lines_share_stock(self):
+        self.mock_cursor.fetchall.return_value = [
+            {'id': 1, 'name': 'Water', 'price': 2.00, 'is_inventory_managed': True, 'stock_quantity': 5, 'is_active': True},
+        ]
+        cart = [{'product_id': 1, 'quantity': 3}, {'product_id': 1, 'quantity': 3}]
+
+        with self.assertRaises(Exception) as cm:
+            services.process_order(self.mock_conn, 1, 'TRX-003', 'cash', Decimal('50.00'), cart)
+
+        self.assertEqual(str(cm.exception), 'Insufficient stock for Water. Available: 2')
+
+    def test_malformed_cart_lines_get_till_messages(self):
+        for cart, message in [
+            ([{'product_id': 'abc', 'quantity': 1}], "Invalid product ID 'abc'"),
+            (['1'], 'Invalid cart line'),
+            ([{'product_id': 1}], 'Invalid cart line'),
+        ]:
+            with self.assertRaises(Exception) as cm:
+                services.process_order(self.mock_conn, 1, 'TRX-BAD', 'cash', Decimal('50.00'), cart)
+            self.assertEqual(str(cm.exception), message)
+        self.assertEqual(services.cart_product_ids([{'product_id': '2', 'quantity': 1}]), [2])
+
     def test_process_order_insufficient_stock(self):
         # Product: Stock=10, Request=11
-        self.mock_cursor.fetchone.return_value = {
-            'name': 'Water', 'price': 2.00, 'is_inventory_managed': True, 'stock_quantity': 10, 'is_active': True
-        }
+        self.mock_cursor.fetchall.return_value = [
+            {'id': 1, 'name': 'Water', 'price': 2.00, 'is_inventory_managed': True, 'stock_quantity': 10, 'is_active': True}
+        ]
 
         cart = [{'product_id': 1, 'quantity': 11}]
 
@@ -67,32 +121,238 @@ class TestPOS(unittest.TestCase):
         self.assertIn('Insufficient stock', str(cm.exception))
         self.mock_conn.rollback.assert_called_once()
 
-    def test_void_order_restock(self):
-        # 1. Get Order (status='paid')
-        # 2. Get Items (qty=5, managed=True)
-        # 3. Update Product Stock (+5)
-        # 4. Update Order Status
-
-        self.mock_cursor.fetchone.side_effect = [
-            {'status': 'paid'}, # Order fetch
-            # No fetchone for items, it uses fetchall
+    def test_process_order_guarded_deduction(self):
+        # Validation passed on the locked read, but the conditional UPDATE matched no row
+        self.mock_cursor.fetchall.side_effect = [
+            [{'id': 1, 'name': 'Water', 'price': 2.00, 'is_inventory_managed': True, 'stock_quantity': 3, 'is_active': True}],
+            [], # UPDATE ... WHERE stock_quantity >= qty RETURNING -> nothing
+        ]
+
+        with self.assertRaises(Exception) as cm:
+            services.process_order(
+                self.mock_conn, 1, 'TRX-RACE', 'cash', Decimal('100.00'), [{'product_id': 1, 'quantity': 3}]
+            )
+
+        self.assertIn('Insufficient stock', str(cm.exception))
+        self.mock_conn.rollback.assert_called_once()
+        self.mock_conn.commit.assert_not_called()
+
+        # Locks are always taken in product id order
+        select_sql = self.mock_cursor.execute.call_args_list[0][0][0]
+        self.assertIn('ORDER BY id FOR UPDATE', select_sql)
+
+    def test_process_order_duplicate_key(self):
+        # The unique idempotency key made the INSERT a no-op: a concurrent retry already won
+        self.mock_cursor.fetchall.side_effect = [
+            [{'id': 1, 'name': 'Water', 'price': 2.00, 'is_inventory_managed': True, 'stock_quantity': 10, 'is_active': True}],
+            [{'id': 1, 'stock_quantity': 8}],
         ]
+        self.mock_cursor.fetchone.return_value = None
+
+        with self.assertRaises(services.DuplicateOrder):
+            services.process_order(
+                self.mock_conn, 1, 'TRX-DUP', 'cash', Decimal('10.00'), [{'product_id': 1, 'quantity': 2}],
+                idempotency_key='till-1-0001'
+            )
+
+        insert_order_call = [c for c in self.mock_cursor.execute.call_args_list if "INSERT INTO orders" in c[0][0]]
+        self.assertIn('ON CONFLICT (idempotency_key) DO NOTHING', insert_order_call[0][0][0])
+        self.assertEqual(insert_order_call[0][0][1][-1], 'till-1-0001')
+        # The stock deduction is undone with everything else
+        self.mock_conn.rollback.assert_called_once()
+        self.mock_conn.commit.assert_not_called()
 
+    @patch('services.partitions')
+    def test_process_order_creates_missing_partition(self, mock_partitions):
+        # The first checkout of a month nobody created partitions for is retried once
+        error = psycopg2.errors.CheckViolation('no partition of relation "orders" found for row')
         self.mock_cursor.fetchall.return_value = [
-            {'product_id': 1, 'quantity': 5, 'is_inventory_managed': True}
+            {'id': 1, 'name': 'Latte', 'price': 5.00, 'is_inventory_managed': False, 'stock_quantity': 0, 'is_active': True},
         ]
+        self.mock_cursor.fetchone.return_value = {'id': 101, 'created_at': CREATED_AT}
+        self.mock_cursor.execute.side_effect = [None, error] + [None] * 5
+        mock_partitions.missing_partition.side_effect = lambda e: e is error
+
+        order_id = services.process_order(self.mock_conn, 1, 'TRX-NEW', 'cash', Decimal('10.00'),
+                                          [{'product_id': 1, 'quantity': 1}])
+
+        self.assertEqual(order_id, 101)
+        mock_partitions.ensure.assert_called_once_with(self.mock_conn)
+        self.mock_conn.rollback.assert_called_once()
+        self.mock_conn.commit.assert_called_once()
+
+    def test_process_orders_isolates_failures(self):
+        water = {'id': 1, 'name': 'Water', 'price': 2.00, 'is_inventory_managed': False, 'stock_quantity': 0, 'is_active': True}
+        self.mock_cursor.fetchall.side_effect = [[water], []] # 2nd order: product not found
+        self.mock_cursor.fetchone.return_value = {'id': 101, 'created_at': CREATED_AT}
+
+        orders = [
+            {'cart': [{'product_id': 1, 'quantity': 1}], 'payment_method': 'cash', 'amount_received': 10, 'transaction_code': 'TRX-A'},
+            {'cart': [{'product_id': 9, 'quantity': 1}], 'payment_method': 'cash', 'amount_received': 10, 'transaction_code': 'TRX-B'},
+        ]
+        results = services.process_orders(self.mock_conn, 1, orders)
+
+        self.assertEqual(results, [
+            {'success': True, 'order_id': 101, 'transaction_code': 'TRX-A'},
+            {'success': False, 'error': 'Product ID 9 not found.'},
+        ])
+        statements = [c[0][0] for c in self.mock_cursor.execute.call_args_list]
+        self.assertIn('RELEASE SAVEPOINT batch_order', statements)
+        self.assertIn('ROLLBACK TO SAVEPOINT batch_order', statements)
+        # Rollups once per chunk, for the orders that made it
+        rollup_calls = [c for c in self.mock_cursor.execute.call_args_list if "INSERT INTO daily_sales" in c[0][0]]
+        self.assertEqual(rollup_calls[0][0][1],
+                         {'order_ids': [101], 'sign': 1, 'first_at': CREATED_AT, 'last_at': CREATED_AT})
+        self.mock_conn.commit.assert_called_once()
+        self.mock_conn.rollback.assert_not_called()
+
+    @patch('services.find_order', return_value=None)
+    @patch('services._insert_batch_order', side_effect=services.DuplicateOrder('till-1-0001'))
+    @patch('services.find_orders', return_value={})
+    def test_process_orders_key_without_order(self, *mocks):
+        # The key is taken but its order is gone: reported, not a TypeError
+        orders = [{'cart': [{'product_id': 1, 'quantity': 1}], 'payment_method': 'cash', 'amount_received': 10,
+                   'transaction_code': 'TRX-A', 'idempotency_key': 'till-1-0001'}]
+        results = services.process_orders(self.mock_conn, 1, orders)
+
+        self.assertEqual(results, [{'success': False, 'error': services.REPLAYED_ORDER_MISSING}])
+
+    def test_process_orders_atomic(self):
+        self.mock_cursor.fetchall.return_value = []
+        orders = [
+            {'cart': [{'product_id': 9, 'quantity': 1}], 'payment_method': 'cash', 'amount_received': 10, 'transaction_code': 'TRX-A'},
+            {'cart': [{'product_id': 9, 'quantity': 1}], 'payment_method': 'cash', 'amount_received': 10, 'transaction_code': 'TRX-B'},
+        ]
+        results = services.process_orders(self.mock_conn, 1, orders, atomic=True)
+
+        self.assertEqual(results, [
+            {'success': False, 'error': 'Product ID 9 not found.'},
+            {'success': False, 'error': 'Not processed: Product ID 9 not found.', 'retry': True},
+        ])
+        self.mock_conn.rollback.assert_called_once()
+        self.mock_conn.commit.assert_not_called()
+
+    @patch('services.find_orders')
+    def test_process_orders_atomic_failure_still_answers_replays(self, mock_find_orders):
+        mock_find_orders.return_value = {'till-1-0001': {'id': 101, 'user_id': 1, 'transaction_code': 'TRX-OLD',
+                                                         'status': 'paid', 'idempotency_key': 'till-1-0001'}}
+        self.mock_cursor.fetchall.return_value = [
+            {'id': 1, 'name': 'Water', 'price': 2.00, 'is_inventory_managed': True, 'stock_quantity': 1, 'is_active': True},
+        ]
+        orders = [
+            {'cart': [{'product_id': 1, 'quantity': 5}], 'payment_method': 'cash', 'amount_received': 20, 'transaction_code': 'TRX-A'},
+            {'cart': [{'product_id': 1, 'quantity': 1}], 'payment_method': 'cash', 'amount_received': 20,
+             'transaction_code': 'TRX-B', 'idempotency_key': 'till-1-0001'},
+        ]
+        results = services.process_orders(self.mock_conn, 1, orders, atomic=True)
+
+        self.assertEqual(results, [
+            {'success': False, 'error': 'Insufficient stock for Water. Available: 1'},
+            {'success': True, 'order_id': 101, 'transaction_code': 'TRX-OLD', 'replayed': True},
+        ])
+
+    def test_find_orders_by_key_then_month(self):
+        cursor = self.mock_conn.cursor.return_value.__enter__.return_value
+        cursor.fetchall.side_effect = [
+            [{'idempotency_key': 'till-1-0001', 'order_id': 101, 'order_created_at': CREATED_AT}],
+            [{'id': 101, 'user_id': 1, 'transaction_code': 'TRX-001', 'status': 'paid'}],
+        ]
+
+        found = services.find_orders(self.mock_conn, ['till-1-0001', 'till-1-0002'])
+
+        self.assertEqual(found, {'till-1-0001': {'id': 101, 'user_id': 1, 'transaction_code': 'TRX-001',
+                                                 'status': 'paid', 'idempotency_key': 'till-1-0001'}})
+        cursor.execute.assert_called_with(services.FIND_ORDERS_SQL,
+                                          {'order_ids': [101], 'first_at': CREATED_AT, 'last_at': CREATED_AT})
+
+        # Unknown keys (the usual case) cost one lookup on the key table only
+        cursor.reset_mock()
+        cursor.fetchall.side_effect = [[]]
+        self.assertEqual(services.find_orders(self.mock_conn, ['till-1-0003']), {})
+        cursor.execute.assert_called_once_with(services.FIND_KEYS_SQL, (['till-1-0003'],))
+
+    def test_next_transaction_codes(self):
+        cursor = self.mock_conn.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [{'code': 'TRX-20250101-000041'}, {'code': 'TRX-20250101-000042'}]
+
+        codes = services.next_transaction_codes(self.mock_conn, 2)
+
+        self.assertEqual(codes, ['TRX-20250101-000041', 'TRX-20250101-000042'])
+        # One round trip for the whole batch
+        cursor.execute.assert_called_once_with(
+            "SELECT next_transaction_code() AS code FROM generate_series(1, %s)", (2,)
+        )
+
+    def test_void_order_restock(self):
+        # 1. Lock order (status='paid')
+        # 2-3. Lock + restock the managed products in one aggregated UPDATE
+        # 4-5. Reverse the rollups
+        # 6. Update order status
+        self.mock_cursor.fetchone.return_value = {'status': 'paid', 'created_at': CREATED_AT}
+        self.mock_cursor.fetchall.return_value = [{'id': 1, 'stock_quantity': 15, 'quantity': 5}]
 
         services.void_order(self.mock_conn, 101, 1)
 
-        # Verify Restock
+        # Verify Restock: one statement, however many lines the order has, bounded to the order's month
         self.mock_cursor.execute.assert_any_call(
-            "UPDATE products SET stock_quantity = stock_quantity + %s WHERE id = %s",
-            (5, 1)
-        )
+            services.RESTOCK_ORDERS_SQL, {'order_ids': [101], 'first_at': CREATED_AT, 'last_at': CREATED_AT})
+        self.assertEqual(self.mock_cursor.execute.call_count, 6)
 
         # Verify Status Update
         self.assertTrue(any("UPDATE orders SET status = 'cancelled'" in str(c) for c in self.mock_cursor.execute.call_args_list))
+
+        # Verify the order is reversed out of the rollups
+        rollup_calls = [c for c in self.mock_cursor.execute.call_args_list if "INSERT INTO daily_sales" in c[0][0]]
+        self.assertEqual(rollup_calls[0][0][1],
+                         {'order_ids': [101], 'sign': -1, 'first_at': CREATED_AT, 'last_at': CREATED_AT})
+        self.mock_conn.commit.assert_called_once()
+
+    def test_void_orders_bulk(self):
+        # Ids 7 and 9 requested twice/out of order, 8 already cancelled, 10 unknown
+        self.mock_cursor.fetchall.side_effect = [
+            [{'id': 7, 'transaction_code': 'TRX-7', 'status': 'paid', 'total_amount': Decimal('11.00'),
+              'tax_amount': Decimal('1.00'), 'created_at': datetime.datetime(2025, 1, 31, 20, 0)},
+             {'id': 8, 'transaction_code': 'TRX-8', 'status': 'cancelled', 'total_amount': Decimal('5.50'),
+              'tax_amount': Decimal('0.50'), 'created_at': datetime.datetime(2025, 2, 1, 8, 0)},
+             {'id': 9, 'transaction_code': 'TRX-9', 'status': 'paid', 'total_amount': Decimal('22.00'),
+              'tax_amount': Decimal('2.00'), 'created_at': datetime.datetime(2025, 2, 1, 9, 0)}],
+            [{'id': 1, 'stock_quantity': 20, 'quantity': 6}],
+        ]
+        self.mock_cursor.fetchone.return_value = {'id': 3}
+
+        summary = services.void_orders(self.mock_conn, 1, order_ids=[9, 7, 8, 10, 7], reason='till 3')
+
+        self.assertEqual(summary['order_ids'], [7, 9])
+        self.assertEqual(summary['total_amount'], Decimal('33.00'))
+        self.assertEqual(summary['restocked'], [[1, 6]])
+        self.assertEqual(summary['already_cancelled'], [8])
+        self.assertEqual(summary['not_found'], [10])
+        self.assertEqual(summary['batch_id'], 3)
+
+        # Same statements as voiding one order, plus the audit row
+        statements = [c[0][0] for c in self.mock_cursor.execute.call_args_list]
+        self.assertEqual(len(statements), 7)
+        self.assertEqual(self.mock_cursor.execute.call_args_list[0][0][1], {'order_ids': [7, 8, 9, 10]})
+        # Both months of the voided orders, nothing else
+        self.mock_cursor.execute.assert_any_call(services.RESTOCK_ORDERS_SQL, {
+            'order_ids': [7, 9], 'first_at': datetime.datetime(2025, 1, 31, 20, 0),
+            'last_at': datetime.datetime(2025, 2, 1, 9, 0)})
         self.mock_conn.commit.assert_called_once()
 
+    def test_void_orders_refuses_without_criteria_or_over_limit(self):
+        with self.assertRaises(Exception):
+            services.void_orders(self.mock_conn, 1)
+        self.mock_cursor.execute.assert_not_called()
+
+        self.mock_cursor.fetchall.return_value = [
+            {'id': i, 'transaction_code': f'TRX-{i}', 'status': 'paid', 'total_amount': Decimal('1'), 'tax_amount': Decimal('0'),
+             'created_at': CREATED_AT}
+            for i in range(3)
+        ]
+        with self.assertRaisesRegex(Exception, 'more than the limit'):
+            services.void_orders(self.mock_conn, 1, cashier=2, max_orders=2)
+        self.mock_conn.rollback.assert_called_once()
+        self.mock_conn.commit.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,138 @@
+import datetime
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from decimal import Decimal
+import pricing
+import services
+import services_async
+
+NO_PROMOTIONS = pricing.RuleIndex(1, [])
+
+CREATED_AT = datetime.datetime(2025, 3, 14, 9, 30)
+
+class TestAsyncPOS(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # psycopg 3: `async with conn.cursor() as cur`, awaited execute/fetch
+        self.mock_conn = MagicMock()
+        self.mock_conn.commit = AsyncMock()
+        self.mock_conn.rollback = AsyncMock()
+        self.mock_cursor = MagicMock()
+        self.mock_cursor.execute = AsyncMock()
+        self.mock_cursor.fetchone = AsyncMock()
+        self.mock_cursor.fetchall = AsyncMock()
+        self.mock_conn.cursor.return_value.__aenter__.return_value = self.mock_cursor
+
+    @patch('services.events')
+    @patch('services.catalog')
+    async def test_process_order_same_statements_as_sync(self, mock_catalog, mock_events):
+        self.mock_cursor.fetchall.side_effect = [
+            [{'id': 1, 'name': 'Water', 'price': 2.00, 'is_inventory_managed': True, 'stock_quantity': 10, 'is_active': True}],
+            [{'id': 1, 'stock_quantity': 8}],
+        ]
+        self.mock_cursor.fetchone.return_value = {'id': 101, 'created_at': CREATED_AT}
+
+        order_id = await services_async.process_order(
+            self.mock_conn, 1, 'TRX-001', 'cash', Decimal('10.00'), [{'product_id': 1, 'quantity': 2}],
+            promotions=NO_PROMOTIONS
+        )
+
+        self.assertEqual(order_id, 101)
+        self.mock_conn.commit.assert_awaited_once()
+        statements = [c[0][0] for c in self.mock_cursor.execute.call_args_list]
+        self.assertEqual(len(statements), 6)
+        self.assertEqual(statements[0], services.LOCK_PRODUCTS_SQL)
+        self.assertEqual(statements[2], services.INSERT_ORDER_SQL)
+
+        insert_args = self.mock_cursor.execute.call_args_list[2][0][1]
+        self.assertEqual(insert_args[2], Decimal('4.40'))
+        self.assertEqual(insert_args[3], Decimal('0.40'))
+
+        # Stock changes are published only after the commit
+        mock_catalog.invalidate.assert_called_once_with([1])
+        mock_events.publish_stock.assert_called_once_with([{'id': 1, 'stock_quantity': 8}])
+
+    async def test_process_order_duplicate_key(self):
+        self.mock_cursor.fetchall.side_effect = [
+            [{'id': 1, 'name': 'Water', 'price': 2.00, 'is_inventory_managed': True, 'stock_quantity': 10, 'is_active': True}],
+            [{'id': 1, 'stock_quantity': 8}],
+        ]
+        self.mock_cursor.fetchone.return_value = None
+
+        with self.assertRaises(services.DuplicateOrder):
+            await services_async.process_order(
+                self.mock_conn, 1, 'TRX-DUP', 'cash', Decimal('10.00'), [{'product_id': 1, 'quantity': 2}],
+                idempotency_key='till-1-0001', promotions=NO_PROMOTIONS
+            )
+
+        self.mock_conn.rollback.assert_awaited_once()
+        self.mock_conn.commit.assert_not_awaited()
+
+    @patch('services.events')
+    @patch('services.catalog')
+    async def test_void_order_restock(self, mock_catalog, mock_events):
+        self.mock_cursor.fetchone.return_value = {'status': 'paid', 'created_at': CREATED_AT}
+        self.mock_cursor.fetchall.return_value = [{'id': 1, 'stock_quantity': 15, 'quantity': 5}]
+
+        await services_async.void_order(self.mock_conn, 101, 1)
+
+        self.mock_cursor.execute.assert_any_await(
+            services.RESTOCK_ORDERS_SQL, {'order_ids': [101], 'first_at': CREATED_AT, 'last_at': CREATED_AT})
+        rollup_calls = [c for c in self.mock_cursor.execute.call_args_list if "INSERT INTO daily_sales" in c[0][0]]
+        self.assertEqual(rollup_calls[0][0][1],
+                         {'order_ids': [101], 'sign': -1, 'first_at': CREATED_AT, 'last_at': CREATED_AT})
+        self.mock_conn.commit.assert_awaited_once()
+        mock_events.publish_stock.assert_called_once_with([{'id': 1, 'stock_quantity': 15, 'quantity': 5}])
+
+class TestSyncAsyncParity(unittest.IsolatedAsyncioTestCase):
+    """Both services run the same flows: same statements, same params, same rows written."""
+
+    def connections(self, rows):
+        # rows: what the fetches return, in order, for both the sync and the async cursor
+        sync_conn, sync_cursor = MagicMock(), MagicMock()
+        sync_conn.cursor.return_value = sync_cursor
+        sync_cursor.fetchall.side_effect = [r for r in rows if isinstance(r, list)]
+        sync_cursor.fetchone.side_effect = [r for r in rows if not isinstance(r, list)]
+
+        async_conn, async_cursor = MagicMock(), MagicMock()
+        async_conn.commit, async_conn.rollback = AsyncMock(), AsyncMock()
+        async_conn.cursor.return_value.__aenter__.return_value = async_cursor
+        async_cursor.execute = AsyncMock()
+        async_cursor.fetchall = AsyncMock(side_effect=[r for r in rows if isinstance(r, list)])
+        async_cursor.fetchone = AsyncMock(side_effect=[r for r in rows if not isinstance(r, list)])
+        return sync_conn, sync_cursor, async_conn, async_cursor
+
+    @patch('services.events')
+    @patch('services.catalog')
+    async def test_checkout_and_void(self, mock_catalog, mock_events):
+        water = {'id': 1, 'category_id': 4, 'name': 'Water', 'price': Decimal('5000'), 'is_inventory_managed': True,
+                 'stock_quantity': 10, 'is_active': True}
+        latte = {'id': 2, 'category_id': 1, 'name': 'Latte', 'price': Decimal('25000'), 'is_inventory_managed': False,
+                 'stock_quantity': 0, 'is_active': True}
+        promotions = pricing.RuleIndex(1, [pricing.compile_rule(
+            {'id': 1, 'name': 'Coffee 10%', 'kind': 'percent_off', 'params': {'percent': 10}, 'category_id': 1})])
+        cart = [{'product_id': 2, 'quantity': 1}, {'product_id': 1, 'quantity': 3}]
+        checkout_rows = [[water, latte], [{'id': 1, 'stock_quantity': 7}], {'id': 101, 'created_at': CREATED_AT}]
+        args = (1, 'TRX-001', 'cash', Decimal('50000'), cart, 'till-1-0001', promotions)
+
+        sync_conn, sync_cursor, async_conn, async_cursor = self.connections(checkout_rows)
+        self.assertEqual(services.process_order(sync_conn, *args), 101)
+        self.assertEqual(await services_async.process_order(async_conn, *args), 101)
+        self.assertEqual(async_cursor.execute.call_args_list, sync_cursor.execute.call_args_list)
+        # order, items (with the discount) and rollups are all in there
+        statements = [c[0][0] for c in sync_cursor.execute.call_args_list]
+        self.assertEqual(statements[2], services.INSERT_ORDER_SQL)
+        self.assertIn('INSERT INTO order_items', statements[3])
+        self.assertEqual(len(statements), 6)
+
+        void_rows = [{'status': 'paid', 'created_at': CREATED_AT}, [{'id': 1, 'stock_quantity': 10, 'quantity': 3}]]
+        sync_conn, sync_cursor, async_conn, async_cursor = self.connections(void_rows)
+        now = MagicMock()
+        now.datetime.now.return_value = CREATED_AT
+        with patch('services.datetime', now), patch('services_async.datetime', now):
+            services.void_order(sync_conn, 101, 1)
+            await services_async.void_order(async_conn, 101, 1)
+        self.assertEqual(async_cursor.execute.call_args_list, sync_cursor.execute.call_args_list)
+        self.assertEqual(len(sync_cursor.execute.call_args_list), 6)
+
+if __name__ == '__main__':
+    unittest.main()
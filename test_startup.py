@@ -0,0 +1,59 @@
+import http.server
+import socket
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+import metrics
+import startup
+
+class TestStartup(unittest.TestCase):
+    def test_timer_reports_once_when_expected_phases_are_in(self):
+        reported = []
+        timer = startup.StartupTimer(expected=('window_loaded', 'warmup'), on_complete=reported.append)
+
+        with timer.phase('create_app'):
+            pass
+        timer.mark('window_loaded')
+        self.assertEqual(reported, [])
+        with timer.phase('warmup'):
+            pass
+        timer.mark('window_loaded') # a later page load doesn't move the milestone
+        timer.record('late', 0.5)
+
+        self.assertEqual(reported, [timer])
+        self.assertEqual(list(timer.phases)[:3], ['create_app', 'window_loaded', 'warmup'])
+        self.assertIn('create_app 0.000s', timer.summary())
+
+    def test_wait_until_serving(self):
+        class NotFound(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_error(404)
+            def log_message(self, *args):
+                pass
+
+        server = http.server.HTTPServer(('127.0.0.1', 0), NotFound)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        # Any answer means the server is serving
+        self.assertEqual(startup.wait_until_serving(f'http://127.0.0.1:{server.server_port}/', timeout=5), 404)
+
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            closed_port = s.getsockname()[1]
+        with self.assertRaises(TimeoutError):
+            startup.wait_until_serving(f'http://127.0.0.1:{closed_port}/', timeout=0.2, interval=0.05)
+
+    @patch('db.get_pool')
+    def test_warm_up_failure_is_only_logged(self, mock_get_pool):
+        mock_get_pool.side_effect = Exception('connection refused')
+        app = MagicMock()
+        timer = startup.StartupTimer()
+
+        with self.assertLogs(metrics.log, 'WARNING'):
+            startup.warm_up(app, timer)
+
+        self.assertIn('warmup_db_pool', timer.phases)
+        self.assertIn('warmup', timer.phases)
+
+if __name__ == '__main__':
+    unittest.main()